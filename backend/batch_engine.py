@@ -0,0 +1,249 @@
+# Vectorized (NumPy) version of calculator.perform_calculation for one profile and many salaries
+from decimal import Decimal
+from functools import lru_cache
+import numpy as np
+import parameters
+from utils import FamilySituation, IRPFScale
+
+# Float noise is snapped to this many decimals of a cent before rounding, so that exact
+# Decimal ties (x.xx5) and exact cents land on the same side as in the Decimal path.
+_SNAP = 6
+
+# Unitless columns, left out of the cent comparison in verify_batch
+_RATE_COLUMNS = ("marginal_irpf_rate",)
+
+
+def _cents(x):
+    return np.round(x * 100.0, _SNAP)
+
+
+def _redondear1(x):
+    # Same as utils.redondear1 (+0.00001, then ROUND_HALF_UP to cents)
+    y = _cents(x + 0.00001)
+    return np.sign(y) * np.floor(np.abs(y) + 0.5) / 100.0
+
+
+def _truncar(x):
+    # Same as utils.truncar (int() truncates towards zero)
+    return np.trunc(_cents(x)) / 100.0
+
+
+def _quantize(x):
+    # Same as Decimal.quantize(Decimal("0.01")) under the default ROUND_HALF_EVEN context
+    return np.rint(_cents(x)) / 100.0
+
+
+@lru_cache(maxsize=None)
+def _scale_tables(escala: IRPFScale):
+    """Return the compiled (bounds, rates, cumulative tax) of a scale as float arrays."""
+    return (
+        np.array(escala.bounds, dtype=float),
+        np.array(escala.rates, dtype=float),
+        np.array(escala.cumulative, dtype=float),
+    )
+
+
+def _tax_on_base(x, lows, rates, cum):
+    idx = np.clip(np.searchsorted(lows, x, side="right") - 1, 0, len(lows) - 1)
+    return np.where(x <= lows[0], 0.0, cum[idx] + (x - lows[idx]) * rates[idx])
+
+
+def _rate_at(x, lows, rates):
+    idx = np.clip(np.searchsorted(lows, x, side="right") - 1, 0, len(lows) - 1)
+    return np.where((x <= 0) | (x < lows[0]), 0.0, rates[idx])
+
+
+def perform_calculation_batch(gross, n_pagues, pagues_prorratejades, retribucio_en_especie_ann, grup_cotitzacio, contract_type, other_deductions, fam, region, params=None):
+    """
+    Array version of `perform_calculation`.
+
+    `gross`, `retribucio_en_especie_ann` and `other_deductions` may be scalars or 1-D arrays
+    (broadcast together); the rest of the profile is shared by every row. Returns a dict of
+    float64 column arrays with the same keys as the scalar result (legacy aliases excluded).
+    Values match the Decimal path to the cent. `params` is a parameters.TaxParameters.
+    """
+    if params is None:
+        params = parameters.DEFAULT
+    ss_rates, gastos_deducidos, reduction_work = params.ss_rates, params.gastos_deducidos, params.reduction_work
+    gross = np.asarray(gross, dtype=float)
+    retribucio_en_especie_ann = np.asarray(retribucio_en_especie_ann, dtype=float)
+    other_deductions = np.asarray(other_deductions, dtype=float)
+    gross, retribucio_en_especie_ann, other_deductions = np.broadcast_arrays(
+        gross, retribucio_en_especie_ann, other_deductions
+    )
+
+    # ── Stage 1: SS base mensual ──────────────────────────────────────────────
+    gross_including_benefits = gross + retribucio_en_especie_ann
+    base_ss_max = float(params.ss_base_max_monthly)
+    base_ss_mensual = np.clip(
+        gross_including_benefits / 12, float(params.ss_base_min_by_group[grup_cotitzacio]), base_ss_max
+    )
+
+    # ── Stage 2: Cotitzacions SS mensuals ────────────────────────────────────
+    ss_atur_rate = (
+        ss_rates["unemployment_worker_indefinite"]
+        if contract_type == "indefinite"
+        else ss_rates["unemployment_worker_temporary"]
+    )
+    ss_contingencies_comunes_mensual = base_ss_mensual * float(ss_rates["contingencies_common_worker"])
+    ss_atur_mensual                  = base_ss_mensual * float(ss_atur_rate)
+    ss_formacio_mensual              = base_ss_mensual * float(ss_rates["training_worker"])
+    ss_mei_mensual                   = base_ss_mensual * float(ss_rates["mei_worker"])
+    total_ss_mensual = (
+        ss_contingencies_comunes_mensual + ss_atur_mensual + ss_formacio_mensual + ss_mei_mensual
+    )
+    total_ss_anual = total_ss_mensual * 12
+
+    # ── Stage 3: Rendiment net del treball ───────────────────────────────────
+    # calcular_gastos_deducibles reduces to min(gastos, retrib - cotizaciones)
+    if fam.disability_percent_self >= 65:
+        gastos = gastos_deducidos["otros_gastos_generales"] + gastos_deducidos["discapacidad_trabajador_activo_grave"]
+    elif fam.disability_percent_self >= 33:
+        gastos = gastos_deducidos["otros_gastos_generales"] + gastos_deducidos["discapacidad_trabajador_activo"]
+    else:
+        gastos = gastos_deducidos["otros_gastos_generales"]
+    rendiment_brut_treball = gross_including_benefits
+    gastos_deducibles = np.minimum(float(gastos), rendiment_brut_treball - total_ss_anual)
+    rendiment_net_treball = rendiment_brut_treball - total_ss_anual - gastos_deducibles - other_deductions
+
+    # ── Stage 4: Reducció per rendiments del treball (art. 20 LIRPF) ─────────
+    rn = rendiment_net_treball
+    upper1 = float(reduction_work["upper1"])
+    upper2 = float(reduction_work["upper2"])
+    upper3 = float(reduction_work["upper3"])
+    amount1 = float(reduction_work["amount1"])
+    coef2 = float(reduction_work["coef2"])
+    coef3 = float(reduction_work["coef3"])
+    reduccio_rendiments_treball = np.select(
+        [rn <= upper1, rn <= upper2, rn <= upper3],
+        [
+            np.full_like(rn, amount1),
+            _quantize(amount1 - coef2 * (rn - upper1)),
+            _quantize(float(reduction_work["base3"]) - coef3 * (rn - upper2)),
+        ],
+        default=0.0,
+    )
+
+    # ── Stage 5: Base imposable ───────────────────────────────────────────────
+    base_imponible = np.maximum(rendiment_net_treball - reduccio_rendiments_treball, 0.0)
+
+    # ── Stage 6: Escala IRPF + quota ─────────────────────────────────────────
+    escala_irpf = params.scale(region)
+    lows, rates, cum = _scale_tables(escala_irpf)
+    minim_personal_familiar = float(fam.minimo_personal_familiar(params.minimos))
+    cuota = _tax_on_base(base_imponible, lows, rates, cum) - _tax_on_base(np.float64(minim_personal_familiar), lows, rates, cum)
+    cuota_irpf_anual = _redondear1(np.maximum(cuota, 0.0))
+
+    # ── Stage 7: Tipo de retención (%) ───────────────────────────────────────
+    positive = gross_including_benefits > 0
+    safe_gross = np.where(positive, gross_including_benefits, 1.0)
+    tipo_retencio = np.where(positive, _truncar(cuota_irpf_anual / safe_gross * 100), 0.0)
+
+    # ── Stage 8: Marginal IRPF rate ──────────────────────────────────────────
+    r_bracket = _rate_at(base_imponible, lows, rates)
+    ss_total_rate = float(
+        ss_rates["contingencies_common_worker"]
+        + ss_atur_rate
+        + ss_rates["training_worker"]
+        + ss_rates["mei_worker"]
+    )
+    ss_is_capped = gross_including_benefits / 12 >= base_ss_max
+    d_rnt_d_gross = np.where(ss_is_capped, 1.0, 1.0 - ss_total_rate)
+    r_red = np.select([rn <= upper1, rn <= upper2, rn <= upper3], [0.0, -coef2, -coef3], default=0.0)
+    d_base_d_gross = d_rnt_d_gross * (1.0 - r_red)
+    marginal_irpf = np.where(cuota_irpf_anual > 0, r_bracket * d_base_d_gross, 0.0)
+    marginal_irpf_percent = _truncar(marginal_irpf * 100)
+
+    # ── Stage 9: Per paga ────────────────────────────────────────────────────
+    gross_per_paga = gross_including_benefits / n_pagues
+    ss_per_paga    = total_ss_anual / n_pagues
+    irpf_per_paga  = cuota_irpf_anual / n_pagues
+    net_per_paga   = gross_per_paga - ss_per_paga - irpf_per_paga
+    net_monthly_equivalent = (gross_including_benefits - total_ss_anual - cuota_irpf_anual) / 12
+
+    return {
+        # ── SS breakdown ─────────────────────────────────────────────────────
+        "base_ss_mensual":                  base_ss_mensual,
+        "ss_contingencies_comunes_mensual": ss_contingencies_comunes_mensual,
+        "ss_atur_mensual":                  ss_atur_mensual,
+        "ss_formacio_mensual":              ss_formacio_mensual,
+        "ss_mei_mensual":                   ss_mei_mensual,
+        "total_ss_mensual":                 total_ss_mensual,
+        "total_ss_anual":                   total_ss_anual,
+        # ── IRPF chain ───────────────────────────────────────────────────────
+        "rendiment_brut_treball":      rendiment_brut_treball,
+        "gastos_deducibles":           gastos_deducibles,
+        "rendiment_net_treball":       rendiment_net_treball,
+        "reduccio_rendiments_treball": reduccio_rendiments_treball,
+        "base_imponible":              base_imponible,
+        "minim_personal_familiar":     np.full_like(gross, minim_personal_familiar),
+        "cuota_irpf_anual":            cuota_irpf_anual,
+        "tipo_retencio":               tipo_retencio,
+        # ── Marginal ─────────────────────────────────────────────────────────
+        "marginal_irpf_rate":    marginal_irpf,
+        "marginal_irpf_percent": marginal_irpf_percent,
+        # ── Per paga ─────────────────────────────────────────────────────────
+        "gross_per_paga":         _redondear1(gross_per_paga),
+        "ss_per_paga":            _redondear1(ss_per_paga),
+        "irpf_per_paga":          _redondear1(irpf_per_paga),
+        "net_per_paga":           _redondear1(net_per_paga),
+        "net_monthly_equivalent": _redondear1(net_monthly_equivalent),
+        "gross_including_benefits": gross_including_benefits,
+    }
+
+
+def verify_batch(result, gross, n_pagues, pagues_prorratejades, retribucio_en_especie_ann, grup_cotitzacio, contract_type, other_deductions, fam, region, compute_net_pay, sample_size=16, seed=None, params=None):
+    """
+    Re-run a sample of the rows of a `perform_calculation_batch` result through the Decimal
+    `compute_net_pay` and report the largest deviation, in cents, over every shared column
+    (rates excluded). The first and last rows are always checked, the rest are random.
+    """
+    gross, retribucio_en_especie_ann, other_deductions = np.broadcast_arrays(
+        np.atleast_1d(np.asarray(gross, dtype=float)),
+        np.asarray(retribucio_en_especie_ann, dtype=float),
+        np.asarray(other_deductions, dtype=float),
+    )
+    n = len(gross)
+    rng = np.random.default_rng(seed)
+    rows = {0, n - 1}
+    rows.update(rng.choice(n, size=min(max(sample_size - 2, 0), n), replace=False).tolist())
+
+    report = {"checked": len(rows), "max_cent_deviation": 0.0, "column": None, "gross": None}
+    for i in sorted(rows):
+        exact = compute_net_pay(
+            Decimal(float(gross[i])), n_pagues, pagues_prorratejades, Decimal(float(retribucio_en_especie_ann[i])),
+            grup_cotitzacio, contract_type, Decimal(float(other_deductions[i])), fam, region, params=params,
+        )
+        for column, values in result.items():
+            expected = getattr(exact, column, None)
+            if column in _RATE_COLUMNS or expected is None:
+                continue
+            deviation = float(abs(Decimal(float(values[i])) - expected)) * 100
+            if deviation > report["max_cent_deviation"]:
+                report.update(max_cent_deviation=deviation, column=column, gross=float(gross[i]))
+    return report
+
+
+# FamilySituation fields a family sweep can vary; each adds its own term to the Cuadro 1 minimum
+FAMILY_AXES = (
+    "age", "children_ages", "children_disabilities", "ascendents_ages",
+    "disability_percent_self", "disability_self_help", "disability_relatives",
+)
+
+
+def minimo_grid(axes, minimos):
+    """
+    Personal and family minimum, in cents, of every combination of `axes` ({FAMILY_AXES field:
+    list of values}) as an int64 array with one dimension per axis, in `axes` order. The minimum
+    is a sum of independent per-field terms in whole cents, so the grid is the broadcast sum of
+    one small vector per axis, each entry computed once with the Decimal rules.
+    """
+    base = int(FamilySituation().minimo_personal_familiar(minimos) * 100)
+    grid = np.array(base, dtype=np.int64)
+    for name, values in axes.items():
+        terms = np.array(
+            [int(FamilySituation(**{name: value}).minimo_personal_familiar(minimos) * 100) - base for value in values],
+            dtype=np.int64,
+        )
+        grid = grid[..., np.newaxis] + terms
+    return grid
@@ -0,0 +1,242 @@
+"""
+Local benchmarks for the calculation core, the charts and both endpoints.
+
+    python benchmark.py                                # table
+    python benchmark.py --output bench.json            # save the run
+    python benchmark.py --baseline bench.json          # exit 1 if a case got slower than the saved run
+    python benchmark.py --only perform_calculation --repeat 9
+
+Each case is timed with timeit (auto-ranged call count, best of --repeat rounds) and reported
+in microseconds per call. Endpoint cases go through FastAPI's in-process TestClient (needs httpx) and change the
+gross on every call, so they measure chart rendering rather than chart cache hits.
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import timeit
+import warnings
+from decimal import Decimal
+
+INCOME_BANDS = [12000, 25000, 45000, 80000, 150000, 400000]
+
+GRUP = "Grup 1 – Enginyers/Llicenciats/Alta direcció"
+
+SALARY_BODY = dict(
+    gross=35000, region="Catalunya", n_pagues=14, pagues_prorratejades=False, retribucio_en_especie_ann=0,
+    grup_cotitzacio=GRUP, contract_type="indefinite", other_deductions=0, age=30,
+    disability_percent_self=0, disability_self_help=False, children_ages="3,1", children_disabilities="",
+    ascendents_ages="", disability_relatives_perc="", disability_relatives_help="",
+)
+
+INCREMENT_BODY = dict(
+    previous_gross=30000, new_gross=35000, n_pagues=14, pagues_prorratejades=False, retribucio_en_especie_ann=0,
+    grup_cotitzacio=GRUP, contract_type="indefinite", other_deductions=0, age=30,
+)
+
+# 0-4 children (the youngest under 3), with or without a parent over 75, three disability grades
+FAMILY_SWEEP_BODY = dict(
+    gross=35000, region="Catalunya", n_pagues=14, pagues_prorratejades=False, retribucio_en_especie_ann=0,
+    grup_cotitzacio=GRUP, contract_type="indefinite", other_deductions=0,
+    children_ages=[[], [1], [5, 1], [8, 5, 1], [10, 8, 5, 1]], ascendents_ages=[[], [80]],
+    disability_percent_self=[0, 33, 65],
+)
+
+
+def core_cases():
+    import parameters
+    from utils import FamilySituation, IRPFScale, _COMBINED_SCALES
+    from variables import IRPF_SCALE_CATALUNYA, IRPF_SCALE_ESTATAL
+    from calculator import perform_calculation
+
+    scale = parameters.DEFAULT.scale("Catalunya")
+    bases = [Decimal(b) for b in range(0, 300000, 7919)]
+    yield "tax_on_base", lambda: [scale.tax_on_base(b) for b in bases], len(bases)
+
+    yield "combined_scale[cached]", lambda: IRPFScale.combined_scale(IRPF_SCALE_CATALUNYA, IRPF_SCALE_ESTATAL), 1
+
+    def combined_scale_cold():
+        _COMBINED_SCALES.clear()
+        IRPFScale.combined_scale(IRPF_SCALE_CATALUNYA, IRPF_SCALE_ESTATAL)
+    yield "combined_scale[cold]", combined_scale_cold, 1
+
+    single = FamilySituation(age=30)
+    family = FamilySituation(age=70, children_ages=[2, 5, 9], children_disabilities=[0, 33, 0],
+                             ascendents_ages=[80], disability_percent_self=40)
+    yield "minimo_personal_familiar[single]", single.minimo_personal_familiar, 1
+    yield "minimo_personal_familiar[family]", family.minimo_personal_familiar, 1
+
+    for gross in INCOME_BANDS:
+        args = (Decimal(gross), 14, False, Decimal(0), GRUP, "indefinite", Decimal(0), single, "Catalunya")
+        yield f"perform_calculation[{gross}]", lambda args=args: perform_calculation(*args), 1
+
+
+def plot_cases():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import viz_utils
+    from batch_engine import perform_calculation_batch
+    from calculator import perform_calculation
+    from main import fig_to_png, salary_pie_args, salary_blocks_args
+    from utils import FamilySituation
+
+    fam = FamilySituation(age=30)
+    prev, calc = (
+        perform_calculation(Decimal(g), 14, False, Decimal(0), GRUP, "indefinite", Decimal(0), fam, "Catalunya")
+        for g in (30000, 35000)
+    )
+    pie_args = salary_pie_args(calc)
+    blocks_args = salary_blocks_args(calc)
+
+    # Figures are encoded too, since that is what a request pays for
+    yield "plot_net_pay_and_taxes", lambda: fig_to_png(viz_utils.plot_net_pay_and_taxes(*pie_args, return_fig=True)), 1
+    yield "plot_net_pay_and_taxes[template]", lambda: fig_to_png(
+        viz_utils.plot_net_pay_and_taxes(*pie_args, return_fig=True, template=True)), 1
+    yield "plot_increment_difference_pie", lambda: fig_to_png(
+        viz_utils.plot_increment_difference_pie(prev, calc, return_fig=True)), 1
+
+    # The same pies without matplotlib (PIE_RENDERER=svg)
+    import svg_charts
+    from chart_data import net_pay_and_taxes_series
+    from chart_style import PIE_TITLES
+    titles = PIE_TITLES["net_pay_and_taxes"]
+    yield "net_pay_and_taxes_svg", lambda: svg_charts.net_pay_and_taxes_svg(net_pay_and_taxes_series(*pie_args), *titles), 1
+    yield "net_pay_and_taxes_svg[png]", lambda: svg_charts.net_pay_and_taxes_png(net_pay_and_taxes_series(*pie_args), *titles), 1
+    yield "plot_salary_blocks", lambda: fig_to_png(viz_utils.plot_salary_blocks(
+        *blocks_args, perform_calculation, return_fig=True, compute_net_pay_batch=perform_calculation_batch)), 1
+    yield "plot_salary_blocks[template]", lambda: fig_to_png(viz_utils.plot_salary_blocks(
+        *blocks_args, perform_calculation, return_fig=True, compute_net_pay_batch=perform_calculation_batch,
+        template=True)), 1
+    yield "plot_salary_blocks[scalar]", lambda: fig_to_png(viz_utils.plot_salary_blocks(
+        *blocks_args, perform_calculation, return_fig=True)), 1
+
+    def salary_percentages():
+        viz_utils.plot_salary_percentages(*blocks_args, perform_calculation)
+        fig_to_png(plt.gcf())
+    yield "plot_salary_percentages", salary_percentages, 1
+
+
+def endpoint_cases(client):
+    def post(path, body, vary):
+        counter = itertools.count(1)
+        def call():
+            # A new gross per call keeps the chart cache cold
+            response = client.post(path, json={**body, vary: body[vary] + next(counter) / 100})
+            response.raise_for_status()
+        return call
+
+    yield "/api/calculate[none]", post("/api/calculate", {**SALARY_BODY, "plots": "none"}, "gross"), 1
+    yield "/api/calculate[data]", post("/api/calculate", {**SALARY_BODY, "plots": "data"}, "gross"), 1
+    yield "/api/calculate[png]", post("/api/calculate", SALARY_BODY, "gross"), 1
+    yield "/api/increment[none]", post("/api/increment", {**INCREMENT_BODY, "plots": "none"}, "new_gross"), 1
+    yield "/api/increment[png]", post("/api/increment", INCREMENT_BODY, "new_gross"), 1
+    yield "/api/family-sweep", post("/api/family-sweep", FAMILY_SWEEP_BODY, "gross"), 30
+
+
+def time_case(fn, items_per_call, repeat):
+    fn()  # warm-up: lazy imports, caches, templates
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    rounds = [t / number / items_per_call for t in timer.repeat(repeat, number)]
+    return {
+        "best_us": min(rounds) * 1e6,
+        "median_us": statistics.median(rounds) * 1e6,
+        "calls": number,
+        "rounds": repeat,
+    }
+
+
+def run_benchmarks(only=None, repeat=5, endpoints=True, plots=True):
+    results = {}
+    with contextlib.ExitStack() as stack:
+        groups = [core_cases()]
+        if plots:
+            groups.append(plot_cases())
+        if endpoints:
+            try:
+                from fastapi.testclient import TestClient
+            except (ImportError, RuntimeError) as exc:
+                print(f"skipping endpoint benchmarks: {exc}", file=sys.stderr)
+            else:
+                import main
+                groups.append(endpoint_cases(stack.enter_context(TestClient(main.app))))
+        for name, fn, items in itertools.chain.from_iterable(groups):
+            if only and not any(o in name for o in only):
+                continue
+            results[name] = time_case(fn, items, repeat)
+            print(f"  {name:<40} {results[name]['best_us']:>12.1f} us", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance, min_delta_us=1.0):
+    """
+    Cases slower than the baseline's best time by more than `tolerance` (a fraction) and by more
+    than `min_delta_us` in absolute terms, so timer noise on sub-microsecond cases is not flagged.
+    """
+    regressions = []
+    for name, row in results.items():
+        old = baseline.get("results", {}).get(name)
+        if old is None:
+            continue
+        ratio = row["best_us"] / old["best_us"] if old["best_us"] else float("inf")
+        if ratio > 1 + tolerance and row["best_us"] - old["best_us"] > min_delta_us:
+            regressions.append((name, old["best_us"], row["best_us"], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON from a previous --output run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs baseline (default 0.25 = 25%%)")
+    parser.add_argument("--min-delta-us", type=float, default=1.0, help="ignore slowdowns smaller than this many microseconds")
+    parser.add_argument("--repeat", type=int, default=5, help="timing rounds per case (best is kept)")
+    parser.add_argument("--only", action="append", help="only run cases whose name contains this (repeatable)")
+    parser.add_argument("--no-endpoints", action="store_true", help="skip the TestClient round trips")
+    parser.add_argument("--no-plots", action="store_true", help="skip the chart cases")
+    parser.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    args = parser.parse_args(argv)
+
+    warnings.filterwarnings("ignore", message=".*non-interactive.*")
+    results = run_benchmarks(args.only, args.repeat, endpoints=not args.no_endpoints, plots=not args.no_plots)
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{'case':<40} {'best us':>12} {'median us':>12} {'vs base':>8}")
+        for name, row in results.items():
+            old = (baseline or {}).get("results", {}).get(name)
+            delta = f"{row['best_us'] / old['best_us']:>7.2f}x" if old and old["best_us"] else ""
+            print(f"{name:<40} {row['best_us']:>12.1f} {row['median_us']:>12.1f} {delta:>8}")
+
+    if baseline is None:
+        return 0
+    regressions = compare(results, baseline, args.tolerance, args.min_delta_us)
+    for name, old, new, ratio in regressions:
+        print(f"regression: {name} {old:.1f} us -> {new:.1f} us ({ratio:.2f}x)", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
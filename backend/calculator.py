@@ -0,0 +1,266 @@
+# The salary calculation itself, with no web app around it: perform_calculation, its lookup-table
+# front end `calculate`, family parsing and the JSON form of a result. main's endpoints, the
+# command-line tools and payroll_engine all import it from here.
+import os
+from decimal import Decimal
+from functools import lru_cache
+
+import metrics
+import parameters
+from utils import (
+    CalculationResult, FamilySituation, apply_base_limits, calcular_cuota_retencion, calcular_gastos_deducibles,
+    compute_reduction_by_work, redondear1, round_euro, truncar,
+)
+
+
+def perform_calculation(gross, n_pagues, pagues_prorratejades, retribucio_en_especie_ann, grup_cotitzacio, contract_type, other_deductions, fam, region, precomputed=None, params=None):
+    # `precomputed` (from lookup_tables) supplies the results of stages 4, 6, 7 and 8;
+    # `params` is a parameters.TaxParameters (the default year if None)
+    if params is None:
+        params = parameters.DEFAULT
+    ss_rates = params.ss_rates
+    timer = metrics.stage_timer()
+    # ── Stage 1: SS base mensual ──────────────────────────────────────────────
+    gross_including_benefits = gross + retribucio_en_especie_ann
+    base_ss_mensual = apply_base_limits(
+        gross_including_benefits / 12,
+        params.ss_base_min_by_group[grup_cotitzacio],
+        params.ss_base_max_monthly,
+    )
+
+    timer.mark("ss_base")
+
+    # ── Stage 2: Cotitzacions SS mensuals ────────────────────────────────────
+    ss_atur_rate = (
+        ss_rates["unemployment_worker_indefinite"]
+        if contract_type == "indefinite"
+        else ss_rates["unemployment_worker_temporary"]
+    )
+    ss_contingencies_comunes_mensual = base_ss_mensual * ss_rates["contingencies_common_worker"]
+    ss_atur_mensual                  = base_ss_mensual * ss_atur_rate
+    ss_formacio_mensual              = base_ss_mensual * ss_rates["training_worker"]
+    ss_mei_mensual                   = base_ss_mensual * ss_rates["mei_worker"]
+    total_ss_mensual = (
+        ss_contingencies_comunes_mensual + ss_atur_mensual + ss_formacio_mensual + ss_mei_mensual
+    )
+    total_ss_anual = total_ss_mensual * 12
+
+    timer.mark("ss_contributions")
+
+    # ── Stage 3: Rendiment net del treball ───────────────────────────────────
+    rendiment_brut_treball = gross_including_benefits
+    gastos_deducibles = calcular_gastos_deducibles(
+        rendiment_brut_treball,
+        total_ss_anual,
+        False,
+        fam.disability_percent_self >= 33 and fam.disability_percent_self < 65,
+        fam.disability_percent_self >= 65,
+        "ACTIVO",
+        params.gastos_deducidos,
+    )
+    rendiment_net_treball = rendiment_brut_treball - total_ss_anual - gastos_deducibles - other_deductions
+
+    timer.mark("net_work_income")
+
+    # ── Stage 4: Reducció per rendiments del treball (art. 20 LIRPF) ─────────
+    if precomputed is None:
+        reduccio_rendiments_treball = compute_reduction_by_work(rendiment_net_treball, params.reduction_work)
+    else:
+        reduccio_rendiments_treball = precomputed["reduccio_rendiments_treball"]
+
+    timer.mark("work_reduction")
+
+    # ── Stage 5: Base imposable ───────────────────────────────────────────────
+    base_imponible = max(rendiment_net_treball - reduccio_rendiments_treball, Decimal("0"))
+
+    timer.mark("taxable_base")
+
+    # ── Stage 6: Escala IRPF + quota ─────────────────────────────────────────
+    if precomputed is None:
+        escala_irpf = params.scale(region)
+        minim_personal_familiar = fam.minimo_personal_familiar(params.minimos)
+        cuota_irpf_anual = redondear1(calcular_cuota_retencion(base_imponible, minim_personal_familiar, escala=escala_irpf))
+    else:
+        minim_personal_familiar = precomputed["minim_personal_familiar"]
+        cuota_irpf_anual = precomputed["cuota_irpf_anual"]
+
+    timer.mark("scale_quota")
+
+    # ── Stage 7: Tipo de retención (%) ───────────────────────────────────────
+    if precomputed is None:
+        tipo_retencio = (
+            truncar((cuota_irpf_anual / gross_including_benefits) * Decimal("100"))
+            if gross_including_benefits > 0
+            else Decimal("0.00")
+        )
+    else:
+        tipo_retencio = precomputed["tipo_retencio"]
+
+    timer.mark("withholding_rate")
+
+    # ── Stage 8: Marginal IRPF rate ──────────────────────────────────────────
+    # Chain rule: d(cuota)/d(gross) = bracket_rate × d(base_imponible)/d(gross)
+    if precomputed is not None:
+        marginal_irpf = precomputed["marginal_irpf_rate"]
+    else:
+        r_bracket = escala_irpf.rate_at(base_imponible)
+        ss_total_rate = (
+            ss_rates["contingencies_common_worker"]
+            + ss_atur_rate
+            + ss_rates["training_worker"]
+            + ss_rates["mei_worker"]
+        )
+        ss_is_capped = (gross_including_benefits / 12 >= params.ss_base_max_monthly)
+        d_rnt_d_gross = Decimal("1.00") if ss_is_capped else (Decimal("1.00") - ss_total_rate)
+        # derivative of reduction-by-work w.r.t. rendiment_net_treball
+        rn = rendiment_net_treball
+        reduction_work = params.reduction_work
+        if rn <= reduction_work["upper1"]:
+            r_red = Decimal("0.00")
+        elif rn <= reduction_work["upper2"]:
+            r_red = -reduction_work["coef2"]
+        elif rn <= reduction_work["upper3"]:
+            r_red = -reduction_work["coef3"]
+        else:
+            r_red = Decimal("0.00")
+        d_base_d_gross = d_rnt_d_gross * (Decimal("1.00") - r_red)
+        marginal_irpf = r_bracket * d_base_d_gross if cuota_irpf_anual > Decimal("0.00") else Decimal("0.00")
+    marginal_irpf_percent = truncar(marginal_irpf * Decimal("100"))
+
+    timer.mark("marginal")
+
+    # ── Stage 9: Per paga ────────────────────────────────────────────────────
+    # SS is distributed proportionally across n_pagues so net_monthly_equivalent
+    # stays invariant of n_pagues (same annual money, just split differently).
+    gross_per_paga = gross_including_benefits / Decimal(n_pagues)
+    ss_per_paga    = total_ss_anual / Decimal(n_pagues)
+    irpf_per_paga  = cuota_irpf_anual / Decimal(n_pagues)
+    net_per_paga   = gross_per_paga - ss_per_paga - irpf_per_paga
+    net_monthly_equivalent = (gross_including_benefits - total_ss_anual - cuota_irpf_anual) / Decimal(12)
+    timer.mark("per_paga")
+    timer.done()
+
+    return CalculationResult(
+        # ── SS breakdown ─────────────────────────────────────────────────────
+        base_ss_mensual=base_ss_mensual,
+        ss_contingencies_comunes_mensual=ss_contingencies_comunes_mensual,
+        ss_atur_mensual=ss_atur_mensual,
+        ss_formacio_mensual=ss_formacio_mensual,
+        ss_mei_mensual=ss_mei_mensual,
+        total_ss_mensual=total_ss_mensual,
+        total_ss_anual=total_ss_anual,
+        # ── IRPF chain ───────────────────────────────────────────────────────
+        gastos_deducibles=gastos_deducibles,
+        rendiment_net_treball=rendiment_net_treball,
+        reduccio_rendiments_treball=reduccio_rendiments_treball,
+        base_imponible=base_imponible,
+        minim_personal_familiar=minim_personal_familiar,
+        cuota_irpf_anual=cuota_irpf_anual,
+        tipo_retencio=tipo_retencio,
+        # ── Marginal ─────────────────────────────────────────────────────────
+        marginal_irpf_rate=marginal_irpf,
+        marginal_irpf_percent=marginal_irpf_percent,
+        # ── Per paga ─────────────────────────────────────────────────────────
+        gross_per_paga=redondear1(gross_per_paga),
+        ss_per_paga=redondear1(ss_per_paga),
+        irpf_per_paga=redondear1(irpf_per_paga),
+        net_per_paga=redondear1(net_per_paga),
+        net_monthly_equivalent=redondear1(net_monthly_equivalent),
+        # ── Pass-through for viz_utils (legacy names are aliases on the result) ──
+        gross_including_benefits=gross_including_benefits,
+        n_pagues=n_pagues,
+        pagues_prorratejades=pagues_prorratejades,
+        retribucio_en_especie_ann=retribucio_en_especie_ann,
+        grup_cotitzacio=grup_cotitzacio,
+        contract_type=contract_type,
+        other_deductions=other_deductions,
+        fam=fam,
+        year=params.year,
+    )
+
+def parse_int_list(s):
+    return [int(x.strip()) for x in s.split(',') if x.strip() != ''] if s else []
+
+def parse_bool_list(s):
+    return [x.strip().lower() in ("true","1","yes") for x in s.split(',') if x.strip() != ''] if s else []
+
+FAMILY_CACHE_SIZE = 1024
+
+@lru_cache(maxsize=None)
+def default_family(age: int) -> FamilySituation:
+    return FamilySituation(age=age)
+
+@lru_cache(maxsize=FAMILY_CACHE_SIZE)
+def parse_family(key) -> FamilySituation:
+    (age, disability_percent_self, disability_self_help, children_ages, children_disabilities,
+     ascendents_ages, disability_relatives_perc, disability_relatives_help) = key
+    disability_relatives_perc = parse_int_list(disability_relatives_perc)
+    disability_relatives_help = parse_bool_list(disability_relatives_help)
+    while len(disability_relatives_help) < len(disability_relatives_perc):
+        disability_relatives_help.append(False)
+    return FamilySituation(
+        age=age,
+        children_ages=parse_int_list(children_ages),
+        children_disabilities=parse_int_list(children_disabilities),
+        ascendents_ages=parse_int_list(ascendents_ages),
+        disability_percent_self=disability_percent_self,
+        disability_self_help=disability_self_help,
+        disability_relatives=zip(disability_relatives_perc, disability_relatives_help),
+    )
+
+@lru_cache(maxsize=None)
+def load_lookup_tables():
+    """Memory-map the precomputed tables (LOOKUP_TABLES, default next to lookup_tables.py) if built."""
+    import lookup_tables
+    path = os.environ.get("LOOKUP_TABLES", lookup_tables.DEFAULT_PATH)
+    if not path or not os.path.exists(path):
+        return None
+    return lookup_tables.LookupTables(path)
+
+def calculate(gross, n_pagues, pagues_prorratejades, retribucio_en_especie_ann, grup_cotitzacio, contract_type, other_deductions, fam, region, params=None):
+    """perform_calculation, with stages 4, 6-8 read from the lookup tables when they cover the profile."""
+    if params is None:
+        params = parameters.DEFAULT
+    tables = load_lookup_tables()
+    precomputed = None
+    if tables is not None:
+        precomputed = tables.precomputed(gross, grup_cotitzacio, contract_type, retribucio_en_especie_ann, other_deductions, fam, region, params)
+        metrics.LOOKUPS.inc(result="miss" if precomputed is None else "hit")
+    return perform_calculation(
+        gross, n_pagues, pagues_prorratejades, retribucio_en_especie_ann, grup_cotitzacio, contract_type,
+        other_deductions, fam, region, precomputed=precomputed, params=params,
+    )
+
+def serialize_calculation(calc):
+    return {
+        # ── SS breakdown ────────────────────────────────────────────────────
+        "base_ss_mensual":                  float(round_euro(calc.base_ss_mensual)),
+        "ss_contingencies_comunes_mensual": float(round_euro(calc.ss_contingencies_comunes_mensual)),
+        "ss_atur_mensual":                  float(round_euro(calc.ss_atur_mensual)),
+        "ss_formacio_mensual":              float(round_euro(calc.ss_formacio_mensual)),
+        "ss_mei_mensual":                   float(round_euro(calc.ss_mei_mensual)),
+        "total_ss_mensual":                 float(round_euro(calc.total_ss_mensual)),
+        "total_ss_anual":                   float(round_euro(calc.total_ss_anual)),
+        # ── IRPF chain ──────────────────────────────────────────────────────
+        "rendiment_brut_treball":      float(round_euro(calc.gross_including_benefits)),
+        "gastos_deducibles":           float(round_euro(calc.gastos_deducibles)),
+        "rendiment_net_treball":       float(round_euro(calc.rendiment_net_treball)),
+        "reduccio_rendiments_treball": float(round_euro(calc.reduccio_rendiments_treball)),
+        "base_imponible":              float(round_euro(calc.base_imponible)),
+        "minim_personal_familiar":     float(round_euro(calc.minim_personal_familiar)),
+        "cuota_irpf_anual":            float(round_euro(calc.cuota_irpf_anual)),
+        "tipo_retencio":               float(calc.tipo_retencio),
+        # ── Marginal ────────────────────────────────────────────────────────
+        "marginal_irpf_rate":    float(calc.marginal_irpf_rate),
+        "marginal_irpf_percent": float(calc.marginal_irpf_percent),
+        # ── Per paga ────────────────────────────────────────────────────────
+        "gross_per_paga":             float(round_euro(calc.gross_per_paga)),
+        "ss_per_paga":                float(round_euro(calc.ss_per_paga)),
+        "irpf_per_paga":              float(round_euro(calc.irpf_per_paga)),
+        "sou_net_per_paga":           float(round_euro(calc.net_per_paga)),
+        "sou_net_mensual_equivalent": float(round_euro(calc.net_monthly_equivalent)),
+        # legacy aliases kept for backward compatibility
+        "irpf_anual":         float(round_euro(calc.cuota_irpf_anual)),
+        "cotitzacions_anuals": float(round_euro(calc.total_ss_anual)),
+        "year": calc.year,
+    }
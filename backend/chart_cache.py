@@ -0,0 +1,107 @@
+# Content-addressed LRU cache for rendered chart bytes
+import base64
+import binascii
+import dataclasses
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+
+
+def _canonical(value):
+    # JSON fallback: equal inputs must serialise identically (Decimal("1.0") == Decimal("1"))
+    if isinstance(value, Decimal):
+        return format(value.normalize(), "f")
+    if dataclasses.is_dataclass(value):
+        # Only fields that take part in equality (skips caches such as FamilySituation._minimo)
+        return {f.name: getattr(value, f.name) for f in dataclasses.fields(value) if f.compare}
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"Cannot canonicalise {type(value).__name__}")
+
+
+def chart_payload(kind: str, inputs, fmt: str = "png") -> bytes:
+    """Canonical JSON of the chart kind plus every input that feeds the plotting function (and the format, if not PNG)."""
+    chart = [kind, inputs] if fmt == "png" else [kind, inputs, fmt]
+    return json.dumps(chart, default=_canonical, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def chart_key(kind: str, inputs) -> str:
+    """sha256 of chart_payload."""
+    return hashlib.sha256(chart_payload(kind, inputs)).hexdigest()
+
+
+def chart_spec(kind: str, inputs, fmt: str = "png"):
+    """(key, spec): spec is chart_payload in URL-safe base64, enough to render the chart in any process."""
+    payload = chart_payload(kind, inputs, fmt)
+    return hashlib.sha256(payload).hexdigest(), base64.urlsafe_b64encode(payload).rstrip(b"=").decode("ascii")
+
+
+def decode_chart_spec(key: str, spec: str):
+    """(kind, inputs as plain JSON, format) of a chart_spec; ValueError unless it hashes to `key`."""
+    try:
+        payload = base64.urlsafe_b64decode(spec + "=" * (-len(spec) % 4))
+    except (binascii.Error, ValueError):
+        raise ValueError("Malformed chart spec") from None
+    if hashlib.sha256(payload).hexdigest() != key:
+        raise ValueError("Chart spec does not match its id")
+    try:
+        kind, inputs, *fmt = json.loads(payload)
+    except (TypeError, ValueError):
+        raise ValueError("Malformed chart spec") from None
+    if fmt not in ([], ["svg"]):
+        raise ValueError("Malformed chart spec")
+    return kind, inputs, fmt[0] if fmt else "png"
+
+
+class ChartCache:
+    """Thread-safe LRU of bytes, bounded by total size rather than entry count."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size_bytes -= len(old)
+            self._entries[key] = data
+            self.size_bytes += len(data)
+            while self.size_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size_bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self.size_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+chart_cache = ChartCache(int(os.environ.get("CHART_CACHE_MAX_BYTES", 64 * 1024 * 1024)))
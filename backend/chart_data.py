@@ -0,0 +1,146 @@
+# Raw series behind the charts, without matplotlib (used by the plots="data" API mode)
+from decimal import Decimal
+import numpy as np
+
+NET_VS_TAXES_LABELS = ["Sou Net Anual", "Impostos i Cotitzacions"]
+TAXES_BREAKDOWN_LABELS = [
+    "IRPF",
+    "SS: Contingències Comunes",
+    "SS: Atur",
+    "SS: Formació Professional",
+    "SS: MEI",
+]
+
+# Fields of each calculation that plot_increment_difference_pie subtracts
+INCREMENT_PIE_KEYS = (
+    "gross_including_benefits", "net_per_paga", "total_ss_anual", "cuota_irpf_anual",
+    "ss_contingencies_comunes_mensual", "ss_atur_mensual", "ss_formacio_mensual", "ss_mei_mensual",
+)
+
+
+def net_pay_and_taxes_series(
+    gross_including_benefits: Decimal,
+    net_per_paga: Decimal,
+    n_pagues: int,
+    cotitzacions_anuals: Decimal,
+    irpf_anual: Decimal,
+    ss_contingencies_comunes_annual: Decimal,
+    t_des_annual: Decimal,
+    ss_training_annual: Decimal,
+    ss_mei_annual: Decimal,
+):
+    """Wedge values of the two pies drawn by viz_utils.plot_net_pay_and_taxes."""
+    total_taxes_annual = cotitzacions_anuals + irpf_anual
+    net_annual = net_per_paga * Decimal(n_pagues)
+    return {
+        "main": {
+            "labels": NET_VS_TAXES_LABELS,
+            "values": [float(net_annual), float(total_taxes_annual)],
+        },
+        "breakdown": {
+            "labels": TAXES_BREAKDOWN_LABELS,
+            "values": [
+                float(irpf_anual),
+                float(ss_contingencies_comunes_annual),
+                float(t_des_annual),
+                float(ss_training_annual),
+                float(ss_mei_annual),
+            ],
+        },
+    }
+
+
+def increment_difference_args(prev_calc, new_calc):
+    """Arguments of net_pay_and_taxes_series / plot_net_pay_and_taxes for the raise only."""
+    diff = {k: getattr(new_calc, k) - getattr(prev_calc, k) for k in INCREMENT_PIE_KEYS}
+    n_pagues = new_calc.n_pagues
+    # Compose annual values for SS
+    return (
+        diff["gross_including_benefits"],
+        diff["net_per_paga"],
+        n_pagues,
+        diff["total_ss_anual"],
+        diff["cuota_irpf_anual"],
+        diff["ss_contingencies_comunes_mensual"] * Decimal(n_pagues),
+        diff["ss_atur_mensual"] * Decimal(n_pagues),
+        diff["ss_formacio_mensual"] * Decimal(n_pagues),
+        diff["ss_mei_mensual"] * Decimal(n_pagues),
+    )
+
+
+def salary_blocks_series(
+    gross: Decimal,
+    n_pagues: int,
+    pagues_prorratejades: bool,
+    retribucio_en_especie_ann: Decimal,
+    grup_cotitzacio: str,
+    contract_type: str,
+    fam,
+    region: str,
+    other_deductions: Decimal,
+    compute_net_pay,
+    compute_net_pay_batch=None,
+    num_points: int = 200,
+):
+    """Series drawn by viz_utils.plot_salary_blocks (marginal %, effective %, IRPF €, net vs gross)."""
+    # We'll sample a grid of gross values and call compute_net_pay for each sample to obtain
+    # the base_imponible, marginal rate and total IRPF. Using the marginal returned by
+    # compute_net_pay (if available) gives an exact derivative-based marginal.
+    gross_float = float(gross)
+    if gross_float <= 0:
+        raise ValueError("Gross salary must be positive to plot")
+
+    xs = np.linspace(0.01, gross_float, num_points)
+    marginal_percents = []
+    irpf_totals = []
+    net_annuals = []
+
+    if compute_net_pay_batch is not None:
+        # One vectorized pass over the whole grid instead of 2 * num_points scalar calls
+        res = compute_net_pay_batch(
+            xs,
+            n_pagues,
+            pagues_prorratejades,
+            float(retribucio_en_especie_ann),
+            grup_cotitzacio,
+            contract_type,
+            float(other_deductions),
+            fam,
+            region
+        )
+        marginal_percents = res["marginal_irpf_percent"].tolist()
+        irpf_totals = res["cuota_irpf_anual"].tolist()
+        net_annuals = (res["net_per_paga"] * n_pagues).tolist()
+    else:
+        gross_points = [Decimal(x) for x in xs]
+        for g in gross_points:
+            res = compute_net_pay(
+                g,
+                n_pagues,
+                pagues_prorratejades,
+                retribucio_en_especie_ann,
+                grup_cotitzacio,
+                contract_type,
+                other_deductions,
+                fam,
+                region
+            )
+            # exact derivative-based marginal from the calculation
+            marginal_percents.append(float(res.marginal_irpf_percent))
+            irpf_totals.append(float(res.cuota_irpf_anual))
+        for g in gross_points:
+            # compute net annual using compute_net_pay (some callers already provided net in previous loop,
+            # but we recompute to be safe and accurate)
+            res = compute_net_pay(Decimal(str(float(g))), n_pagues, pagues_prorratejades, retribucio_en_especie_ann, grup_cotitzacio, contract_type, other_deductions, fam, region)
+            net_annuals.append(float(res.net_per_paga * Decimal(n_pagues)))
+
+    # Build additional series: IRPF as percentage of gross
+    irpf_percents = [100.0 * irpf / gross_val if gross_val > 0 else 0.0 for gross_val, irpf in zip(xs, irpf_totals)]
+
+    return {
+        "gross":             [float(x) for x in xs],
+        "marginal_percent":  marginal_percents,
+        "effective_percent": irpf_percents,
+        "irpf_annual":       irpf_totals,
+        "net_annual":        net_annuals,
+    }
@@ -0,0 +1,32 @@
+# Palette and pie layout shared by the matplotlib (viz_utils) and SVG (svg_charts) renderers; no heavy imports
+
+# ── Brand palette ────────────────────────────────────────────────────────────
+RED      = "#e2231a"
+RED_DARK = "#b81b13"
+GREEN    = "#52b788"
+ORANGE   = "#e67e22"
+BLUE     = "#3498db"
+PURPLE   = "#9b59b6"
+TEAL     = "#1abc9c"
+GRAY     = "#adb5bd"
+TEXT     = "#1a1a1a"
+
+PIE_TAXES_COLORS = [RED, ORANGE, BLUE, PURPLE, TEAL]
+PIE_MAIN_COLORS  = [GREEN, RED]
+PIE_START_ANGLE  = 90
+PIE_PCT_DISTANCE = 0.72
+
+# (main, breakdown) titles of the pies, by chart kind
+PIE_TITLES = {
+    "net_pay_and_taxes": ("Sou Net vs Impostos Anuals", "Desglossat d'Impostos i Cotitzacions"),
+    "increment_difference_pie": ("Increment Net vs Impostos Addicionals", "Desglossat Impostos Addicionals per l'Increment"),
+}
+
+
+def pct_label(pct):
+    # Wedges of 3 % or less stay unlabelled
+    return (f"{pct:.1f}%") if pct > 3 else ""
+
+
+def pie_values_drawable(values):
+    return all(v >= 0 for v in values) and sum(values) > 0
@@ -0,0 +1,89 @@
+# Bounded thread/process pool used to keep Decimal math and chart rendering off the event loop
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+
+import metrics
+
+
+class ExecutorBusy(Exception):
+    """Raised when every worker is busy and the waiting queue is full."""
+
+
+def _release_slot(loop, slots, _future):
+    try:
+        loop.call_soon_threadsafe(slots.release)
+    except RuntimeError:
+        pass  # loop already closed (shutdown while a job was still running)
+
+
+class BoundedExecutor:
+    """
+    Runs blocking callables on a thread or process pool with at most `max_workers + queue_size`
+    jobs in flight. `run` raises ExecutorBusy instead of queueing past that limit (or waits for a
+    free slot with `wait=True`) and asyncio.TimeoutError after `timeout` seconds.
+    """
+
+    def __init__(self, kind: str = "thread", max_workers: int = 2, queue_size: int = 32, timeout: float = 30.0, retry_after: int = 1):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._pool = None
+        self._slots = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            kind=os.environ.get("CALC_EXECUTOR", "thread"),
+            max_workers=int(os.environ.get("CALC_WORKERS", os.cpu_count() or 2)),
+            queue_size=int(os.environ.get("CALC_QUEUE_SIZE", "32")),
+            timeout=float(os.environ.get("CALC_TIMEOUT", "30")),
+            retry_after=int(os.environ.get("CALC_RETRY_AFTER", "1")),
+        )
+
+    @property
+    def in_flight(self) -> int:
+        if self._slots is None:
+            return 0
+        return self.max_workers + self.queue_size - self._slots._value
+
+    def _ensure_started(self):
+        # Created lazily so the semaphore binds to the running loop and forked workers stay cheap
+        if self._pool is None:
+            pool_cls = ThreadPoolExecutor if self.kind == "thread" else ProcessPoolExecutor
+            self._pool = pool_cls(max_workers=self.max_workers)
+            self._slots = asyncio.Semaphore(self.max_workers + self.queue_size)
+
+    async def run(self, fn, *args, wait: bool = False, **kwargs):
+        self._ensure_started()
+        slots = self._slots
+        if slots.locked() and not wait:
+            raise ExecutorBusy()
+        await slots.acquire()
+        loop = asyncio.get_running_loop()
+        if self.kind == "process":
+            # Worker processes have their own metrics registry; ship what they record back here
+            fn, args = metrics.run_collecting, (fn, *args)
+        try:
+            future = self._pool.submit(partial(fn, *args, **kwargs))
+        except BaseException:
+            slots.release()
+            raise
+        # The slot is freed when the job really finishes, not when the caller stops waiting
+        future.add_done_callback(partial(_release_slot, loop, slots))
+        result = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        if self.kind == "process":
+            result, delta = result
+            metrics.merge(delta)
+        return result
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            self._slots = None
@@ -0,0 +1,162 @@
+"""
+Precomputed results of the scale-dependent stages (4, 6, 7 and 8 of perform_calculation) for the
+standard profiles, on a €1 gross grid, in a memory-mapped columnar file.
+
+    python lookup_tables.py                       # writes lookup_tables.bin + .json next to this file
+    python lookup_tables.py --max-gross 150000 --output /srv/tables/lookup_tables.bin
+    python lookup_tables.py --year 2026
+
+A file holds one tax year (parameters.py); other years are always computed.
+
+A standard profile is a family with the default minimum and no own disability (e.g. the default
+FamilySituation at any age under 65), no in-kind pay or other deductions, any SS group
+(deduplicated by minimum base), either contract type and either region. Every column is int32;
+the server maps the file read-only, so worker processes share its pages.
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+from decimal import Decimal
+
+import parameters
+from utils import FamilySituation
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lookup_tables.bin")
+FORMAT_VERSION = 1
+
+# (result key, decimal places stored); values are stored as int32 of value * 10**places
+COLUMNS = (
+    ("reduccio_rendiments_treball", 2),
+    ("cuota_irpf_anual", 2),
+    ("tipo_retencio", 2),
+    ("marginal_irpf_rate", 9),
+)
+_INT32 = struct.Struct("<i")
+_STANDARD_FAMILY = FamilySituation()
+
+
+def _profile_key(min_base: Decimal, indefinite: bool, catalunya: bool):
+    return (str(min_base), indefinite, catalunya)
+
+
+def standard_profiles(params=parameters.DEFAULT):
+    """(key, representative grup_cotitzacio, contract_type, region) for every distinct profile."""
+    groups = {}
+    for grup, min_base in params.ss_base_min_by_group.items():
+        groups.setdefault(min_base, grup)
+    return [
+        (_profile_key(min_base, contract == "indefinite", region == "Catalunya"), grup, contract, region)
+        for min_base, grup in groups.items()
+        for contract in ("indefinite", "temporary")
+        for region in ("Catalunya", "Espanya")
+    ]
+
+
+class LookupTables:
+    """Read-only view of a table file; `precomputed(...)` returns a row or None if not covered."""
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        with open(os.path.splitext(path)[0] + ".json") as f:
+            meta = json.load(f)
+        if meta["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported lookup table version {meta['version']}")
+        # Files written before the registry existed hold the only year there was
+        self.year = meta.get("year", parameters.DEFAULT_YEAR)
+        self._min_base_by_group = parameters.for_year(self.year).ss_base_min_by_group
+        self.min_gross = meta["min_gross"]
+        self.max_gross = meta["max_gross"]
+        self._rows = self.max_gross - self.min_gross + 1
+        self._minim = Decimal(meta["minim_personal_familiar"])
+        self._offsets = {
+            _profile_key(Decimal(p["min_base"]), p["indefinite"], p["catalunya"]): p["offset"]
+            for p in meta["profiles"]
+        }
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        self._map.close()
+
+    def precomputed(self, gross, grup_cotitzacio, contract_type, retribucio_en_especie_ann, other_deductions, fam, region, params=parameters.DEFAULT):
+        if params.year != self.year or retribucio_en_especie_ann or other_deductions:
+            return None
+        if gross != gross.to_integral_value() or not self.min_gross <= gross <= self.max_gross:
+            return None
+        # The family only reaches the stored stages through gastos (own disability) and the minimum
+        if fam.disability_percent_self >= 33 or fam.minimo_personal_familiar(params.minimos) != self._minim:
+            return None
+        min_base = self._min_base_by_group.get(grup_cotitzacio)
+        offset = self._offsets.get(_profile_key(min_base, contract_type == "indefinite", region == "Catalunya"))
+        if offset is None:
+            return None
+        row = int(gross) - self.min_gross
+        result = {"minim_personal_familiar": self._minim}
+        for i, (name, places) in enumerate(COLUMNS):
+            value, = _INT32.unpack_from(self._map, offset + (i * self._rows + row) * 4)
+            result[name] = Decimal(value).scaleb(-places)
+        return result
+
+
+def build(path=DEFAULT_PATH, max_gross=300000, verify_sample=2000, year=None):
+    """Compute every standard profile with the float engine, check it against Decimal, write it."""
+    import numpy as np
+    from batch_engine import perform_calculation_batch, verify_batch
+    from calculator import perform_calculation
+
+    params = parameters.for_year(year)
+    min_gross = 1
+    gross = np.arange(min_gross, max_gross + 1, dtype=float)
+    meta = {
+        "version": FORMAT_VERSION,
+        "year": params.year,
+        "min_gross": min_gross,
+        "max_gross": max_gross,
+        "columns": [{"name": name, "places": places, "dtype": "<i4"} for name, places in COLUMNS],
+        "minim_personal_familiar": str(_STANDARD_FAMILY.minimo_personal_familiar(params.minimos)),
+        "profiles": [],
+    }
+    offset = 0
+    with open(path, "wb") as out:
+        for key, grup, contract, region in standard_profiles(params):
+            # n_pagues does not affect the stored stages
+            args = (gross, 12, False, 0.0, grup, contract, 0.0, _STANDARD_FAMILY, region)
+            result = perform_calculation_batch(*args, params=params)
+            report = verify_batch(result, *args, perform_calculation, sample_size=verify_sample, seed=0, params=params)
+            if report["max_cent_deviation"] >= 0.5:
+                raise RuntimeError(f"float engine disagrees with Decimal for {key}: {report}")
+            for name, places in COLUMNS:
+                scaled = result[name] * 10 ** places
+                stored = np.rint(scaled)
+                if np.abs(scaled - stored).max() > 1e-3:
+                    raise RuntimeError(f"{name} needs more than {places} decimals for {key}")
+                out.write(stored.astype("<i4").tobytes())
+            meta["profiles"].append({
+                "min_base": key[0], "indefinite": key[1], "catalunya": key[2],
+                "grup_cotitzacio": grup, "contract_type": contract, "region": region, "offset": offset,
+            })
+            offset += len(COLUMNS) * len(gross) * 4
+            print(f"  {grup} / {contract} / {region}: max deviation {report['max_cent_deviation']:.2g} cents",
+                  file=sys.stderr)
+    with open(os.path.splitext(path)[0] + ".json", "w") as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+    return meta
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=DEFAULT_PATH, help="table file to write (metadata goes to the .json beside it)")
+    parser.add_argument("--max-gross", type=int, default=300000, help="last gross (whole euros) on the grid")
+    parser.add_argument("--verify-sample", type=int, default=2000, help="rows per profile re-checked on the Decimal path")
+    parser.add_argument("--year", type=int, default=parameters.DEFAULT_YEAR, help="tax year of the parameters")
+    args = parser.parse_args(argv)
+    meta = build(args.output, args.max_gross, args.verify_sample, args.year)
+    size = os.path.getsize(args.output)
+    print(f"wrote {meta['year']}: {len(meta['profiles'])} profiles x {meta['max_gross']} rows to {args.output} ({size / 2**20:.1f} MB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
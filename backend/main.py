@@ -1,16 +1,73 @@
+import time
+_IMPORT_STARTED = time.perf_counter()  # before the heavy imports, for the startup log line
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from decimal import Decimal
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional, Tuple
+from contextlib import asynccontextmanager
+from decimal import Decimal, ROUND_CEILING, ROUND_HALF_UP
+from functools import lru_cache, partial
+from types import SimpleNamespace
+import asyncio
 import base64
 import io
-from utils import FamilySituation, IRPFScale, calculate_base_imposable_irpf, apply_base_limits, round_euro, compute_reduction_by_work
-from variables import IRPF_SCALE_CATALUNYA, IRPF_SCALE_ESTATAL, SS_BASE_MIN_BY_GROUP, SS_BASE_MAX_MONTHLY, DEFAULT_SS_RATES, REDUCTION_WORK
-import viz_utils
-import matplotlib.pyplot as plt
+import json
+import logging
+import os
+import threading
+from utils import FamilySituation, round_euro, truncar
+from calculator import calculate, default_family, parse_family, perform_calculation, serialize_calculation
+import parameters
+from executor import BoundedExecutor, ExecutorBusy
+from chart_cache import chart_cache, chart_key, chart_spec, decode_chart_spec
+from chart_style import PIE_TITLES, pie_values_drawable
+from singleflight import SingleFlight, request_key
+import metrics
 
-app = FastAPI()
+# CPU-bound work (Decimal math, matplotlib) runs here, configured through CALC_* env vars
+executor = BoundedExecutor.from_env()
+
+# pyplot keeps global state, so figures are built and encoded one at a time per process
+_RENDER_LOCK = threading.Lock()
+
+# Reuse one pre-laid-out figure per chart kind and worker thread instead of rebuilding it per request
+CHART_TEMPLATES = os.environ.get("CHART_TEMPLATES", "1") != "0"
+
+# Renderer of the two pie charts: "matplotlib", or "svg" (svg_charts: SVG for plots="url", a PNG
+# drawn with Pillow where a PNG is needed)
+PIE_RENDERER = os.environ.get("PIE_RENDERER", "matplotlib")
+if PIE_RENDERER not in ("matplotlib", "svg"):
+    raise ValueError(f"Unknown PIE_RENDERER: {PIE_RENDERER}")
+
+# Identical /api/calculate and /api/increment requests in flight at the same time (a shared page
+# opened by many people at once) share one computation and its charts; "0" computes each one
+COALESCE_REQUESTS = os.environ.get("COALESCE_REQUESTS", "1") != "0"
+calculate_flights = SingleFlight("/api/calculate", COALESCE_REQUESTS)
+increment_flights = SingleFlight("/api/increment", COALESCE_REQUESTS)
+
+# Engine behind the chart series: "float" (vectorized float64, batch_engine) or "decimal"
+# (exact, one perform_calculation per grid point). Official figures always use the Decimal path.
+CHART_ENGINE = os.environ.get("CHART_ENGINE", "float")
+if CHART_ENGINE not in ("float", "decimal"):
+    raise ValueError(f"Unknown CHART_ENGINE: {CHART_ENGINE}")
+# Grid points per float chart series re-checked against the Decimal path (0 = off)
+CHART_VERIFY_SAMPLE = int(os.environ.get("CHART_VERIFY_SAMPLE", "0"))
+
+logger = logging.getLogger("uvicorn.error")
+
+@asynccontextmanager
+async def lifespan(app):
+    from startup_report import current_rss_bytes
+    logger.info(
+        "worker boot: %.0f ms since import, RSS %.1f MB (plotting and numpy load on first use)",
+        (time.perf_counter() - _IMPORT_STARTED) * 1000, current_rss_bytes() / 2**20,
+    )
+    yield
+    executor.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,10 +77,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def endpoint_label(path):
+    # Only registered routes get their own label, so scanners cannot blow up the series count;
+    # paths with a parameter (/api/charts/{chart_id}) are labelled with their template
+    if path in _ROUTE_PATHS:
+        return path
+    for prefix, template in _ROUTE_TEMPLATES:
+        if path.startswith(prefix) and "/" not in path[len(prefix):]:
+            return template
+    return "other"
+
+_ROUTE_PATHS = set()
+_ROUTE_TEMPLATES = []
+app.add_middleware(metrics.MetricsMiddleware, endpoint_label=endpoint_label)
+
 class SalaryRequest(BaseModel):
     gross: float
     region: str
-    n_pagues: int
+    n_pagues: int = Field(gt=0)
     pagues_prorratejades: bool
     retribucio_en_especie_ann: float
     grup_cotitzacio: str
@@ -37,279 +108,726 @@ class SalaryRequest(BaseModel):
     ascendents_ages: str
     disability_relatives_perc: str
     disability_relatives_help: str
+    # Tax year of the parameters (parameters.py); the default year if omitted
+    year: Optional[int] = None
+    # "png": base64 charts (default), "url": links to /api/charts, rendered on first fetch,
+    # "data": raw chart series, "none": numbers only
+    plots: Literal["none", "data", "png", "url"] = "png"
 
 class IncrementRequest(BaseModel):
     previous_gross: float
     new_gross: float
-    n_pagues: int
+    n_pagues: int = Field(gt=0)
     pagues_prorratejades: bool
     retribucio_en_especie_ann: float
     grup_cotitzacio: str
     contract_type: str
     other_deductions: float
     age: int
+    # Tax year of the parameters (parameters.py); the default year if omitted
+    year: Optional[int] = None
+    # Year for previous_gross, to compare the same salary across years (defaults to `year`)
+    previous_year: Optional[int] = None
+    plots: Literal["none", "data", "png", "url"] = "png"
 
-def fig_to_base64(fig):
+class RaiseLadderRequest(BaseModel):
+    base_gross: float
+    # Either an explicit list of raises or a range (raise_from..raise_to inclusive, every raise_step)
+    raises: Optional[List[float]] = None
+    raise_from: Optional[float] = None
+    raise_to: Optional[float] = None
+    raise_step: Optional[float] = None
+    unit: Literal["percent", "euro"] = "percent"
+    n_pagues: int = Field(gt=0)
+    pagues_prorratejades: bool
+    retribucio_en_especie_ann: float
+    grup_cotitzacio: str
+    contract_type: str
+    other_deductions: float
+    age: int
+    # Tax year of the parameters (parameters.py); the default year if omitted
+    year: Optional[int] = None
+
+class GrossForNetRequest(BaseModel):
+    # Exactly one target: net per month (12 equal months) or net per paga
+    net_monthly_equivalent: Optional[float] = None
+    net_per_paga: Optional[float] = None
+    region: str
+    n_pagues: int = Field(gt=0)
+    pagues_prorratejades: bool
+    retribucio_en_especie_ann: float
+    grup_cotitzacio: str
+    contract_type: str
+    other_deductions: float
+    age: int
+    disability_percent_self: int
+    disability_self_help: bool
+    children_ages: str
+    children_disabilities: str
+    ascendents_ages: str
+    disability_relatives_perc: str
+    disability_relatives_help: str
+    # Tax year of the parameters (parameters.py); the default year if omitted
+    year: Optional[int] = None
+
+class FamilySweepRequest(BaseModel):
+    gross: float
+    region: str
+    n_pagues: int = Field(gt=0)
+    pagues_prorratejades: bool
+    retribucio_en_especie_ann: float
+    grup_cotitzacio: str
+    contract_type: str
+    other_deductions: float
+    # Values to try for each family field; every combination is computed (one value keeps it fixed)
+    age: List[int] = [30]
+    children_ages: List[List[int]] = [[]]
+    children_disabilities: List[List[int]] = [[]]
+    ascendents_ages: List[List[int]] = [[]]
+    disability_percent_self: List[int] = [0]
+    disability_self_help: List[bool] = [False]
+    # (percentage, needs help) per relative
+    disability_relatives: List[List[Tuple[int, bool]]] = [[]]
+    # Tax year of the parameters (parameters.py); the default year if omitted
+    year: Optional[int] = None
+
+@lru_cache(maxsize=None)
+def load_plotting():
+    """
+    Import matplotlib (forcing the non-interactive Agg backend) and viz_utils on first use, so
+    workers that only serve numeric requests never pay for them. Returns (viz_utils, pyplot).
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import viz_utils
+    return viz_utils, plt
+
+def fig_to_png(fig):
+    _, plt = load_plotting()
     buf = io.BytesIO()
     fig.savefig(buf, format="png", bbox_inches="tight", facecolor="white", dpi=150)
-    buf.seek(0)
-    img_base64 = base64.b64encode(buf.read()).decode('utf-8')
     plt.close(fig)
-    return img_base64
+    return buf.getvalue()
 
-from utils import calcular_gastos_deducibles, calcular_cuota_retencion, redondear1, truncar, calcular_marginal_irpf, IRPFScale
+def fig_to_base64(fig):
+    return base64.b64encode(fig_to_png(fig)).decode('utf-8')
 
-def perform_calculation(gross, n_pagues, pagues_prorratejades, retribucio_en_especie_ann, grup_cotitzacio, contract_type, other_deductions, fam, region):
-    # ── Stage 1: SS base mensual ──────────────────────────────────────────────
-    gross_including_benefits = gross + retribucio_en_especie_ann
-    base_ss_mensual = apply_base_limits(
-        gross_including_benefits / 12,
-        SS_BASE_MIN_BY_GROUP[grup_cotitzacio],
-        SS_BASE_MAX_MONTHLY,
-    )
+def render_png(kind, build_fig):
+    with _RENDER_LOCK:
+        with metrics.timed(metrics.CHART_SECONDS, chart=kind, step="build"):
+            fig = build_fig()
+        with metrics.timed(metrics.CHART_SECONDS, chart=kind, step="png"):
+            return fig_to_png(fig)
 
-    # ── Stage 2: Cotitzacions SS mensuals ────────────────────────────────────
-    ss_atur_rate = (
-        DEFAULT_SS_RATES["unemployment_worker_indefinite"]
-        if contract_type == "indefinite"
-        else DEFAULT_SS_RATES["unemployment_worker_temporary"]
-    )
-    ss_contingencies_comunes_mensual = base_ss_mensual * DEFAULT_SS_RATES["contingencies_common_worker"]
-    ss_atur_mensual                  = base_ss_mensual * ss_atur_rate
-    ss_formacio_mensual              = base_ss_mensual * DEFAULT_SS_RATES["training_worker"]
-    ss_mei_mensual                   = base_ss_mensual * DEFAULT_SS_RATES["mei_worker"]
-    total_ss_mensual = (
-        ss_contingencies_comunes_mensual + ss_atur_mensual + ss_formacio_mensual + ss_mei_mensual
-    )
-    total_ss_anual = total_ss_mensual * 12
-
-    # ── Stage 3: Rendiment net del treball ───────────────────────────────────
-    rendiment_brut_treball = gross_including_benefits
-    gastos_deducibles = calcular_gastos_deducibles(
-        rendiment_brut_treball,
-        total_ss_anual,
-        False,
-        fam.disability_percent_self >= 33 and fam.disability_percent_self < 65,
-        fam.disability_percent_self >= 65,
-        "ACTIVO",
-    )
-    rendiment_net_treball = rendiment_brut_treball - total_ss_anual - gastos_deducibles - other_deductions
-
-    # ── Stage 4: Reducció per rendiments del treball (art. 20 LIRPF) ─────────
-    reduccio_rendiments_treball = compute_reduction_by_work(rendiment_net_treball)
-
-    # ── Stage 5: Base imposable ───────────────────────────────────────────────
-    base_imponible = max(rendiment_net_treball - reduccio_rendiments_treball, Decimal("0"))
-
-    # ── Stage 6: Escala IRPF + quota ─────────────────────────────────────────
-    if region == "Catalunya":
-        escala_irpf = IRPFScale.combined_scale(IRPF_SCALE_CATALUNYA, IRPF_SCALE_ESTATAL)
-    else:  # Mitjana espanyola: state scale counts twice (no regional deviation)
-        escala_irpf = IRPFScale.combined_scale(IRPF_SCALE_ESTATAL, IRPF_SCALE_ESTATAL)
-    minim_personal_familiar = fam.minimo_personal_familiar()
-    cuota_irpf_anual = redondear1(calcular_cuota_retencion(base_imponible, minim_personal_familiar, escala=escala_irpf))
-
-    # ── Stage 7: Tipo de retención (%) ───────────────────────────────────────
-    tipo_retencio = (
-        truncar((cuota_irpf_anual / gross_including_benefits) * Decimal("100"))
-        if gross_including_benefits > 0
-        else Decimal("0.00")
+def render_chart_bytes(kind, inputs, fmt="png"):
+    """The chart as PNG or SVG bytes; pies drawn by svg_charts (PIE_RENDERER=svg, or any SVG) skip matplotlib."""
+    series = pie_series(kind, inputs) if fmt == "svg" or PIE_RENDERER == "svg" else None
+    if series is None:
+        if fmt == "svg":
+            raise ValueError(f"No SVG rendering of {kind} for these inputs")
+        return render_png(kind, chart_builder(kind, inputs))
+    import svg_charts
+    with metrics.timed(metrics.CHART_SECONDS, chart=kind, step=fmt):
+        if fmt == "svg":
+            return svg_charts.net_pay_and_taxes_svg(series, *PIE_TITLES[kind]).encode("utf-8")
+        return svg_charts.net_pay_and_taxes_png(series, *PIE_TITLES[kind])
+
+def render_chart(kind, inputs):
+    """
+    Base64 PNG for a chart, served from `chart_cache` when the same `inputs` were already
+    rendered; only a miss draws it.
+    """
+    key = chart_key(kind, inputs)
+    png = chart_cache.get(key)
+    if png is None:
+        png = render_chart_bytes(kind, inputs)
+        chart_cache.put(key, png)
+    with metrics.timed(metrics.CHART_SECONDS, chart=kind, step="base64"):
+        return base64.b64encode(png).decode('utf-8')
+
+def chart_url(kind, inputs):
+    """Link to the chart on /api/charts: its content hash, plus the inputs to render it on first fetch."""
+    fmt = "svg" if PIE_RENDERER == "svg" and pie_series(kind, inputs) is not None else "png"
+    key, spec = chart_spec(kind, inputs, fmt)
+    return f"/api/charts/{key}?spec={spec}"
+
+def increment_pie_calcs(inputs):
+    """(prev, new) stand-ins with the fields plot_increment_difference_pie reads, from its chart inputs."""
+    from chart_data import INCREMENT_PIE_KEYS
+    prev = SimpleNamespace(**{k: inputs[k][0] for k in INCREMENT_PIE_KEYS})
+    new = SimpleNamespace(**{k: inputs[k][1] for k in INCREMENT_PIE_KEYS}, n_pagues=inputs["n_pagues"])
+    return prev, new
+
+def pie_series(kind, inputs):
+    """Wedge values of a pie chart, or None for other charts and for values a pie cannot show."""
+    from chart_data import increment_difference_args, net_pay_and_taxes_series
+    if kind == "net_pay_and_taxes":
+        series = net_pay_and_taxes_series(*inputs)
+    elif kind == "increment_difference_pie":
+        series = net_pay_and_taxes_series(*increment_difference_args(*increment_pie_calcs(inputs)))
+    else:
+        return None
+    return series if all(pie_values_drawable(series[p]["values"]) for p in ("main", "breakdown")) else None
+
+def chart_builder(kind, inputs):
+    """Zero-argument figure builder for a chart's `inputs` (as passed to render_chart)."""
+    viz_utils, _ = load_plotting()
+    if kind == "net_pay_and_taxes":
+        return lambda: viz_utils.plot_net_pay_and_taxes(*inputs, return_fig=True, template=CHART_TEMPLATES)
+    if kind == "salary_blocks":
+        # its series depend on the year's parameters, not only on the arguments
+        blocks_args, year = inputs
+        compute, compute_batch = chart_calculations(year)
+        return lambda: viz_utils.plot_salary_blocks(*blocks_args, compute, return_fig=True,
+                                                    compute_net_pay_batch=compute_batch,
+                                                    template=CHART_TEMPLATES)
+    if kind == "increment_difference_pie":
+        prev, new = increment_pie_calcs(inputs)
+        return lambda: viz_utils.plot_increment_difference_pie(prev, new, return_fig=True, template=CHART_TEMPLATES)
+    raise ValueError(f"Unknown chart {kind!r}")
+
+def _spec_decimal(value):
+    # Specs come from the URL, so anyone can craft one: only finite amounts are accepted
+    number = Decimal(value)
+    if not number.is_finite():
+        raise ValueError(f"Not a finite amount: {value!r}")
+    return number
+
+def chart_inputs_from_json(kind, inputs):
+    """The chart inputs back from the JSON of a chart spec (Decimals, FamilySituation)."""
+    if kind == "net_pay_and_taxes":
+        gross, net, n_pagues, *annual = inputs
+        return (_spec_decimal(gross), _spec_decimal(net), int(n_pagues), *map(_spec_decimal, annual))
+    if kind == "salary_blocks":
+        (gross, n_pagues, prorratejades, especie, grup, contract, fam, region, other), year = inputs
+        blocks_args = (_spec_decimal(gross), int(n_pagues), bool(prorratejades), _spec_decimal(especie), grup, contract,
+                       FamilySituation(**fam), region, _spec_decimal(other))
+        return blocks_args, int(year)
+    if kind == "increment_difference_pie":
+        return {k: v if k == "n_pagues" else tuple(map(_spec_decimal, v)) for k, v in inputs.items()}
+    raise ValueError(f"Unknown chart {kind!r}")
+
+def build_family_situation(data: SalaryRequest) -> FamilySituation:
+    """Shared FamilySituation for the request's family fields, parsed once per distinct profile."""
+    return parse_family(family_key(data))
+
+def family_key(data: SalaryRequest):
+    return (
+        data.age, data.disability_percent_self, data.disability_self_help, data.children_ages,
+        data.children_disabilities, data.ascendents_ages, data.disability_relatives_perc, data.disability_relatives_help,
     )
 
-    # ── Stage 8: Marginal IRPF rate ──────────────────────────────────────────
-    # Chain rule: d(cuota)/d(gross) = bracket_rate × d(base_imponible)/d(gross)
-    r_bracket = escala_irpf.rate_at(base_imponible)
-    ss_total_rate = (
-        DEFAULT_SS_RATES["contingencies_common_worker"]
-        + ss_atur_rate
-        + DEFAULT_SS_RATES["training_worker"]
-        + DEFAULT_SS_RATES["mei_worker"]
+def calculate_from_request(data: SalaryRequest, fam: FamilySituation):
+    return calculate(
+        Decimal(str(data.gross)), data.n_pagues, data.pagues_prorratejades, Decimal(str(data.retribucio_en_especie_ann)),
+        data.grup_cotitzacio, data.contract_type, Decimal(str(data.other_deductions)), fam, data.region,
+        parameters.for_year(data.year),
     )
-    ss_is_capped = (gross_including_benefits / 12 >= SS_BASE_MAX_MONTHLY)
-    d_rnt_d_gross = Decimal("1.00") if ss_is_capped else (Decimal("1.00") - ss_total_rate)
-    # derivative of reduction-by-work w.r.t. rendiment_net_treball
-    rn = rendiment_net_treball
-    if rn <= REDUCTION_WORK["upper1"]:
-        r_red = Decimal("0.00")
-    elif rn <= REDUCTION_WORK["upper2"]:
-        r_red = -REDUCTION_WORK["coef2"]
-    elif rn <= REDUCTION_WORK["upper3"]:
-        r_red = -REDUCTION_WORK["coef3"]
+
+def check_years(*years):
+    """422 for a year without registered parameters, before any work is queued."""
+    for year in years:
+        try:
+            parameters.for_year(year)
+        except ValueError as exc:
+            raise HTTPException(status_code=422, detail=str(exc))
+
+async def run_cpu(fn, *args):
+    """Run `fn` on the bounded executor, mapping saturation to 503 and slowness to 504."""
+    try:
+        return await executor.run(fn, *args)
+    except ExecutorBusy:
+        raise HTTPException(
+            status_code=503, detail="Server busy, retry later",
+            headers={"Retry-After": str(executor.retry_after)},
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Calculation timed out")
+
+def compute_salary_response(data: SalaryRequest):
+    fam = build_family_situation(data)
+    calc = calculate_from_request(data, fam)
+
+    response = serialize_calculation(calc)
+    # Step 2: Add the charts (pie + plot_salary_blocks), as images or as raw series
+    if data.plots == "png":
+        response["plots"] = render_salary_plots(calc)
+    elif data.plots == "url":
+        response["plots"] = [chart_url(kind, inputs) for kind, inputs in salary_charts(calc)]
     else:
-        r_red = Decimal("0.00")
-    d_base_d_gross = d_rnt_d_gross * (Decimal("1.00") - r_red)
-    marginal_irpf = r_bracket * d_base_d_gross if cuota_irpf_anual > Decimal("0.00") else Decimal("0.00")
-    marginal_irpf_percent = truncar(marginal_irpf * Decimal("100"))
-
-    # ── Stage 9: Per paga ────────────────────────────────────────────────────
-    # SS is distributed proportionally across n_pagues so net_monthly_equivalent
-    # stays invariant of n_pagues (same annual money, just split differently).
-    gross_per_paga = gross_including_benefits / Decimal(n_pagues)
-    ss_per_paga    = total_ss_anual / Decimal(n_pagues)
-    irpf_per_paga  = cuota_irpf_anual / Decimal(n_pagues)
-    net_per_paga   = gross_per_paga - ss_per_paga - irpf_per_paga
-    net_monthly_equivalent = (gross_including_benefits - total_ss_anual - cuota_irpf_anual) / Decimal(12)
+        response["plots"] = []
+    if data.plots == "data":
+        response["plot_data"] = salary_plot_data(calc)
+    return response
 
-    return {
-        # ── SS breakdown ─────────────────────────────────────────────────────
-        "base_ss_mensual":                  base_ss_mensual,
-        "ss_contingencies_comunes_mensual": ss_contingencies_comunes_mensual,
-        "ss_atur_mensual":                  ss_atur_mensual,
-        "ss_formacio_mensual":              ss_formacio_mensual,
-        "ss_mei_mensual":                   ss_mei_mensual,
-        "total_ss_mensual":                 total_ss_mensual,
-        "total_ss_anual":                   total_ss_anual,
-        # ── IRPF chain ───────────────────────────────────────────────────────
-        "rendiment_brut_treball":      rendiment_brut_treball,
-        "gastos_deducibles":           gastos_deducibles,
-        "rendiment_net_treball":       rendiment_net_treball,
-        "reduccio_rendiments_treball": reduccio_rendiments_treball,
-        "base_imponible":              base_imponible,
-        "minim_personal_familiar":     minim_personal_familiar,
-        "cuota_irpf_anual":            cuota_irpf_anual,
-        "tipo_retencio":               tipo_retencio,
-        # ── Marginal ─────────────────────────────────────────────────────────
-        "marginal_irpf_rate":    marginal_irpf,
-        "marginal_irpf_percent": marginal_irpf_percent,
-        # ── Per paga ─────────────────────────────────────────────────────────
-        "gross_per_paga":         redondear1(gross_per_paga),
-        "ss_per_paga":            redondear1(ss_per_paga),
-        "irpf_per_paga":          redondear1(irpf_per_paga),
-        "net_per_paga":           redondear1(net_per_paga),
-        "net_monthly_equivalent": redondear1(net_monthly_equivalent),
-        # ── Pass-through for viz_utils (legacy keys kept for compatibility) ──
-        "gross_including_benefits":  gross_including_benefits,
-        "n_pagues":                  n_pagues,
-        "pagues_prorratejades":      pagues_prorratejades,
-        "retribucio_en_especie_ann": retribucio_en_especie_ann,
-        "grup_cotitzacio":           grup_cotitzacio,
-        "contract_type":             contract_type,
-        "other_deductions":          other_deductions,
-        "fam":                       fam,
-        # legacy names used by viz_utils
-        "cotitzacions_mensuals":               total_ss_mensual,
-        "cotitzacions_anuals":                 total_ss_anual,
-        "irpf_anual":                          cuota_irpf_anual,
-        "ss_contingencies_comunes_monthly":    ss_contingencies_comunes_mensual,
-        "t_des_monthly":                       ss_atur_mensual,
-        "ss_training_monthly":                 ss_formacio_mensual,
-        "ss_mei_monthly":                      ss_mei_mensual,
-        "otros_gastos_generales":              gastos_deducibles,
-        "reduction_by_work":                   reduccio_rendiments_treball,
-    }
+def compact_series(value):
+    # Round floats to cents so "data" payloads stay small
+    if isinstance(value, float):
+        return round(value, 2)
+    if isinstance(value, dict):
+        return {k: compact_series(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [compact_series(v) for v in value]
+    return value
 
-@app.post("/api/calculate")
-async def calculate_salary(data: SalaryRequest):
-    gross = Decimal(str(data.gross))
-    n_pagues = data.n_pagues
-    pagues_prorratejades = data.pagues_prorratejades
-    retribucio_en_especie_ann = Decimal(str(data.retribucio_en_especie_ann))
-    grup_cotitzacio = data.grup_cotitzacio
-    contract_type = data.contract_type
-    other_deductions = Decimal(str(data.other_deductions))
-    age = data.age
-    region = data.region
-    disability_percent_self = data.disability_percent_self
-    disability_self_help = data.disability_self_help
-    def parse_int_list(s):
-        return [int(x.strip()) for x in s.split(',') if x.strip() != ''] if s else []
-    def parse_bool_list(s):
-        return [x.strip().lower() in ("true","1","yes") for x in s.split(',') if x.strip() != ''] if s else []
-    children_ages = parse_int_list(data.children_ages)
-    children_disabilities = parse_int_list(data.children_disabilities)
-    ascendents_ages = parse_int_list(data.ascendents_ages)
-    disability_relatives_perc = parse_int_list(data.disability_relatives_perc)
-    disability_relatives_help = parse_bool_list(data.disability_relatives_help)
-    while len(disability_relatives_help) < len(disability_relatives_perc):
-        disability_relatives_help.append(False)
-    disability_relatives = list(zip(disability_relatives_perc, disability_relatives_help))
-    fam = FamilySituation(
-        age=age,
-        children_ages=children_ages,
-        children_disabilities=children_disabilities,
-        ascendents_ages=ascendents_ages,
-        disability_percent_self=disability_percent_self,
-        disability_self_help=disability_self_help,
-        disability_relatives=disability_relatives
+def salary_pie_args(calc):
+    n = Decimal(calc.n_pagues)
+    return (
+        calc.gross_including_benefits, calc.net_per_paga, calc.n_pagues, calc.total_ss_anual, calc.cuota_irpf_anual,
+        calc.ss_contingencies_comunes_mensual * n, calc.ss_atur_mensual * n,
+        calc.ss_formacio_mensual * n, calc.ss_mei_mensual * n,
     )
-    calc = perform_calculation(
-        gross, n_pagues, pagues_prorratejades, retribucio_en_especie_ann, grup_cotitzacio, contract_type, other_deductions, fam, region
+
+def salary_blocks_args(calc):
+    return (
+        calc.gross_including_benefits, calc.n_pagues, calc.pagues_prorratejades, calc.retribucio_en_especie_ann, calc.grup_cotitzacio,
+        calc.contract_type, calc.fam, "catalunya", calc.other_deductions,
     )
 
-    # Step 2: Add the bar chart plot (plot_salary_blocks)
-    figs = []
-    # Pie chart
-    fig1 = viz_utils.plot_net_pay_and_taxes(
-        calc["gross_including_benefits"], calc["net_per_paga"], calc["n_pagues"], calc["cotitzacions_anuals"], calc["irpf_anual"],
-        calc["ss_contingencies_comunes_monthly"] * Decimal(calc["n_pagues"]), calc["t_des_monthly"] * Decimal(calc["n_pagues"]),
-        calc["ss_training_monthly"] * Decimal(calc["n_pagues"]), calc["ss_mei_monthly"] * Decimal(calc["n_pagues"]), return_fig=True)
-    figs.append(fig_to_base64(fig1))
-    # Bar chart
-    fig2 = viz_utils.plot_salary_blocks(
-        calc["gross_including_benefits"], calc["n_pagues"], calc["pagues_prorratejades"], calc["retribucio_en_especie_ann"], calc["grup_cotitzacio"],
-        calc["contract_type"], calc["fam"], "catalunya", calc["other_deductions"], perform_calculation, return_fig=True)
-    figs.append(fig_to_base64(fig2))
+def chart_batch_engine():
+    """Batch function for the chart series, or None to sample the Decimal path point by point."""
+    if CHART_ENGINE == "decimal":
+        return None
+    if CHART_VERIFY_SAMPLE:
+        return verified_calculation_batch
+    from batch_engine import perform_calculation_batch
+    return perform_calculation_batch
 
-    return {
-        # ── SS breakdown ────────────────────────────────────────────────────
-        "base_ss_mensual":                  float(round_euro(calc["base_ss_mensual"])),
-        "ss_contingencies_comunes_mensual": float(round_euro(calc["ss_contingencies_comunes_mensual"])),
-        "ss_atur_mensual":                  float(round_euro(calc["ss_atur_mensual"])),
-        "ss_formacio_mensual":              float(round_euro(calc["ss_formacio_mensual"])),
-        "ss_mei_mensual":                   float(round_euro(calc["ss_mei_mensual"])),
-        "total_ss_mensual":                 float(round_euro(calc["total_ss_mensual"])),
-        "total_ss_anual":                   float(round_euro(calc["total_ss_anual"])),
-        # ── IRPF chain ──────────────────────────────────────────────────────
-        "rendiment_brut_treball":      float(round_euro(calc["rendiment_brut_treball"])),
-        "gastos_deducibles":           float(round_euro(calc["gastos_deducibles"])),
-        "rendiment_net_treball":       float(round_euro(calc["rendiment_net_treball"])),
-        "reduccio_rendiments_treball": float(round_euro(calc["reduccio_rendiments_treball"])),
-        "base_imponible":              float(round_euro(calc["base_imponible"])),
-        "minim_personal_familiar":     float(round_euro(calc["minim_personal_familiar"])),
-        "cuota_irpf_anual":            float(round_euro(calc["cuota_irpf_anual"])),
-        "tipo_retencio":               float(calc["tipo_retencio"]),
-        # ── Marginal ────────────────────────────────────────────────────────
-        "marginal_irpf_rate":    float(calc["marginal_irpf_rate"]),
-        "marginal_irpf_percent": float(calc["marginal_irpf_percent"]),
-        # ── Per paga ────────────────────────────────────────────────────────
-        "gross_per_paga":             float(round_euro(calc["gross_per_paga"])),
-        "ss_per_paga":                float(round_euro(calc["ss_per_paga"])),
-        "irpf_per_paga":              float(round_euro(calc["irpf_per_paga"])),
-        "sou_net_per_paga":           float(round_euro(calc["net_per_paga"])),
-        "sou_net_mensual_equivalent": float(round_euro(calc["net_monthly_equivalent"])),
-        # legacy aliases kept for backward compatibility
-        "irpf_anual":         float(round_euro(calc["cuota_irpf_anual"])),
-        "cotitzacions_anuals": float(round_euro(calc["total_ss_anual"])),
-        # ── Charts ──────────────────────────────────────────────────────────
-        "plots": figs,
-    }
+def chart_calculations(year):
+    """(scalar, batch) calculation functions behind the chart series, for the parameters of `year`."""
+    batch = chart_batch_engine()
+    params = parameters.for_year(year)
+    if params is parameters.DEFAULT:
+        return perform_calculation, batch
+    return partial(perform_calculation, params=params), batch and partial(batch, params=params)
 
+def verified_calculation_batch(*args, params=None):
+    """perform_calculation_batch, with a sample of rows re-checked on the Decimal path."""
+    from batch_engine import perform_calculation_batch, verify_batch
+    result = perform_calculation_batch(*args, params=params)
+    report = verify_batch(result, *args, partial(perform_calculation, params=params), sample_size=CHART_VERIFY_SAMPLE)
+    metrics.FLOAT_DEVIATION_CENTS.observe(report["max_cent_deviation"])
+    if report["max_cent_deviation"] >= 1:
+        logger.warning("float chart engine off by %.2f cents in %s at gross %.2f",
+                       report["max_cent_deviation"], report["column"], report["gross"])
+    return result
 
-@app.post("/api/increment")
-async def calculate_increment(data: IncrementRequest):
+def salary_plot_data(calc):
+    from chart_data import net_pay_and_taxes_series, salary_blocks_series
+    compute, compute_batch = chart_calculations(calc.year)
+    return compact_series({
+        "net_pay_and_taxes": net_pay_and_taxes_series(*salary_pie_args(calc)),
+        "salary_blocks": salary_blocks_series(*salary_blocks_args(calc), compute, compute_net_pay_batch=compute_batch),
+    })
+
+def salary_charts(calc):
+    """(kind, inputs) of the charts of /api/calculate: the pie and the bar chart."""
+    return [
+        ("net_pay_and_taxes", salary_pie_args(calc)),
+        ("salary_blocks", (salary_blocks_args(calc), calc.year)),
+    ]
+
+def render_salary_plots(calc):
+    return [render_chart(kind, inputs) for kind, inputs in salary_charts(calc)]
+
+@app.post("/api/calculate")
+async def calculate_salary(data: SalaryRequest):
+    check_years(data.year)
+    return await calculate_flights.run(request_key(data), run_cpu, compute_salary_response, data)
+
+
+def compute_increment_response(data: IncrementRequest):
     # Use default FamilySituation and region for increment calculation
-    fam = FamilySituation(age=data.age)
+    fam = default_family(data.age)
     region = "Catalunya"
-    prev = perform_calculation(
+    params = parameters.for_year(data.year)
+    previous_params = params if data.previous_year is None else parameters.for_year(data.previous_year)
+    prev = calculate(
         Decimal(str(data.previous_gross)), data.n_pagues, data.pagues_prorratejades, Decimal(str(data.retribucio_en_especie_ann)),
-        data.grup_cotitzacio, data.contract_type, Decimal(str(data.other_deductions)), fam, region)
-    new = perform_calculation(
+        data.grup_cotitzacio, data.contract_type, Decimal(str(data.other_deductions)), fam, region, previous_params)
+    new = calculate(
         Decimal(str(data.new_gross)), data.n_pagues, data.pagues_prorratejades, Decimal(str(data.retribucio_en_especie_ann)),
-        data.grup_cotitzacio, data.contract_type, Decimal(str(data.other_deductions)), fam, region)
+        data.grup_cotitzacio, data.contract_type, Decimal(str(data.other_deductions)), fam, region, params)
     n = Decimal(data.n_pagues)
-    increment_annual_net  = (new["net_per_paga"]       - prev["net_per_paga"])       * n
-    increment_monthly_net =  new["net_monthly_equivalent"] - prev["net_monthly_equivalent"]
-    increment_annual_ss   = (new["cotitzacions_anuals"] - prev["cotitzacions_anuals"])
-    increment_annual_irpf = (new["cuota_irpf_anual"]   - prev["cuota_irpf_anual"])
-    increment_annual_brut = (new["gross_including_benefits"] - prev["gross_including_benefits"])
-    # Pie chart for the difference
-    fig = viz_utils.plot_increment_difference_pie(prev, new, return_fig=True)
-    pie_base64 = fig_to_base64(fig)
-    return {
+    increment_annual_net  = (new.net_per_paga       - prev.net_per_paga)       * n
+    increment_monthly_net =  new.net_monthly_equivalent - prev.net_monthly_equivalent
+    increment_annual_ss   = (new.total_ss_anual      - prev.total_ss_anual)
+    increment_annual_irpf = (new.cuota_irpf_anual   - prev.cuota_irpf_anual)
+    increment_annual_brut = (new.gross_including_benefits - prev.gross_including_benefits)
+    response = {
         "increment_annual_net":  float(round_euro(increment_annual_net)),
         "increment_monthly_net": float(round_euro(increment_monthly_net)),
         "increment_annual_brut": float(round_euro(increment_annual_brut)),
         "increment_annual_ss":   float(round_euro(increment_annual_ss)),
         "increment_annual_irpf": float(round_euro(increment_annual_irpf)),
-        "increment_pie": pie_base64
+        "increment_pie": None,
     }
+    # Pie chart for the difference
+    if data.plots in ("png", "url"):
+        from chart_data import INCREMENT_PIE_KEYS, increment_difference_args, net_pay_and_taxes_series
+        # A pay cut (or no change) has negative or zero wedges: no pie, rather than a link that cannot render
+        series = net_pay_and_taxes_series(*increment_difference_args(prev, new))
+        if not all(pie_values_drawable(series[part]["values"]) for part in ("main", "breakdown")):
+            return response
+        pie_inputs = {k: (getattr(prev, k), getattr(new, k)) for k in INCREMENT_PIE_KEYS}
+        pie_inputs["n_pagues"] = new.n_pagues
+        if data.plots == "url":
+            response["increment_pie"] = chart_url("increment_difference_pie", pie_inputs)
+        else:
+            response["increment_pie"] = render_chart("increment_difference_pie", pie_inputs)
+    elif data.plots == "data":
+        from chart_data import increment_difference_args, net_pay_and_taxes_series
+        response["increment_pie_data"] = compact_series(net_pay_and_taxes_series(*increment_difference_args(prev, new)))
+    return response
+
+@app.post("/api/increment")
+async def calculate_increment(data: IncrementRequest):
+    check_years(data.year, data.previous_year)
+    return await increment_flights.run(request_key(data), run_cpu, compute_increment_response, data)
+
+MAX_LADDER_STEPS = 1000
+
+def ladder_raises(data: RaiseLadderRequest):
+    """The raises requested, as Decimals, from the explicit list or the range."""
+    if data.raises is not None:
+        raises = [Decimal(str(r)) for r in data.raises]
+    else:
+        if data.raise_from is None or data.raise_to is None or not data.raise_step or data.raise_step <= 0:
+            raise ValueError("Give raises, or raise_from, raise_to and a positive raise_step")
+        start, stop, step = (Decimal(str(v)) for v in (data.raise_from, data.raise_to, data.raise_step))
+        count = int((stop - start) / step) + 1
+        if count > MAX_LADDER_STEPS:
+            raise ValueError(f"At most {MAX_LADDER_STEPS} raises per ladder")
+        raises = [start + i * step for i in range(max(count, 0))]
+    if not raises or len(raises) > MAX_LADDER_STEPS:
+        raise ValueError(f"Give between 1 and {MAX_LADDER_STEPS} raises")
+    return raises
+
+def compute_raise_ladder_response(data: RaiseLadderRequest, raises):
+    import numpy as np
+    from batch_engine import perform_calculation_batch
+    # Same profile as /api/increment: default FamilySituation, Catalunya
+    fam = default_family(data.age)
+    region = "Catalunya"
+    params = parameters.for_year(data.year)
+    especie, other = Decimal(str(data.retribucio_en_especie_ann)), Decimal(str(data.other_deductions))
+    base_gross = Decimal(str(data.base_gross))
+    base = calculate(base_gross, data.n_pagues, data.pagues_prorratejades, especie,
+                     data.grup_cotitzacio, data.contract_type, other, fam, region, params)
+    if data.unit == "percent":
+        new_gross = [(base_gross * (1 + r / 100)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP) for r in raises]
+    else:
+        new_gross = [base_gross + r for r in raises]
+
+    # Every step in one vectorized pass; its money columns match the Decimal path to the cent
+    steps = perform_calculation_batch(
+        np.array([float(g) for g in new_gross]), data.n_pagues, data.pagues_prorratejades, float(especie),
+        data.grup_cotitzacio, data.contract_type, float(other), fam, region, params=params)
+
+    def column(key):
+        return [Decimal(repr(float(v))) for v in steps[key]]
+
+    n = Decimal(data.n_pagues)
+    rows = zip(raises, new_gross, column("net_per_paga"), column("net_monthly_equivalent"), column("total_ss_anual"),
+               column("cuota_irpf_anual"), column("gross_including_benefits"), column("marginal_irpf_percent"))
+    ladder = []
+    for raise_, gross, net_per_paga, net_monthly, ss, irpf, brut, marginal_percent in rows:
+        increment_annual_brut = brut - base.gross_including_benefits
+        increment_annual_ss   = ss - base.total_ss_anual
+        increment_annual_irpf = irpf - base.cuota_irpf_anual
+        # Share of the raise that goes to IRPF and SS
+        retention_on_raise = (
+            truncar((increment_annual_ss + increment_annual_irpf) / increment_annual_brut * 100)
+            if increment_annual_brut else Decimal("0.00")
+        )
+        ladder.append({
+            "raise":                  float(raise_),
+            "new_gross":              float(gross),
+            "increment_annual_net":   float(round_euro((net_per_paga - base.net_per_paga) * n)),
+            "increment_monthly_net":  float(round_euro(net_monthly - base.net_monthly_equivalent)),
+            "increment_annual_brut":  float(round_euro(increment_annual_brut)),
+            "increment_annual_ss":    float(round_euro(increment_annual_ss)),
+            "increment_annual_irpf":  float(round_euro(increment_annual_irpf)),
+            "marginal_irpf_percent":  float(marginal_percent),
+            "retention_on_raise_percent": float(retention_on_raise),
+        })
+    return {
+        "base": {
+            "gross":                      float(base_gross),
+            "sou_net_per_paga":           float(round_euro(base.net_per_paga)),
+            "sou_net_mensual_equivalent": float(round_euro(base.net_monthly_equivalent)),
+            "irpf_anual":                 float(round_euro(base.cuota_irpf_anual)),
+            "cotitzacions_anuals":        float(round_euro(base.total_ss_anual)),
+            "marginal_irpf_percent":      float(base.marginal_irpf_percent),
+        },
+        "unit": data.unit,
+        "year": params.year,
+        "steps": ladder,
+    }
+
+@app.post("/api/increment/ladder")
+async def calculate_raise_ladder(data: RaiseLadderRequest):
+    check_years(data.year)
+    try:
+        raises = ladder_raises(data)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    return await run_cpu(compute_raise_ladder_response, data, raises)
+
+
+# redondear1 adds 0.00001 and rounds half up, so a net rounds up to `target` from this far below
+_NET_ROUNDING_SLACK = Decimal("0.00501")
+_CENT = Decimal("0.01")
+# Steps of one cent allowed when correcting the piecewise-linear candidate on the exact path
+_GROSS_SEARCH_STEPS = 200
+
+def compute_gross_for_net_response(data: GrossForNetRequest):
+    from piecewise import compile_profile
+    if data.net_monthly_equivalent is not None:
+        target_key, target, periods = "net_monthly_equivalent", Decimal(str(data.net_monthly_equivalent)), Decimal(12)
+    else:
+        target_key, target, periods = "net_per_paga", Decimal(str(data.net_per_paga)), Decimal(data.n_pagues)
+
+    fam = build_family_situation(data)
+    params = parameters.for_year(data.year)
+    especie, other = Decimal(str(data.retribucio_en_especie_ann)), Decimal(str(data.other_deductions))
+    profile = compile_profile(data.n_pagues, especie, data.grup_cotitzacio, data.contract_type, other, fam, data.region, params)
+
+    def calculate_at(gross):
+        return calculate(gross, data.n_pagues, data.pagues_prorratejades, especie,
+                         data.grup_cotitzacio, data.contract_type, other, fam, data.region, params)
+
+    # One pass through the inverted pipeline, then settle the last cents against the exact path
+    gross = max(profile.gross_for_net((target - _NET_ROUNDING_SLACK) * periods), _CENT)
+    gross = gross.quantize(_CENT, rounding=ROUND_CEILING)
+    calc = calculate_at(gross)
+    for _ in range(_GROSS_SEARCH_STEPS):
+        if getattr(calc, target_key) >= target:
+            if gross <= _CENT:
+                break
+            below = calculate_at(gross - _CENT)
+            if getattr(below, target_key) < target:
+                break
+            gross, calc = gross - _CENT, below
+        else:
+            gross += _CENT
+            calc = calculate_at(gross)
+    if getattr(calc, target_key) < target:
+        raise ValueError(f"No gross salary reaches {target_key} {target}")
+
+    response = serialize_calculation(calc)
+    response["gross"] = float(gross)
+    return response
+
+@app.post("/api/gross-for-net")
+async def gross_for_net(data: GrossForNetRequest):
+    if (data.net_monthly_equivalent is None) == (data.net_per_paga is None):
+        raise HTTPException(status_code=422, detail="Give exactly one of net_monthly_equivalent or net_per_paga")
+    check_years(data.year)
+    try:
+        return await run_cpu(compute_gross_for_net_response, data)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+MAX_FAMILY_COMBINATIONS = 10000
+
+def family_sweep_axes(data: FamilySweepRequest):
+    """{field: values} of the sweep, checked against MAX_FAMILY_COMBINATIONS."""
+    from batch_engine import FAMILY_AXES
+    axes = {name: getattr(data, name) for name in FAMILY_AXES}
+    combinations = 1
+    for name, values in axes.items():
+        if not values:
+            raise ValueError(f"{name}: give at least one value")
+        combinations *= len(values)
+    if combinations > MAX_FAMILY_COMBINATIONS:
+        raise ValueError(f"At most {MAX_FAMILY_COMBINATIONS} family combinations per sweep, got {combinations}")
+    return axes
+
+def compute_family_sweep_response(data: FamilySweepRequest, axes):
+    import numpy as np
+    from itertools import product
+    from batch_engine import minimo_grid
+    params = parameters.for_year(data.year)
+    gross, especie, other = (Decimal(str(v)) for v in (data.gross, data.retribucio_en_especie_ann, data.other_deductions))
+
+    # Minimums of the whole grid in one pass. Besides the minimum, only the taxpayer's disability
+    # grade changes the result (deductible expenses, stage 3), so combinations with the same grade
+    # and minimum share one exact calculation.
+    minimos = minimo_grid(axes, params.minimos)
+    grades = np.array([0 if p < 33 else 1 if p < 65 else 2 for p in axes["disability_percent_self"]])
+    shape = [1] * minimos.ndim
+    shape[list(axes).index("disability_percent_self")] = -1
+    grades = np.broadcast_to(grades.reshape(shape), minimos.shape)
+    keys = np.stack([grades.ravel(), minimos.ravel()], axis=1)
+    _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+
+    combinations = list(product(*axes.values()))
+    results = []
+    for i in first:
+        fam = FamilySituation(**dict(zip(axes, combinations[i])))
+        calc = calculate(gross, data.n_pagues, data.pagues_prorratejades, especie,
+                         data.grup_cotitzacio, data.contract_type, other, fam, data.region, params)
+        results.append({
+            "minim_personal_familiar":    float(round_euro(calc.minim_personal_familiar)),
+            "base_imponible":             float(round_euro(calc.base_imponible)),
+            "cuota_irpf_anual":           float(round_euro(calc.cuota_irpf_anual)),
+            "tipo_retencio":              float(calc.tipo_retencio),
+            "irpf_per_paga":              float(round_euro(calc.irpf_per_paga)),
+            "sou_net_per_paga":           float(round_euro(calc.net_per_paga)),
+            "sou_net_mensual_equivalent": float(round_euro(calc.net_monthly_equivalent)),
+        })
+
+    # Rows name only the fields that vary
+    varying = [i for i, values in enumerate(axes.values()) if len(values) > 1]
+    names = list(axes)
+    rows = [
+        {**{names[i]: combination[i] for i in varying}, **results[r]}
+        for combination, r in zip(combinations, inverse.ravel().tolist())
+    ]
+    return {
+        "gross": float(gross),
+        "year": params.year,
+        "combinations": len(rows),
+        "distinct_results": len(results),
+        "rows": rows,
+    }
+
+@app.post("/api/family-sweep")
+async def family_sweep(data: FamilySweepRequest):
+    check_years(data.year)
+    try:
+        axes = family_sweep_axes(data)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    return await run_cpu(compute_family_sweep_response, data, axes)
+
+# Chart URLs name their content, so a cached copy never goes stale
+CHART_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+CHART_MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+@app.get("/api/charts/{chart_id}")
+async def get_chart(chart_id: str, spec: str, request: Request):
+    headers = {"Cache-Control": CHART_CACHE_CONTROL, "ETag": f'"{chart_id}"'}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    try:
+        kind, inputs, fmt = decode_chart_spec(chart_id, spec)
+        inputs = chart_inputs_from_json(kind, inputs)
+    except (TypeError, ValueError, KeyError, ArithmeticError):
+        raise HTTPException(status_code=404, detail="Unknown chart")
+    content = chart_cache.get(chart_id)
+    if content is None:
+        try:
+            content = await run_cpu(render_chart_bytes, kind, inputs, fmt)
+        except (TypeError, ValueError, KeyError, ArithmeticError):
+            raise HTTPException(status_code=404, detail="Unknown chart")
+        chart_cache.put(chart_id, content)
+    return Response(content=content, media_type=CHART_MEDIA_TYPES[fmt], headers=headers)
+
+@app.get("/api/chart-cache")
+async def chart_cache_stats():
+    return chart_cache.stats()
+
+metrics.Gauge(
+    "chart_cache", "Chart cache counters and size (this process)",
+    lambda: {(k,): v for k, v in chart_cache.stats().items()}, ["field"])
+metrics.Gauge("calc_executor_in_flight", "Jobs running or queued on the executor", lambda: executor.in_flight)
+metrics.Gauge(
+    "calc_coalesce_in_flight", "Distinct computations in flight that identical requests can join",
+    lambda: {(f.name,): f.in_flight for f in (calculate_flights, increment_flights)}, ["endpoint"])
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+# ── Batch calculation (NDJSON) ───────────────────────────────────────────────
+class RequestStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose iterator is still reading the request body. The default one listens
+    for client disconnects on `receive`, which would swallow the body chunks we are consuming.
+    """
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+async def iter_ndjson_records(request: Request):
+    # One record per line, parsed as the body streams in so memory stays flat
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+async def iter_list_records(records):
+    for record in records:
+        yield record
+
+BATCH_CHUNK_SIZE = 64
+
+def calculate_batch_chunk(chunk):
+    results = []
+    for index, data, fam in chunk:
+        if data is None:
+            # record that failed to parse; `fam` holds the error message
+            results.append({"index": index, "error": fam})
+            continue
+        try:
+            results.append({"index": index, **serialize_calculation(calculate_from_request(data, fam))})
+        except (TypeError, ValueError, KeyError) as exc:
+            results.append({"index": index, "error": str(exc)})
+        except ArithmeticError as exc:
+            # decimal signals print as a list of classes
+            results.append({"index": index, "error": f"calculation error: {type(exc).__name__}"})
+    return results
+
+async def stream_batch_results(records):
+    # Records sharing a family profile share one parsed FamilySituation (build_family_situation
+    # is cached). Chunks are computed on the executor; waiting for a free slot gives natural
+    # backpressure on the input stream.
+    chunk = []
+    index = 0
+    async for record in records:
+        try:
+            if isinstance(record, bytes):
+                record = json.loads(record)
+            data = SalaryRequest(**record)
+            chunk.append((index, data, build_family_situation(data)))
+        except (TypeError, ValueError, KeyError) as exc:
+            chunk.append((index, None, str(exc)))
+        index += 1
+        if len(chunk) >= BATCH_CHUNK_SIZE:
+            for result in await executor.run(calculate_batch_chunk, chunk, wait=True):
+                yield json.dumps(result) + "\n"
+            chunk = []
+    if chunk:
+        for result in await executor.run(calculate_batch_chunk, chunk, wait=True):
+            yield json.dumps(result) + "\n"
+
+@app.post("/api/calculate/batch")
+async def calculate_batch(request: Request):
+    """
+    Body: a JSON list of SalaryRequest records, or NDJSON (`application/x-ndjson`) streamed one
+    record per line. No charts; responds with one JSON line per record as soon as it is computed.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        return RequestStreamingResponse(stream_batch_results(iter_ndjson_records(request)), media_type="application/x-ndjson")
+    try:
+        records = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON list of records, or NDJSON")
+    if not isinstance(records, list):
+        records = [records]
+    return StreamingResponse(stream_batch_results(iter_list_records(records)), media_type="application/x-ndjson")
+
+_ROUTE_PATHS.update(route.path for route in app.routes if "{" not in route.path)
+_ROUTE_TEMPLATES.extend((route.path.split("{")[0], route.path) for route in app.routes if "{" in route.path)
@@ -0,0 +1,326 @@
+# In-process counters/histograms rendered in the Prometheus text format (no client library needed)
+import bisect
+import itertools
+import os
+import threading
+import time
+
+ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+# perform_calculation only takes tens of microseconds, so its stages are timed on 1 call in N
+STAGE_SAMPLE_EVERY = max(1, int(os.environ.get("METRICS_STAGE_SAMPLE", "10")))
+
+# Seconds; stages of perform_calculation take microseconds, chart renders hundreds of milliseconds
+LATENCY_BUCKETS = (
+    0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+SIZE_BUCKETS = tuple(2 ** i for i in range(6, 25, 2))  # 64 B .. 16 MiB
+
+_REGISTRY = []
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _snapshot(self, reset):
+        with self._lock:
+            values = dict(self._values)
+            if reset:
+                self._values.clear()
+        return values
+
+    def _merge(self, values):
+        with self._lock:
+            for key, amount in values.items():
+                self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = self._header()
+        for key, value in sorted(self._snapshot(False).items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_state(self):
+        # per-bucket (non-cumulative) counts, with a final overflow slot for +Inf; then sum
+        return [[0] * (len(self.buckets) + 1), 0.0]
+
+    def observe(self, value, **labels):
+        self.observe_many([(self._key(labels), value)])
+
+    def observe_many(self, items):
+        """Record several `(label_values_tuple, value)` pairs under a single lock acquisition."""
+        slots = [(key, bisect.bisect_left(self.buckets, value), value) for key, value in items]
+        with self._lock:
+            for key, slot, value in slots:
+                state = self._values.get(key)
+                if state is None:
+                    state = self._values[key] = self._new_state()
+                state[0][slot] += 1
+                state[1] += value
+
+    def observe_stages(self, start, marks):
+        """Fast path for StageTimer: `marks` are (stage, perf_counter) pairs after `start`."""
+        bisect_left, buckets, values = bisect.bisect_left, self.buckets, self._values
+        with self._lock:
+            previous = start
+            for stage, now in marks:
+                value = now - previous
+                previous = now
+                key = (stage,)
+                state = values.get(key)
+                if state is None:
+                    state = values[key] = self._new_state()
+                state[0][bisect_left(buckets, value)] += 1
+                state[1] += value
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return sum(state[0]) if state else 0
+
+    def _snapshot(self, reset):
+        with self._lock:
+            values = {key: [list(counts), total] for key, (counts, total) in self._values.items()}
+            if reset:
+                self._values.clear()
+        return values
+
+    def _merge(self, values):
+        with self._lock:
+            for key, (counts, total) in values.items():
+                state = self._values.get(key)
+                if state is None:
+                    state = self._values[key] = self._new_state()
+                state[0] = [a + b for a, b in zip(state[0], counts)]
+                state[1] += total
+
+    def render(self):
+        lines = self._header()
+        for key, (counts, total) in sorted(self._snapshot(False).items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    Value read at scrape time from `callback`, which returns a number or, with labelnames,
+    a dict of label-value tuples to numbers. Gauges are process-local and never merged.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, callback, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self.callback = callback
+
+    def _snapshot(self, reset):
+        return {}
+
+    def _merge(self, values):
+        pass
+
+    def render(self):
+        values = self.callback()
+        if not self.labelnames:
+            values = {(): values}
+        lines = self._header()
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+def render() -> str:
+    return "\n".join(line for metric in _REGISTRY for line in metric.render()) + "\n"
+
+
+def collect_delta():
+    """Take and reset everything recorded in this process (used by process-pool workers)."""
+    return {metric.name: metric._snapshot(True) for metric in _REGISTRY if not isinstance(metric, Gauge)}
+
+
+def merge(delta):
+    by_name = {metric.name: metric for metric in _REGISTRY}
+    for name, values in delta.items():
+        metric = by_name.get(name)
+        if metric is not None and values:
+            metric._merge(values)
+
+
+def run_collecting(fn, *args, **kwargs):
+    """Run `fn` in a worker process and ship back the metrics it recorded along with its result."""
+    result = fn(*args, **kwargs)
+    return result, collect_delta()
+
+
+# ── Application metrics ─────────────────────────────────────────────────────
+CALC_STAGE_SECONDS = Histogram(
+    "calc_stage_seconds", f"Time spent in each stage of perform_calculation (1 in {STAGE_SAMPLE_EVERY} calls sampled)", ["stage"])
+CHART_SECONDS = Histogram(
+    "chart_render_seconds", "Chart rendering time by chart and step (build, png, base64)", ["chart", "step"])
+FLOAT_DEVIATION_CENTS = Histogram(
+    "calc_float_deviation_cents", "Largest float64 vs Decimal deviation per verified chart series, in cents",
+    buckets=(0.001, 0.01, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 100.0))
+LOOKUPS = Counter(
+    "calc_lookup_total", "Calculations answered from the precomputed tables (hit) or computed (miss)", ["result"])
+COALESCED_REQUESTS = Counter(
+    "calc_coalesced_requests_total", "Requests that started a computation (leader) or shared one in flight (follower)",
+    ["endpoint", "role"])
+COALESCE_WAIT_SECONDS = Histogram(
+    "calc_coalesce_wait_seconds", "Time followers waited for the computation in flight", ["endpoint"])
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by endpoint, method and status", ["endpoint", "method", "status"])
+HTTP_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by endpoint", ["endpoint"])
+HTTP_REQUEST_BYTES = Histogram(
+    "http_request_size_bytes", "HTTP request body size by endpoint", ["endpoint"], buckets=SIZE_BUCKETS)
+HTTP_RESPONSE_BYTES = Histogram(
+    "http_response_size_bytes", "HTTP response body size by endpoint", ["endpoint"], buckets=SIZE_BUCKETS)
+
+
+class StageTimer:
+    """
+    Splits a function into timed stages: call `mark(stage)` at the end of each one and `done()`
+    once at the end, which records every stage in CALC_STAGE_SECONDS under one lock.
+    """
+    __slots__ = ("_start", "_marks")
+
+    def __init__(self):
+        self._marks = []
+        self._start = time.perf_counter()
+
+    def mark(self, stage):
+        self._marks.append((stage, time.perf_counter()))
+
+    def done(self):
+        CALC_STAGE_SECONDS.observe_stages(self._start, self._marks)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def mark(self, stage):
+        pass
+
+    def done(self):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+_stage_calls = itertools.count()
+
+
+def stage_timer():
+    if ENABLED and next(_stage_calls) % STAGE_SAMPLE_EVERY == 0:
+        return StageTimer()
+    return _NULL_TIMER
+
+
+class timed:
+    """Context manager observing the elapsed seconds into `histogram` with the given labels."""
+    __slots__ = ("histogram", "labels", "_start")
+
+    def __init__(self, histogram, **labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if ENABLED:
+            self.histogram.observe(time.perf_counter() - self._start, **self.labels)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting HTTP requests and timing them, with request and response body sizes.
+    `endpoint_label(path)` maps a path to a bounded label (unknown paths should map to one value).
+    """
+
+    def __init__(self, app, endpoint_label):
+        self.app = app
+        self.endpoint_label = endpoint_label
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+        endpoint = self.endpoint_label(scope["path"])
+        start = time.perf_counter()
+        sizes = {"request": 0, "response": 0}
+        status = [500]
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes["request"] += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            elif message["type"] == "http.response.body":
+                sizes["response"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            HTTP_REQUESTS.inc(endpoint=endpoint, method=scope["method"], status=status[0])
+            HTTP_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+            HTTP_REQUEST_BYTES.observe(sizes["request"], endpoint=endpoint)
+            HTTP_RESPONSE_BYTES.observe(sizes["response"], endpoint=endpoint)
@@ -0,0 +1,128 @@
+"""
+Registry of the tax parameters, one immutable set per year, validated and compiled once at import
+(combined IRPF scales built, mappings frozen) so requests only pick one with `for_year(year)`.
+
+A year is added by writing a module with the same names as variables.py (e.g. variables_2027.py)
+and registering it below with `register(TaxParameters.from_module(2027, variables_2027))`.
+"""
+from dataclasses import dataclass, field
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Tuple
+
+import variables
+from utils import DEFAULT_MINIMUMS, IRPFScale, PersonalMinimums
+
+DEFAULT_YEAR = 2026
+
+_SS_RATE_KEYS = (
+    "contingencies_common_worker", "unemployment_worker_indefinite", "unemployment_worker_temporary",
+    "training_worker", "mei_worker",
+)
+_REDUCTION_WORK_KEYS = ("upper1", "amount1", "upper2", "coef2", "upper3", "base3", "coef3")
+_GASTOS_KEYS = (
+    "otros_gastos_generales", "movilidad_geografica", "discapacidad_trabajador_activo",
+    "discapacidad_trabajador_activo_grave",
+)
+
+
+@dataclass(frozen=True, eq=False)
+class TaxParameters:
+    """
+    SS bases and rates, IRPF scales, personal minimums, work reduction and deductible expenses of
+    one year. Compared and hashed by identity: there is one instance per registered year.
+    """
+    year: int
+    ss_base_max_monthly: Decimal
+    ss_base_min_by_group: Mapping[str, Decimal]
+    ss_rates: Mapping[str, Decimal]
+    irpf_scale_estatal: Tuple[Tuple[int, Optional[int], Decimal], ...]
+    irpf_scale_catalunya: Tuple[Tuple[int, Optional[int], Decimal], ...]
+    minimos: PersonalMinimums
+    reduction_work: Mapping[str, Decimal]
+    gastos_deducidos: Mapping[str, Decimal]
+    scales: Mapping[str, IRPFScale] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        for name in ("ss_base_min_by_group", "ss_rates", "reduction_work", "gastos_deducidos"):
+            object.__setattr__(self, name, MappingProxyType(dict(getattr(self, name))))
+        object.__setattr__(self, "irpf_scale_estatal", tuple(self.irpf_scale_estatal))
+        object.__setattr__(self, "irpf_scale_catalunya", tuple(self.irpf_scale_catalunya))
+        self._validate()
+        object.__setattr__(self, "scales", MappingProxyType({
+            "Catalunya": IRPFScale.combined_scale(self.irpf_scale_catalunya, self.irpf_scale_estatal),
+            # Mitjana espanyola: state scale counts twice (no regional deviation)
+            "Espanya": IRPFScale.combined_scale(self.irpf_scale_estatal, self.irpf_scale_estatal),
+        }))
+
+    def __reduce__(self):
+        # Pickled by year, so process-pool workers get their own registered instance
+        return for_year, (self.year,)
+
+    def scale(self, region: str) -> IRPFScale:
+        return self.scales["Catalunya" if region == "Catalunya" else "Espanya"]
+
+    @classmethod
+    def from_module(cls, year: int, module):
+        minimos = PersonalMinimums.from_module(module)
+        return cls(
+            year=year,
+            ss_base_max_monthly=module.SS_BASE_MAX_MONTHLY,
+            ss_base_min_by_group=module.SS_BASE_MIN_BY_GROUP,
+            ss_rates=module.DEFAULT_SS_RATES,
+            irpf_scale_estatal=module.IRPF_SCALE_ESTATAL,
+            irpf_scale_catalunya=module.IRPF_SCALE_CATALUNYA,
+            # Years with the same minimums share FamilySituation's memoized value
+            minimos=DEFAULT_MINIMUMS if minimos == DEFAULT_MINIMUMS else minimos,
+            reduction_work=module.REDUCTION_WORK,
+            gastos_deducidos=module.GASTOS_DEDUCIDOS,
+        )
+
+    def _validate(self):
+        def check(condition, message):
+            if not condition:
+                raise ValueError(f"Tax parameters {self.year}: {message}")
+
+        check(isinstance(self.year, int), "year must be an int")
+        check(self.ss_base_max_monthly > 0, "SS maximum base must be positive")
+        for grup, base in self.ss_base_min_by_group.items():
+            check(0 < base <= self.ss_base_max_monthly, f"SS minimum base of {grup} outside (0, max]")
+        for key in _SS_RATE_KEYS:
+            check(key in self.ss_rates and 0 <= self.ss_rates[key] < 1, f"SS rate {key} missing or not in [0, 1)")
+        for name in ("irpf_scale_estatal", "irpf_scale_catalunya"):
+            brackets = getattr(self, name)
+            check(brackets and brackets[0][0] == 0, f"{name} must start at 0")
+            check(brackets[-1][1] is None, f"{name} must end with an open bracket")
+            for (low, high, rate), following in zip(brackets, brackets[1:] + ((None, None, None),)):
+                check(0 <= rate < 1, f"{name} rate {rate} not in [0, 1)")
+                check(high is None or (high > low and high == following[0]), f"{name} brackets must be contiguous")
+        rw = self.reduction_work
+        check(all(key in rw for key in _REDUCTION_WORK_KEYS), "REDUCTION_WORK is incomplete")
+        check(0 < rw["upper1"] < rw["upper2"] < rw["upper3"], "REDUCTION_WORK limits must increase")
+        check(all(key in self.gastos_deducidos for key in _GASTOS_KEYS), "GASTOS_DEDUCIDOS is incomplete")
+        check(all(v >= 0 for v in self.gastos_deducidos.values()), "deductible expenses must not be negative")
+
+
+_REGISTRY: Dict[int, TaxParameters] = {}
+
+
+def register(params: TaxParameters) -> TaxParameters:
+    if params.year in _REGISTRY:
+        raise ValueError(f"Tax parameters for {params.year} are already registered")
+    _REGISTRY[params.year] = params
+    return params
+
+
+def for_year(year: Optional[int] = None) -> TaxParameters:
+    """Parameters of `year` (the default year if None); ValueError for a year that is not registered."""
+    params = _REGISTRY.get(DEFAULT_YEAR if year is None else year)
+    if params is None:
+        raise ValueError(f"No tax parameters for {year}; available years: {', '.join(map(str, years()))}")
+    return params
+
+
+def years():
+    return sorted(_REGISTRY)
+
+
+DEFAULT = register(TaxParameters.from_module(2026, variables))
@@ -0,0 +1,139 @@
+"""
+Payroll CSV in, payroll CSV out: every employee row of the input, with its own columns kept and
+the calculation appended (SS breakdown, taxable base, quota, withholding rate, per-paga amounts).
+
+    python payroll.py employees.csv payroll.csv
+    python payroll.py - - < employees.csv > payroll.csv     # stdin / stdout
+    python payroll.py employees.csv payroll.csv --chunk-size 5000
+
+Input columns as in population.py. Rows are read, computed and written one chunk at a time, so
+memory stays flat whatever the file size; progress and throughput go to stderr. Rows that fail
+keep their input columns and get the reason in `error`; an output named like an input column
+is written as calc_<name>. For aggregates over a whole workforce
+on every core, see simulate.py.
+"""
+import argparse
+import contextlib
+import csv
+import sys
+import time
+
+import parameters
+import population
+from calculator import calculate, load_lookup_tables, parse_family, serialize_calculation
+
+# Fields of serialize_calculation written for each row, in this order
+OUTPUT_COLUMNS = (
+    "base_ss_mensual", "ss_contingencies_comunes_mensual", "ss_atur_mensual", "ss_formacio_mensual",
+    "ss_mei_mensual", "total_ss_mensual", "total_ss_anual",
+    "rendiment_net_treball", "reduccio_rendiments_treball", "base_imponible", "minim_personal_familiar",
+    "cuota_irpf_anual", "tipo_retencio", "marginal_irpf_percent",
+    "gross_per_paga", "ss_per_paga", "irpf_per_paga", "sou_net_per_paga", "sou_net_mensual_equivalent",
+    "year", "error",
+)
+
+
+class Progress:
+    """Rows done and rows/s on stderr, at most every `interval` seconds, plus a final line."""
+
+    def __init__(self, stream=sys.stderr, interval=1.0):
+        self.stream = stream
+        self.interval = interval
+        self.rows = 0
+        self.errors = 0
+        self.started = self._last = time.perf_counter()
+        self._end = "\r" if stream.isatty() else "\n"
+
+    def update(self, rows, errors):
+        self.rows += rows
+        self.errors += errors
+        now = time.perf_counter()
+        if now - self._last >= self.interval:
+            self._last = now
+            self._print(self._end)
+
+    def done(self):
+        self._print("\n")
+
+    def _print(self, end):
+        elapsed = time.perf_counter() - self.started
+        rate = self.rows / elapsed if elapsed else 0.0
+        print(f"{self.rows:,} rows ({self.errors:,} errors) in {elapsed:.1f} s, {rate:,.0f} rows/s",
+              end=end, file=self.stream, flush=True)
+
+
+def compute_chunks(chunks, positions):
+    """For each chunk of raw rows, the list of output values to append to every row."""
+    load_lookup_tables()
+    blank = [""] * (len(OUTPUT_COLUMNS) - 1)
+    for _, chunk in chunks:
+        computed = []
+        for record in chunk:
+            try:
+                args, family_key, year = population.parse_record(record, positions)
+                *calc_args, region = args
+                result = serialize_calculation(
+                    calculate(*calc_args, parse_family(family_key), region, parameters.for_year(year)))
+            except (TypeError, ValueError, KeyError, ArithmeticError) as exc:
+                computed.append(blank + [population.record_error(exc)])
+                continue
+            result["error"] = ""
+            computed.append([result[name] for name in OUTPUT_COLUMNS])
+        yield chunk, computed
+
+
+def run_payroll(source, destination, chunk_size=1000, progress=None):
+    """Stream the CSV in `source` (a text file) to `destination`. Returns (rows, errors)."""
+    reader = csv.reader(source)
+    header = next(reader, None)
+    if header is None:
+        raise ValueError("Empty input")
+    positions = population.layout(header)
+    writer = csv.writer(destination)
+    # an output named like an input column (e.g. year) gets a prefix instead of shadowing it
+    writer.writerow(header + [f"calc_{c}" if c in header else c for c in OUTPUT_COLUMNS])
+    width = len(header)
+    rows = errors = 0
+    for chunk, computed in compute_chunks(population.iter_shards(reader, chunk_size), positions):
+        # pad short rows so the appended columns line up with the header
+        writer.writerows(
+            (record + [""] * (width - len(record)) if len(record) < width else record[:width]) + values
+            for record, values in zip(chunk, computed)
+        )
+        chunk_errors = sum(1 for values in computed if values[-1])
+        rows += len(chunk)
+        errors += chunk_errors
+        if progress is not None:
+            progress.update(len(chunk), chunk_errors)
+    destination.flush()
+    return rows, errors
+
+
+def _open(path, mode, std):
+    if path == "-":
+        return contextlib.nullcontext(std)
+    return open(path, mode, newline="", encoding="utf-8-sig" if "r" in mode else "utf-8")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="employees CSV ('-' for stdin)")
+    parser.add_argument("output", help="payroll CSV to write ('-' for stdout)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="rows read, computed and written at a time")
+    parser.add_argument("--quiet", action="store_true", help="no progress on stderr")
+    args = parser.parse_args(argv)
+
+    progress = None if args.quiet else Progress()
+    try:
+        with _open(args.input, "r", sys.stdin) as source, _open(args.output, "w", sys.stdout) as destination:
+            rows, errors = run_payroll(source, destination, args.chunk_size, progress)
+    except (OSError, ValueError) as exc:
+        print(f"payroll: {exc}", file=sys.stderr)
+        return 2
+    if progress is not None:
+        progress.done()
+    return 1 if rows and errors == rows else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
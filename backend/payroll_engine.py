@@ -0,0 +1,213 @@
+"""
+Monthly payroll with mid-year regularization. One EmployeePayroll per employee keeps what has been
+paid, withheld and contributed so far this year, plus the withholding rate and pay of the months left.
+
+A change of terms (a raise, a contract switch, a new child...) applies from the next month to pay.
+The rate is then regularized over the remaining months only (utils.calcular_regularizacion, art. 87.5
+RIRPF), on the year's actual figures: what was paid plus what the new terms will pay. Months without
+changes reuse the plan, so a monthly run costs one calculation per changed employee.
+
+    run = MonthlyPayroll(2026)
+    run.add("E1", PayrollTerms(gross=Decimal("30000"), grup_cotitzacio=GRUP, contract_type="indefinite"))
+    run.close_month()                          # January payslips, by employee
+    run.change("E1", gross=Decimal("36000"))   # a raise from February
+    run.close_month()
+"""
+from collections import deque
+from dataclasses import dataclass, replace
+from decimal import Decimal
+from typing import Dict, List
+
+import parameters
+from calculator import calculate
+from utils import (
+    FamilySituation, calcular_cuota_retencion, calcular_gastos_deducibles, calcular_regularizacion,
+    compute_reduction_by_work, redondear1,
+)
+
+MONTHS = 12
+# Months that pay the extra pagues when they are not prorated, in order of use
+EXTRA_PAY_MONTHS = (6, 12, 3, 9)
+
+
+@dataclass(frozen=True)
+class PayrollTerms:
+    """What an employee is paid under: the annual amounts and profile of a SalaryRequest."""
+    gross: Decimal
+    grup_cotitzacio: str
+    contract_type: str
+    n_pagues: int = 14
+    pagues_prorratejades: bool = False
+    retribucio_en_especie_ann: Decimal = Decimal("0")
+    other_deductions: Decimal = Decimal("0")
+    fam: FamilySituation = FamilySituation()
+    region: str = "Catalunya"
+
+
+@dataclass(frozen=True)
+class Payslip:
+    month: int
+    gross: Decimal          # money paid this month
+    especie: Decimal        # pay in kind this month
+    ss: Decimal
+    irpf: Decimal
+    net: Decimal
+    tipo_retencio: Decimal
+    regularized: bool       # the rate was (re)computed for this month
+
+
+def pay_weights(n_pagues, pagues_prorratejades):
+    """Pagues paid in each month: one a month, plus the extras in EXTRA_PAY_MONTHS unless prorated."""
+    weights = [1] * MONTHS
+    extras = 0 if pagues_prorratejades else n_pagues - MONTHS
+    if extras > len(EXTRA_PAY_MONTHS):
+        raise ValueError(f"At most {MONTHS + len(EXTRA_PAY_MONTHS)} pagues")
+    for month in EXTRA_PAY_MONTHS[:max(extras, 0)]:
+        weights[month - 1] += 1
+    return weights
+
+
+def allocate(amount, weights, start=1):
+    """
+    The share of the months start..12 in `amount` split by `weights`, in cents. Each month gets the
+    rounded cumulative share minus the previous one, so a whole year adds up to the amount exactly.
+    """
+    total = Decimal(sum(weights))
+    shares, cumulative, previous = [], 0, Decimal("0.00")
+    for month, weight in enumerate(weights, 1):
+        cumulative += weight
+        upto = redondear1(amount * cumulative / total)
+        if month >= start:
+            shares.append(upto - previous)
+        previous = upto
+    return shares
+
+
+def annual_quota(retrib, ss, terms, params):
+    """Stages 3-6 of calculator.perform_calculation on the year's actual retribution and SS contributions."""
+    fam = terms.fam
+    gastos_deducibles = calcular_gastos_deducibles(
+        retrib, ss, False,
+        fam.disability_percent_self >= 33 and fam.disability_percent_self < 65,
+        fam.disability_percent_self >= 65,
+        "ACTIVO",
+        params.gastos_deducidos,
+    )
+    rendiment_net_treball = retrib - ss - gastos_deducibles - terms.other_deductions
+    reduccio = compute_reduction_by_work(rendiment_net_treball, params.reduction_work)
+    base_imponible = max(rendiment_net_treball - reduccio, Decimal("0"))
+    minimo = fam.minimo_personal_familiar(params.minimos)
+    return redondear1(calcular_cuota_retencion(base_imponible, minimo, escala=params.scale(terms.region)))
+
+
+class EmployeePayroll:
+    """
+    One employee's year. `first_month` is the first month paid (a hire during the year).
+    pay() closes the next month; change() sets new terms from the next month on.
+    """
+
+    def __init__(self, terms: PayrollTerms, year=None, first_month=1):
+        self.params = parameters.for_year(year)
+        self.terms = terms
+        self.first_month = first_month
+        self.payslips: List[Payslip] = []
+        # Year to date
+        self.percibido = Decimal("0.00")    # money and pay in kind
+        self.retenido = Decimal("0.00")
+        self.ss_paid = Decimal("0.00")
+        self.tipo_retencio = None
+        self.regularizations = 0
+        # (gross, especie, ss) of each month left under the current terms; None after a change
+        self._remaining = None
+
+    @property
+    def next_month(self):
+        return self.first_month + len(self.payslips)
+
+    def change(self, **changes):
+        """New terms (PayrollTerms fields) from the next month to pay."""
+        if self.next_month > MONTHS:
+            raise ValueError("The payroll year is closed")
+        self.terms = replace(self.terms, **changes)
+        self._remaining = None
+
+    def _regularize(self):
+        terms, start = self.terms, self.next_month
+        calc = calculate(
+            terms.gross, terms.n_pagues, terms.pagues_prorratejades, terms.retribucio_en_especie_ann,
+            terms.grup_cotitzacio, terms.contract_type, terms.other_deductions, terms.fam, terms.region, self.params,
+        )
+        monthly = [1] * MONTHS
+        remaining = list(zip(
+            allocate(terms.gross, pay_weights(terms.n_pagues, terms.pagues_prorratejades), start),
+            allocate(terms.retribucio_en_especie_ann, monthly, start),
+            allocate(calc.total_ss_anual, monthly, start),
+        ))
+        retrib = self.percibido + sum(gross + especie for gross, especie, _ in remaining)
+        ss = self.ss_paid + sum(ss for *_, ss in remaining)
+        result = calcular_regularizacion({
+            "regularizacion": bool(self.payslips),
+            "cuota": annual_quota(retrib, ss, terms, self.params),
+            "retrib": retrib,
+            "percibido": self.percibido,
+            "retenido": self.retenido,
+        })
+        self.tipo_retencio = result["tiporeg"]
+        self._remaining = deque(remaining)
+        self.regularizations += 1
+
+    def _payslip(self, month, gross, especie, ss, regularized):
+        irpf = redondear1((gross + especie) * self.tipo_retencio / Decimal("100"))
+        return Payslip(month, gross, especie, ss, irpf, gross - ss - irpf, self.tipo_retencio, regularized)
+
+    def pay(self) -> Payslip:
+        """Close the next month."""
+        month = self.next_month
+        if month > MONTHS:
+            raise ValueError("The payroll year is closed")
+        regularized = self._remaining is None
+        if regularized:
+            self._regularize()
+        payslip = self._payslip(month, *self._remaining.popleft(), regularized)
+        self.percibido += payslip.gross + payslip.especie
+        self.retenido += payslip.irpf
+        self.ss_paid += payslip.ss
+        self.payslips.append(payslip)
+        return payslip
+
+    def projection(self) -> List[Payslip]:
+        """Payslips of the months left if the terms do not change (nothing is paid)."""
+        if self.next_month > MONTHS:
+            return []
+        regularized = self._remaining is None
+        if regularized:
+            self._regularize()
+        return [
+            self._payslip(month, *amounts, regularized and month == self.next_month)
+            for month, amounts in enumerate(self._remaining, self.next_month)
+        ]
+
+
+class MonthlyPayroll:
+    """Every employee of one year; close_month() pays the next month to all of them."""
+
+    def __init__(self, year=None):
+        self.year = parameters.for_year(year).year
+        self.month = 1
+        self.employees: Dict[str, EmployeePayroll] = {}
+
+    def add(self, employee_id, terms: PayrollTerms):
+        """A new employee, paid from the next month to close."""
+        if employee_id in self.employees:
+            raise ValueError(f"Employee {employee_id!r} already exists")
+        self.employees[employee_id] = EmployeePayroll(terms, self.year, first_month=self.month)
+
+    def change(self, employee_id, **changes):
+        self.employees[employee_id].change(**changes)
+
+    def close_month(self) -> Dict[str, Payslip]:
+        if self.month > MONTHS:
+            raise ValueError("The payroll year is closed")
+        payslips = {employee_id: employee.pay() for employee_id, employee in self.employees.items()}
+        self.month += 1
+        return payslips
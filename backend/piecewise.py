@@ -0,0 +1,323 @@
+# Exact piecewise-linear representation of the gross → net pipeline for a fixed profile
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Optional, Tuple
+import parameters
+from utils import FamilySituation, IRPFScale, redondear1
+
+_ZERO = Decimal("0")
+_ONE = Decimal("1")
+
+
+def _representative(low: Optional[Decimal], high: Optional[Decimal]) -> Decimal:
+    # Any point strictly inside the open interval (low, high); None means unbounded
+    if low is None and high is None:
+        return _ZERO
+    if low is None:
+        return high - _ONE
+    if high is None:
+        return low + _ONE
+    return (low + high) / 2
+
+
+@dataclass(frozen=True)
+class PiecewiseLinear:
+    """
+    f(x) = slopes[i] * x + intercepts[i] on segment i, where segment i spans
+    (breakpoints[i-1], breakpoints[i]] (unbounded at both ends). A value exactly on a breakpoint
+    belongs to the segment on its left, which matches the `<=` comparisons of the scalar path.
+    """
+    breakpoints: Tuple[Decimal, ...]
+    slopes: Tuple[Decimal, ...]
+    intercepts: Tuple[Decimal, ...]
+
+    # ── Constructors ─────────────────────────────────────────────────────────
+    @classmethod
+    def linear(cls, slope, intercept=_ZERO):
+        return cls((), (Decimal(slope),), (Decimal(intercept),))
+
+    @classmethod
+    def clamp(cls, low, high):
+        low, high = Decimal(low), Decimal(high)
+        return cls((low, high), (_ZERO, _ONE, _ZERO), (low, _ZERO, high))
+
+    @classmethod
+    def minimum(cls, cap):
+        cap = Decimal(cap)
+        return cls((cap,), (_ONE, _ZERO), (_ZERO, cap))
+
+    @classmethod
+    def maximum(cls, floor):
+        floor = Decimal(floor)
+        return cls((floor,), (_ZERO, _ONE), (floor, _ZERO))
+
+    @classmethod
+    def from_scale(cls, scale: IRPFScale):
+        """`scale.tax_on_base` as a piecewise-linear function."""
+        slopes = [_ZERO] + list(scale.rates)
+        intercepts = [_ZERO] + [cum - rate * low for low, rate, cum in zip(scale.bounds, scale.rates, scale.cumulative)]
+        return cls(tuple(scale.bounds), tuple(slopes), tuple(intercepts))
+
+    @classmethod
+    def reduction_by_work(cls, rw):
+        """`compute_reduction_by_work` (with a year's `reduction_work`) without the intermediate rounding to cents."""
+        return cls(
+            (rw["upper1"], rw["upper2"], rw["upper3"]),
+            (_ZERO, -rw["coef2"], -rw["coef3"], _ZERO),
+            (rw["amount1"], rw["amount1"] + rw["coef2"] * rw["upper1"], rw["base3"] + rw["coef3"] * rw["upper2"], _ZERO),
+        )
+
+    # ── Evaluation ───────────────────────────────────────────────────────────
+    def __call__(self, x) -> Decimal:
+        x = Decimal(x)
+        i = bisect_left(self.breakpoints, x)
+        return self.slopes[i] * x + self.intercepts[i]
+
+    def slope_at(self, x) -> Decimal:
+        """Right derivative: the slope that applies to the next infinitesimal unit above `x`."""
+        return self.slopes[bisect_right(self.breakpoints, Decimal(x))]
+
+    def inverse(self, y, low=None) -> Decimal:
+        """
+        Smallest x (not below `low`) with f(x) >= y, for a continuous non-decreasing f.
+        Solved segment by segment, so the answer is exact and needs no iteration. Returns None
+        when f is already >= y on the whole unbounded first segment and no `low` is given.
+        """
+        if any(m < 0 for m in self.slopes):
+            raise ValueError("inverse needs a non-decreasing function")
+        y = Decimal(y)
+        if low is not None and self(low) >= y:
+            return Decimal(low)
+        for start, end, m, c in self.segments():
+            if low is not None and end is not None and end <= low:
+                continue
+            if m == 0:
+                if c >= y:
+                    return start if low is None or start > low else Decimal(low)
+                continue
+            x = (y - c) / m
+            if end is None or x <= end:
+                # Continuity means x >= start unless an earlier segment already reached y
+                return x if low is None or x > low else Decimal(low)
+        raise ValueError(f"{y} is out of range")
+
+    def segments(self):
+        """List of (start, end, slope, intercept); None marks an unbounded end."""
+        bounds = (None,) + self.breakpoints + (None,)
+        return [
+            (bounds[i], bounds[i + 1], self.slopes[i], self.intercepts[i])
+            for i in range(len(self.slopes))
+        ]
+
+    # ── Algebra ──────────────────────────────────────────────────────────────
+    def _on(self, breakpoints):
+        # (slope, intercept) pairs of self over the segments delimited by `breakpoints`
+        bounds = (None,) + tuple(breakpoints) + (None,)
+        pieces = []
+        for i in range(len(bounds) - 1):
+            j = bisect_left(self.breakpoints, _representative(bounds[i], bounds[i + 1]))
+            pieces.append((self.slopes[j], self.intercepts[j]))
+        return pieces
+
+    def __add__(self, other):
+        if not isinstance(other, PiecewiseLinear):
+            other = Decimal(other)
+            return PiecewiseLinear(self.breakpoints, self.slopes, tuple(c + other for c in self.intercepts))
+        breakpoints = tuple(sorted(set(self.breakpoints) | set(other.breakpoints)))
+        pieces = [
+            (m1 + m2, c1 + c2)
+            for (m1, c1), (m2, c2) in zip(self._on(breakpoints), other._on(breakpoints))
+        ]
+        return PiecewiseLinear._from_pieces(breakpoints, pieces)
+
+    __radd__ = __add__
+
+    def __mul__(self, factor):
+        factor = Decimal(factor)
+        return PiecewiseLinear(
+            self.breakpoints,
+            tuple(m * factor for m in self.slopes),
+            tuple(c * factor for c in self.intercepts),
+        )
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return self * -1
+
+    def __sub__(self, other):
+        return self + (-other)
+
+    def __rsub__(self, other):
+        return (-self) + other
+
+    def compose(self, inner: "PiecewiseLinear") -> "PiecewiseLinear":
+        """Return x ↦ self(inner(x))."""
+        breakpoints = []
+        pieces = []
+        for low, high, m, c in inner.segments():
+            if m == 0:
+                # inner is constant on this segment, so is the composition
+                j = bisect_left(self.breakpoints, c)
+                cuts, segment_pieces = [], [(_ZERO, self.slopes[j] * c + self.intercepts[j])]
+            else:
+                # split where inner crosses one of our breakpoints
+                cuts = sorted(
+                    x for x in ((y - c) / m for y in self.breakpoints)
+                    if (low is None or x > low) and (high is None or x < high)
+                )
+                bounds = [low] + cuts + [high]
+                segment_pieces = []
+                for k in range(len(bounds) - 1):
+                    y = m * _representative(bounds[k], bounds[k + 1]) + c
+                    j = bisect_left(self.breakpoints, y)
+                    segment_pieces.append((self.slopes[j] * m, self.slopes[j] * c + self.intercepts[j]))
+            if pieces:
+                breakpoints.append(low)
+            breakpoints.extend(cuts)
+            pieces.extend(segment_pieces)
+        return PiecewiseLinear._from_pieces(breakpoints, pieces)
+
+    @staticmethod
+    def _from_pieces(breakpoints, pieces):
+        # Drop breakpoints between two identical pieces
+        kept_breakpoints = []
+        kept_pieces = [pieces[0]]
+        for x, piece in zip(breakpoints, pieces[1:]):
+            if piece == kept_pieces[-1]:
+                continue
+            kept_breakpoints.append(x)
+            kept_pieces.append(piece)
+        return PiecewiseLinear(
+            tuple(kept_breakpoints),
+            tuple(m for m, _ in kept_pieces),
+            tuple(c for _, c in kept_pieces),
+        )
+
+
+@dataclass(frozen=True)
+class CompiledProfile:
+    """
+    Every pipeline quantity of a fixed profile as a piecewise-linear function of annual gross
+    (excluding in-kind pay). Values are exact up to the rounding to cents that the scalar path
+    applies to the reduction by work and the annual quota.
+    """
+    n_pagues: int
+    gross_including_benefits: PiecewiseLinear
+    total_ss_anual: PiecewiseLinear
+    gastos_deducibles: PiecewiseLinear
+    rendiment_net_treball: PiecewiseLinear
+    reduccio_rendiments_treball: PiecewiseLinear
+    base_imponible: PiecewiseLinear
+    cuota_irpf_anual: PiecewiseLinear
+    net_anual: PiecewiseLinear
+
+    @property
+    def breakpoints(self) -> Tuple[Decimal, ...]:
+        """Every gross where the slope of SS, IRPF or net changes."""
+        return tuple(sorted(
+            set(self.total_ss_anual.breakpoints)
+            | set(self.cuota_irpf_anual.breakpoints)
+            | set(self.net_anual.breakpoints)
+        ))
+
+    def marginal_irpf(self, gross) -> Decimal:
+        """Exact d(cuota)/d(gross) for the next euro above `gross`."""
+        return self.cuota_irpf_anual.slope_at(gross)
+
+    def segments(self):
+        """One entry per linear piece: bounds plus slope/intercept of net, IRPF and SS."""
+        breakpoints = self.breakpoints
+        bounds = (None,) + breakpoints + (None,)
+        columns = {
+            "net": self.net_anual._on(breakpoints),
+            "irpf": self.cuota_irpf_anual._on(breakpoints),
+            "ss": self.total_ss_anual._on(breakpoints),
+        }
+        result = []
+        for i in range(len(bounds) - 1):
+            segment = {"start": bounds[i], "end": bounds[i + 1]}
+            for name, pieces in columns.items():
+                segment[f"{name}_slope"], segment[f"{name}_intercept"] = pieces[i]
+            segment["marginal_irpf"] = segment["irpf_slope"]
+            result.append(segment)
+        return result
+
+    def gross_for_net(self, net_anual, low=_ZERO) -> Decimal:
+        """
+        Smallest gross with an unrounded annual net of at least `net_anual`. The scalar path
+        rounds the quota and reduction to cents, so the exact answer is within a few cents.
+        """
+        return self.net_anual.inverse(net_anual, low=low)
+
+    def evaluate(self, gross) -> dict:
+        gross = Decimal(gross)
+        cuota_irpf_anual = redondear1(self.cuota_irpf_anual(gross))
+        gross_including_benefits = self.gross_including_benefits(gross)
+        total_ss_anual = self.total_ss_anual(gross)
+        net_anual = gross_including_benefits - total_ss_anual - cuota_irpf_anual
+        return {
+            "gross_including_benefits": gross_including_benefits,
+            "total_ss_anual":           total_ss_anual,
+            "rendiment_net_treball":    self.rendiment_net_treball(gross),
+            "base_imponible":           self.base_imponible(gross),
+            "cuota_irpf_anual":         cuota_irpf_anual,
+            "marginal_irpf_rate":       self.marginal_irpf(gross),
+            "net_per_paga":             redondear1(net_anual / Decimal(self.n_pagues)),
+            "net_monthly_equivalent":   redondear1(net_anual / Decimal(12)),
+        }
+
+
+def compile_profile(n_pagues, retribucio_en_especie_ann, grup_cotitzacio, contract_type, other_deductions, fam: FamilySituation, region, params=None) -> CompiledProfile:
+    """Compose the nine stages of `perform_calculation` for everything but the gross salary."""
+    if params is None:
+        params = parameters.DEFAULT
+    ss_rates, gastos_deducidos = params.ss_rates, params.gastos_deducidos
+    PL = PiecewiseLinear
+    # ── Stages 1-2: SS over the clamped base (annualised, so the clamp stays exact) ──
+    gross_including_benefits = PL.linear(1, retribucio_en_especie_ann)
+    ss_atur_rate = (
+        ss_rates["unemployment_worker_indefinite"]
+        if contract_type == "indefinite"
+        else ss_rates["unemployment_worker_temporary"]
+    )
+    ss_total_rate = (
+        ss_rates["contingencies_common_worker"]
+        + ss_atur_rate
+        + ss_rates["training_worker"]
+        + ss_rates["mei_worker"]
+    )
+    base_ss_anual = PL.clamp(params.ss_base_min_by_group[grup_cotitzacio] * 12, params.ss_base_max_monthly * 12).compose(gross_including_benefits)
+    total_ss_anual = base_ss_anual * ss_total_rate
+
+    # ── Stage 3: gastos = min(gastos, retrib - cotizaciones) ─────────────────
+    gastos = gastos_deducidos["otros_gastos_generales"]
+    if fam.disability_percent_self >= 65:
+        gastos += gastos_deducidos["discapacidad_trabajador_activo_grave"]
+    elif fam.disability_percent_self >= 33:
+        gastos += gastos_deducidos["discapacidad_trabajador_activo"]
+    retrib_minus_ss = gross_including_benefits - total_ss_anual
+    gastos_deducibles = PL.minimum(gastos).compose(retrib_minus_ss)
+    rendiment_net_treball = retrib_minus_ss - gastos_deducibles - Decimal(other_deductions)
+
+    # ── Stages 4-5: reduction and taxable base ───────────────────────────────
+    reduccio_rendiments_treball = PL.reduction_by_work(params.reduction_work).compose(rendiment_net_treball)
+    base_imponible = PL.maximum(0).compose(rendiment_net_treball - reduccio_rendiments_treball)
+
+    # ── Stage 6: quota = max(tax(base) - tax(minimum), 0) ────────────────────
+    escala_irpf = params.scale(region)
+    tax = PL.from_scale(escala_irpf).compose(base_imponible)
+    cuota_irpf_anual = PL.maximum(0).compose(tax - escala_irpf.tax_on_base(fam.minimo_personal_familiar(params.minimos)))
+
+    return CompiledProfile(
+        n_pagues=n_pagues,
+        gross_including_benefits=gross_including_benefits,
+        total_ss_anual=total_ss_anual,
+        gastos_deducibles=gastos_deducibles,
+        rendiment_net_treball=rendiment_net_treball,
+        reduccio_rendiments_treball=reduccio_rendiments_treball,
+        base_imponible=base_imponible,
+        cuota_irpf_anual=cuota_irpf_anual,
+        net_anual=gross_including_benefits - total_ss_anual - cuota_irpf_anual,
+    )
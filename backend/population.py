@@ -0,0 +1,153 @@
+"""
+Population files for the simulation and payroll commands: one employee per row, as CSV or
+(with pyarrow installed) Parquet.
+
+Columns are the SalaryRequest field names. gross, grup_cotitzacio and contract_type are required
+("group" and "contract" are accepted as aliases); the rest default as in the web form (14 pagues,
+Catalunya, age 30, no family). `year` selects the tax parameters (parameters.py).
+"""
+import csv
+import os
+from decimal import Decimal, InvalidOperation
+
+# Column -> default (None = required), in the order rows are shipped to the workers
+FIELDS = {
+    "gross": None,
+    "grup_cotitzacio": None,
+    "contract_type": None,
+    "region": "Catalunya",
+    "n_pagues": "14",
+    "pagues_prorratejades": "false",
+    "retribucio_en_especie_ann": "0",
+    "other_deductions": "0",
+    "age": "30",
+    "disability_percent_self": "0",
+    "disability_self_help": "false",
+    "children_ages": "",
+    "children_disabilities": "",
+    "ascendents_ages": "",
+    "disability_relatives_perc": "",
+    "disability_relatives_help": "",
+    "year": "",
+}
+ALIASES = {"group": "grup_cotitzacio", "contract": "contract_type"}
+_TRUE = ("true", "1", "yes")
+
+
+def layout(columns):
+    """Position of every FIELDS column in the file's `columns` (None if absent); checks the required ones."""
+    positions = {ALIASES.get(c, c): i for i, c in enumerate(columns)}
+    missing = [name for name, default in FIELDS.items() if default is None and name not in positions]
+    if missing:
+        raise ValueError(f"Population file lacks required columns: {', '.join(missing)}")
+    return tuple(positions.get(name) for name in FIELDS)
+
+
+def read(path, batch_size=10000):
+    """
+    (layout, records) for a .csv or .parquet file. Records are the raw rows in file column order,
+    read incrementally; parse_record(record, layout) does the rest, so it can run in the workers.
+    """
+    if os.path.splitext(path)[1].lower() in (".parquet", ".pq"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Reading Parquet needs pyarrow (pip install pyarrow)") from None
+        parquet = pq.ParquetFile(path)
+        columns = parquet.schema_arrow.names
+
+        def parquet_records():
+            for batch in parquet.iter_batches(batch_size=batch_size):
+                yield from zip(*(column.to_pylist() for column in batch.columns))
+        return layout(columns), parquet_records()
+
+    f = open(path, newline="", encoding="utf-8-sig")
+    reader = csv.reader(f)
+    try:
+        positions = layout(next(reader, []))
+    except ValueError:
+        f.close()
+        raise
+
+    def csv_records():
+        with f:
+            yield from reader
+    return positions, csv_records()
+
+
+def iter_shards(records, shard_size):
+    """Consecutive lists of `shard_size` records, with the index of their first row."""
+    shard, start = [], 0
+    for record in records:
+        shard.append(record)
+        if len(shard) >= shard_size:
+            yield start, shard
+            start += len(shard)
+            shard = []
+    if shard:
+        yield start, shard
+
+
+def _decimal(value, name):
+    try:
+        number = Decimal(str(value))
+    except InvalidOperation:
+        number = None
+    if number is None or not number.is_finite():
+        raise ValueError(f"{name}: not a number: {value!r}")
+    return number
+
+
+def _list(value):
+    # Parquet may hold the family lists as real lists
+    return ",".join(map(str, value)) if isinstance(value, (list, tuple)) else str(value)
+
+
+def _bool(value):
+    return value if isinstance(value, bool) else str(value).strip().lower() in _TRUE
+
+
+_DEFAULTS = tuple(FIELDS.values())
+
+
+def record_error(exc):
+    """Message of the error column for a row whose parse_record or calculation raised `exc`."""
+    if isinstance(exc, KeyError):
+        return f"unknown value {exc}"
+    if isinstance(exc, ArithmeticError):
+        # decimal signals print as a list of classes
+        return f"calculation error: {type(exc).__name__}"
+    return str(exc)
+
+
+def parse_record(record, positions):
+    """
+    (calculate arguments without fam and params, family key for calculator.parse_family, year or None)
+    for a raw record read with `positions` from layout(). Raises ValueError for values that do not parse.
+    """
+    values = []
+    for i, default in zip(positions, _DEFAULTS):
+        value = record[i] if i is not None and i < len(record) else None
+        if value is None or value == "":
+            if default is None:
+                raise ValueError(f"{list(FIELDS)[len(values)]} is required")
+            value = default
+        values.append(value)
+    (gross, grup, contract, region, n_pagues, prorratejades, especie, other, age, disability_self,
+     self_help, children_ages, children_disabilities, ascendents_ages, relatives_perc, relatives_help, year) = values
+    try:
+        n_pagues, age, disability_self = int(n_pagues), int(age), int(disability_self)
+        year = int(year) if year != "" else None
+    except ValueError as exc:
+        raise ValueError(f"not an integer: {exc}") from None
+    if n_pagues < 1:
+        raise ValueError(f"n_pagues must be at least 1: {n_pagues}")
+    args = (
+        _decimal(gross, "gross"), n_pagues, _bool(prorratejades), _decimal(especie, "retribucio_en_especie_ann"),
+        grup, contract, _decimal(other, "other_deductions"), region,
+    )
+    family_key = (
+        age, disability_self, _bool(self_help), _list(children_ages), _list(children_disabilities),
+        _list(ascendents_ages), _list(relatives_perc), _list(relatives_help),
+    )
+    return args, family_key, year
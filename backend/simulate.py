@@ -0,0 +1,267 @@
+"""
+Microsimulation over a population file: every row through the calculation pipeline on a
+process pool, summed into workforce totals.
+
+    python simulate.py population.csv                         # aggregates as JSON on stdout
+    python simulate.py population.parquet --workers 8 --output summary.json
+    python simulate.py population.csv --rows results.csv      # plus one result line per row
+
+See population.py for the columns. Rows are sent to the workers in shards; each worker returns
+the partial aggregates of its shard (and its rows with --rows), so the parent only merges.
+Effective rates are binned to 0.01 percentage points, which is the resolution of the percentiles.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from functools import lru_cache
+
+import parameters
+import population
+from calculator import calculate, default_family, load_lookup_tables, parse_family, serialize_calculation
+
+PERCENTILES = (10, 25, 50, 75, 90, 99)
+# Rates in hundredths of a percentage point, 0..100 %; the last bin holds everything above
+_RATE_BINS = 10001
+_SS_COMPONENTS = (
+    ("contingencies_comunes", "ss_contingencies_comunes_mensual"),
+    ("atur", "ss_atur_mensual"),
+    ("formacio", "ss_formacio_mensual"),
+    ("mei", "ss_mei_mensual"),
+)
+
+
+@lru_cache(maxsize=None)
+def _scale_bounds(year, region):
+    return parameters.for_year(year).scale(region).bounds
+
+
+class Aggregate:
+    """Mergeable totals of a set of calculations (one per shard, merged in the parent)."""
+
+    def __init__(self):
+        self.rows = 0
+        self.errors = 0
+        self.gross = Decimal(0)
+        self.ss = {name: Decimal(0) for name, _ in _SS_COMPONENTS}
+        self.irpf = Decimal(0)
+        self.net = Decimal(0)
+        self.irpf_rate_sum = 0.0
+        self.total_rate_sum = 0.0
+        self.rated = 0
+        self.irpf_rate_bins = [0] * _RATE_BINS
+        self.total_rate_bins = [0] * _RATE_BINS
+        # (year, region, bracket index) -> [rows, gross, irpf]
+        self.brackets = {}
+
+    def add(self, calc, region):
+        self.rows += 1
+        gross = calc.gross_including_benefits
+        ss = calc.total_ss_anual
+        irpf = calc.cuota_irpf_anual
+        self.gross += gross
+        for name, field in _SS_COMPONENTS:
+            self.ss[name] += getattr(calc, field) * 12
+        self.irpf += irpf
+        self.net += gross - ss - irpf
+        if gross > 0:
+            # floats are plenty for 0.01-point bins
+            irpf_rate = float(irpf) / float(gross) * 100
+            total_rate = float(irpf + ss) / float(gross) * 100
+            self.rated += 1
+            self.irpf_rate_sum += irpf_rate
+            self.total_rate_sum += total_rate
+            self.irpf_rate_bins[min(int(irpf_rate * 100), _RATE_BINS - 1)] += 1
+            self.total_rate_bins[min(int(total_rate * 100), _RATE_BINS - 1)] += 1
+        region = "Catalunya" if region == "Catalunya" else "Espanya"
+        bounds = _scale_bounds(calc.year, region)
+        key = (calc.year, region, bisect_right(bounds, calc.base_imponible) - 1)
+        bracket = self.brackets.get(key)
+        if bracket is None:
+            bracket = self.brackets[key] = [0, Decimal(0), Decimal(0)]
+        bracket[0] += 1
+        bracket[1] += gross
+        bracket[2] += irpf
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.errors += other.errors
+        self.gross += other.gross
+        for name in self.ss:
+            self.ss[name] += other.ss[name]
+        self.irpf += other.irpf
+        self.net += other.net
+        self.irpf_rate_sum += other.irpf_rate_sum
+        self.total_rate_sum += other.total_rate_sum
+        self.rated += other.rated
+        self.irpf_rate_bins = [a + b for a, b in zip(self.irpf_rate_bins, other.irpf_rate_bins)]
+        self.total_rate_bins = [a + b for a, b in zip(self.total_rate_bins, other.total_rate_bins)]
+        for key, (rows, gross, irpf) in other.brackets.items():
+            bracket = self.brackets.setdefault(key, [0, Decimal(0), Decimal(0)])
+            bracket[0] += rows
+            bracket[1] += gross
+            bracket[2] += irpf
+
+    def _rate_summary(self, rate_sum, bins):
+        if not self.rated:
+            return None
+        summary = {"mean": round(rate_sum / self.rated, 4)}
+        for p in PERCENTILES:
+            # smallest bin holding at least p% of the rows (nearest-rank)
+            rank, seen = max(1, -(-self.rated * p // 100)), 0
+            for i, count in enumerate(bins):
+                seen += count
+                if seen >= rank:
+                    summary[f"p{p}"] = i / 100
+                    break
+        return summary
+
+    def summary(self):
+        total_ss = sum(self.ss.values())
+        brackets = []
+        for (year, region, i), (rows, gross, irpf) in sorted(self.brackets.items()):
+            scale = parameters.for_year(year).scale(region)
+            brackets.append({
+                "year": year,
+                "region": region,
+                "from": float(scale.bounds[i]),
+                "to": float(scale.bounds[i + 1]) if i + 1 < len(scale.bounds) else None,
+                "rate_percent": float(scale.rates[i] * 100),
+                "rows": rows,
+                "gross": float(round(gross, 2)),
+                "irpf": float(round(irpf, 2)),
+            })
+        return {
+            "rows": self.rows,
+            "errors": self.errors,
+            "totals": {
+                "gross": float(round(self.gross, 2)),
+                "ss": float(round(total_ss, 2)),
+                "ss_by_component": {name: float(round(v, 2)) for name, v in self.ss.items()},
+                "irpf": float(round(self.irpf, 2)),
+                "net": float(round(self.net, 2)),
+            },
+            # Overall rates: totals over total gross
+            "irpf_rate_percent": float(round(self.irpf / self.gross * 100, 4)) if self.gross else None,
+            "total_rate_percent": float(round((self.irpf + total_ss) / self.gross * 100, 4)) if self.gross else None,
+            # Per-employee effective rates (rows with a positive gross)
+            "effective_irpf_rate_percent": self._rate_summary(self.irpf_rate_sum, self.irpf_rate_bins),
+            "effective_total_rate_percent": self._rate_summary(self.total_rate_sum, self.total_rate_bins),
+            "irpf_brackets": brackets,
+        }
+
+
+def simulate_shard(start, records, positions, with_rows=False):
+    """Aggregate of one shard, plus its result rows (row index first) when `with_rows`."""
+    aggregate = Aggregate()
+    rows = [] if with_rows else None
+    for i, record in enumerate(records, start):
+        try:
+            args, family_key, year = population.parse_record(record, positions)
+            *calc_args, region = args
+            calc = calculate(*calc_args, parse_family(family_key), region, parameters.for_year(year))
+        except (TypeError, ValueError, KeyError, ArithmeticError) as exc:
+            aggregate.errors += 1
+            if with_rows:
+                rows.append({"row": i, "error": population.record_error(exc)})
+            continue
+        aggregate.add(calc, region)
+        if with_rows:
+            rows.append({"row": i, **serialize_calculation(calc)})
+    return aggregate, rows
+
+
+def row_columns():
+    """Header of the per-row output: row index, serialize_calculation's fields, error."""
+    grup = next(iter(parameters.DEFAULT.ss_base_min_by_group))
+    calc = calculate(Decimal(20000), 14, False, Decimal(0), grup, "indefinite", Decimal(0), default_family(30), "Catalunya")
+    return ["row", *serialize_calculation(calc), "error"]
+
+
+def _init_worker():
+    # Map the lookup tables once per worker, not per shard
+    load_lookup_tables()
+
+
+def run_simulation(path, workers=None, shard_size=5000, on_rows=None):
+    """
+    Merged Aggregate of every row of `path`. `on_rows(rows)` receives each shard's result rows,
+    in file order. workers=1 runs in this process.
+    """
+    workers = workers or os.cpu_count() or 1
+    with_rows = on_rows is not None
+    total = Aggregate()
+
+    def consume(result):
+        aggregate, rows = result
+        total.merge(aggregate)
+        if with_rows:
+            on_rows(rows)
+
+    positions, records = population.read(path)
+    shards = population.iter_shards(records, shard_size)
+    if workers == 1:
+        _init_worker()
+        for start, shard in shards:
+            consume(simulate_shard(start, shard, positions, with_rows))
+        return total
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        # A couple of shards queued per worker keeps them busy without reading the whole file
+        pending = deque()
+        for start, shard in shards:
+            pending.append(pool.submit(simulate_shard, start, shard, positions, with_rows))
+            if len(pending) >= 2 * workers:
+                consume(pending.popleft().result())
+        while pending:
+            consume(pending.popleft().result())
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("population", help="population file (.csv, or .parquet with pyarrow)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU; 1 = no pool)")
+    parser.add_argument("--shard-size", type=int, default=5000, help="rows per task sent to a worker")
+    parser.add_argument("--output", help="write the aggregates to this JSON file instead of stdout")
+    parser.add_argument("--rows", help="also write one result line per row to this CSV file")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    rows_file = on_rows = None
+    if args.rows:
+        rows_file = open(args.rows, "w", newline="")
+        writer = csv.DictWriter(rows_file, fieldnames=row_columns(), restval="")
+        writer.writeheader()
+        on_rows = writer.writerows
+    try:
+        total = run_simulation(args.population, args.workers, args.shard_size, on_rows)
+    except (OSError, RuntimeError, ValueError) as exc:
+        print(f"simulate: {exc}", file=sys.stderr)
+        return 2
+    finally:
+        if rows_file is not None:
+            rows_file.close()
+    elapsed = time.perf_counter() - started
+
+    summary = total.summary()
+    summary["seconds"] = round(elapsed, 3)
+    report = json.dumps(summary, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+    print(f"{total.rows + total.errors} rows in {elapsed:.1f} s ({(total.rows + total.errors) / elapsed:,.0f} rows/s), "
+          f"{total.errors} errors", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
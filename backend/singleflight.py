@@ -0,0 +1,44 @@
+# Request coalescing: concurrent calls with the same key share one computation (single flight)
+import asyncio
+import json
+
+import metrics
+
+
+class SingleFlight:
+    """
+    At most one computation per key in flight. The first caller (the leader) starts it; callers
+    with the same key that arrive before it finishes (followers) wait on it and get the same
+    result, or the same exception. Nothing is kept once it finishes: this is not a cache.
+
+    The computation runs as its own task, so a leader whose client goes away does not cancel it
+    for the followers. Used from the event loop only, so the dict needs no lock.
+    """
+
+    def __init__(self, name: str, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self._calls = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def run(self, key, fn, *args):
+        """Await `fn(*args)` (a coroutine function), or the call already in flight for `key`."""
+        if not self.enabled:
+            return await fn(*args)
+        task = self._calls.get(key)
+        if task is None:
+            metrics.COALESCED_REQUESTS.inc(endpoint=self.name, role="leader")
+            task = self._calls[key] = asyncio.ensure_future(fn(*args))
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+            return await asyncio.shield(task)
+        metrics.COALESCED_REQUESTS.inc(endpoint=self.name, role="follower")
+        with metrics.timed(metrics.COALESCE_WAIT_SECONDS, endpoint=self.name):
+            return await asyncio.shield(task)
+
+
+def request_key(data) -> str:
+    """Canonical JSON of a request model: equal payloads give the same key whatever their field order."""
+    return json.dumps(data.model_dump(), sort_keys=True, separators=(",", ":"))
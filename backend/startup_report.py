@@ -0,0 +1,95 @@
+"""
+Import time and resident memory per module group, to keep worker cold start in budget.
+
+    python startup_report.py                      # table
+    python startup_report.py --json               # machine-readable
+    python startup_report.py --budget-ms 800 --budget-mb 90
+
+Groups are imported in order in this (fresh) interpreter, so each row is the incremental cost
+on top of the previous ones. "app" is what a worker pays at boot; "numeric" and "plotting"
+are only paid on the first request that needs them.
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+
+IMPORT_GROUPS = [
+    ("core",     ["variables", "utils", "parameters", "calculator"]),
+    ("api",      ["pydantic", "fastapi"]),
+    ("app",      ["main"]),
+    ("numeric",  ["numpy", "batch_engine", "chart_data", "piecewise"]),
+    ("plotting", ["matplotlib", "matplotlib.pyplot", "viz_utils"]),
+]
+
+# Groups loaded when a worker boots; the budget applies to their sum
+STARTUP_GROUPS = ("core", "api", "app")
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process (Linux /proc, falling back to peak RSS elsewhere)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def measure_import_groups(groups=IMPORT_GROUPS):
+    if "matplotlib" not in sys.modules:
+        os.environ.setdefault("MPLBACKEND", "Agg")
+    rows = []
+    for name, modules in groups:
+        rss_before = current_rss_bytes()
+        start = time.perf_counter()
+        for module in modules:
+            importlib.import_module(module)
+        rows.append({
+            "group": name,
+            "modules": modules,
+            "import_ms": (time.perf_counter() - start) * 1000,
+            "rss_delta_mb": (current_rss_bytes() - rss_before) / 2**20,
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    parser.add_argument("--budget-ms", type=float, help="fail if worker startup imports exceed this")
+    parser.add_argument("--budget-mb", type=float, help="fail if worker RSS after startup exceeds this")
+    args = parser.parse_args(argv)
+
+    rows = measure_import_groups()
+    startup_ms = sum(r["import_ms"] for r in rows if r["group"] in STARTUP_GROUPS)
+    report = {
+        "groups": rows,
+        "startup_import_ms": startup_ms,
+        "rss_total_mb": current_rss_bytes() / 2**20,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{'group':<10} {'import ms':>10} {'RSS +MB':>9}  modules")
+        for r in rows:
+            print(f"{r['group']:<10} {r['import_ms']:>10.1f} {r['rss_delta_mb']:>9.1f}  {', '.join(r['modules'])}")
+        print(f"worker startup (core+api+app): {startup_ms:.1f} ms; total RSS {report['rss_total_mb']:.1f} MB")
+
+    # RSS budget is checked against the state right after the startup groups
+    startup_rss_mb = report["rss_total_mb"] - sum(r["rss_delta_mb"] for r in rows if r["group"] not in STARTUP_GROUPS)
+    failed = False
+    if args.budget_ms is not None and startup_ms > args.budget_ms:
+        print(f"startup import time {startup_ms:.1f} ms exceeds budget {args.budget_ms} ms", file=sys.stderr)
+        failed = True
+    if args.budget_mb is not None and startup_rss_mb > args.budget_mb:
+        print(f"startup RSS {startup_rss_mb:.1f} MB exceeds budget {args.budget_mb} MB", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
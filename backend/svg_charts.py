@@ -0,0 +1,170 @@
+"""
+The two pies of viz_utils.plot_net_pay_and_taxes without matplotlib: the layout is worked out once
+from the wedge values (same palette, titles, labels and arrangement: two pies stacked, each with
+its legend below) and written out as SVG text, or drawn to a PNG with Pillow.
+"""
+import io
+import math
+from functools import lru_cache
+from html import escape
+
+from chart_style import (
+    PIE_MAIN_COLORS, PIE_PCT_DISTANCE, PIE_START_ANGLE, PIE_TAXES_COLORS, TEXT, pct_label, pie_values_drawable,
+)
+
+# The matplotlib figure is 6 x 10 inches; one unit per 1/100 inch, so font sizes are points x 1.39
+WIDTH, PANEL_HEIGHT = 600, 500
+RADIUS = 160
+FONT_FAMILY = "Inter, 'Helvetica Neue', Arial, 'DejaVu Sans', sans-serif"
+TITLE_SIZE = 19
+# part of the series, wedge colours, percentage and legend font sizes
+_PANELS = (
+    ("main", PIE_MAIN_COLORS, 18, 15),
+    ("breakdown", PIE_TAXES_COLORS, 17, 14),
+)
+_SWATCH = 12
+_LEGEND_ROW = 24
+_LEGEND_COLUMN_GAP = 30
+
+
+def _legend_positions(labels, size, top):
+    # Two columns, centred like the matplotlib legend; text width estimated from the font size
+    columns = [labels[0::2], labels[1::2]]
+    widths = [max((0.55 * size * len(label) for label in column), default=0) + _SWATCH + 8 for column in columns]
+    x = (WIDTH - sum(widths) - _LEGEND_COLUMN_GAP) / 2
+    starts = (x, x + widths[0] + _LEGEND_COLUMN_GAP)
+    return [(starts[i % 2], top + (i // 2) * _LEGEND_ROW) for i in range(len(labels))]
+
+
+def layout(series, title_main, title_breakdown):
+    """
+    Geometry of both pies: per panel its title, centre, wedges (start and end angle in degrees,
+    counterclockwise from 3 o'clock as in Axes.pie, and colour), percentage labels and legend.
+    """
+    panels = []
+    for i, ((part, colors, pct_size, legend_size), title) in enumerate(zip(_PANELS, (title_main, title_breakdown))):
+        values, labels = series[part]["values"], series[part]["labels"]
+        if not pie_values_drawable(values):
+            raise ValueError(f"Pie values must be non-negative with a positive total: {values}")
+        top = i * PANEL_HEIGHT
+        cx, cy = WIDTH / 2, top + 235
+        total = float(sum(values))
+        wedges, pct_labels = [], []
+        theta1 = PIE_START_ANGLE
+        for value, color in zip(values, colors):
+            frac = value / total
+            theta2 = theta1 + 360.0 * frac
+            wedges.append((theta1, theta2, color))
+            text = pct_label(100.0 * frac)
+            if text:
+                mid = math.radians((theta1 + theta2) / 2)
+                r = PIE_PCT_DISTANCE * RADIUS
+                pct_labels.append((cx + r * math.cos(mid), cy - r * math.sin(mid), text))
+            theta1 = theta2
+        legend = [
+            (x, y, color, label)
+            for (x, y), color, label in zip(_legend_positions(labels, legend_size, cy + RADIUS + 30), colors, labels)
+        ]
+        panels.append({
+            "title": title, "title_y": top + 45, "cx": cx, "cy": cy, "wedges": wedges,
+            "pct_labels": pct_labels, "pct_size": pct_size, "legend": legend, "legend_size": legend_size,
+        })
+    return panels
+
+
+def _point(cx, cy, degrees):
+    angle = math.radians(degrees)
+    return cx + RADIUS * math.cos(angle), cy - RADIUS * math.sin(angle)
+
+
+def net_pay_and_taxes_svg(series, title_main, title_breakdown):
+    """SVG document of the two pies for a net_pay_and_taxes_series."""
+    out = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {WIDTH} {2 * PANEL_HEIGHT}" '
+        f'width="{WIDTH}" height="{2 * PANEL_HEIGHT}" font-family="{escape(FONT_FAMILY)}">',
+        '<rect width="100%" height="100%" fill="white"/>',
+    ]
+    for panel in layout(series, title_main, title_breakdown):
+        cx, cy = panel["cx"], panel["cy"]
+        out.append(f'<text x="{cx:.1f}" y="{panel["title_y"]:.1f}" font-size="{TITLE_SIZE}" font-weight="bold" '
+                   f'fill="{TEXT}" text-anchor="middle">{escape(panel["title"])}</text>')
+        out.append('<g stroke="white" stroke-width="2" stroke-linejoin="round">')
+        for theta1, theta2, color in panel["wedges"]:
+            if theta2 - theta1 >= 359.999:
+                out.append(f'<circle cx="{cx:.1f}" cy="{cy:.1f}" r="{RADIUS}" fill="{color}"/>')
+            elif theta2 > theta1:
+                (x1, y1), (x2, y2) = _point(cx, cy, theta1), _point(cx, cy, theta2)
+                large = 1 if theta2 - theta1 > 180 else 0
+                # sweep-flag 0: counterclockwise on screen
+                out.append(f'<path d="M{cx:.1f},{cy:.1f}L{x1:.2f},{y1:.2f}A{RADIUS},{RADIUS} 0 {large} 0 '
+                           f'{x2:.2f},{y2:.2f}Z" fill="{color}"/>')
+        out.append('</g>')
+        out.append(f'<g font-size="{panel["pct_size"]}" font-weight="bold" fill="white" text-anchor="middle" '
+                   f'dominant-baseline="central">')
+        for x, y, text in panel["pct_labels"]:
+            out.append(f'<text x="{x:.1f}" y="{y:.1f}">{text}</text>')
+        out.append('</g>')
+        out.append(f'<g font-size="{panel["legend_size"]}" fill="{TEXT}" dominant-baseline="central">')
+        for x, y, color, label in panel["legend"]:
+            out.append(f'<rect x="{x:.1f}" y="{y - _SWATCH / 2:.1f}" width="{_SWATCH}" height="{_SWATCH}" fill="{color}"/>'
+                       f'<text x="{x + _SWATCH + 8:.1f}" y="{y:.1f}">{escape(label)}</text>')
+        out.append('</g>')
+    out.append('</svg>')
+    return "".join(out)
+
+
+def _pillow():
+    try:
+        from PIL import Image, ImageDraw, ImageFont
+    except ImportError:
+        raise RuntimeError("PNG output of the SVG pies needs Pillow (pip install Pillow)") from None
+    return Image, ImageDraw, ImageFont
+
+
+@lru_cache(maxsize=None)
+def _font(size, bold):
+    _, _, ImageFont = _pillow()
+    try:
+        return ImageFont.truetype("DejaVuSans-Bold.ttf" if bold else "DejaVuSans.ttf", size)
+    except OSError:
+        return ImageFont.load_default(size)
+
+
+def _rgb(color):
+    return tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+
+
+def net_pay_and_taxes_png(series, title_main, title_breakdown, scale=1.5):
+    """
+    The same pies as a PNG, drawn with Pillow on a palette image (no anti-aliasing, which keeps
+    it fast and small). scale=1.5 matches the pixel size of the matplotlib charts at dpi 150.
+    """
+    Image, ImageDraw, _ = _pillow()
+    panels = layout(series, title_main, title_breakdown)
+    colors = ["#ffffff", TEXT, *dict.fromkeys(color for panel in panels for *_, color in panel["wedges"])]
+    index = {color: i for i, color in enumerate(colors)}
+    image = Image.new("P", (round(WIDTH * scale), round(2 * PANEL_HEIGHT * scale)), 0)
+    image.putpalette([channel for color in colors for channel in _rgb(color)])
+    draw = ImageDraw.Draw(image)
+    r = RADIUS * scale
+    for panel in panels:
+        cx, cy = panel["cx"] * scale, panel["cy"] * scale
+        draw.text((cx, panel["title_y"] * scale), panel["title"], fill=1, font=_font(round(TITLE_SIZE * scale), True), anchor="ms")
+        box = (cx - r, cy - r, cx + r, cy + r)
+        for theta1, theta2, color in panel["wedges"]:
+            if theta2 > theta1:
+                # Pillow measures angles clockwise on screen
+                draw.pieslice(box, -theta2, -theta1, fill=index[color], outline=0, width=max(1, round(2 * scale)))
+        pct_font = _font(round(panel["pct_size"] * scale), True)
+        for x, y, text in panel["pct_labels"]:
+            draw.text((x * scale, y * scale), text, fill=0, font=pct_font, anchor="mm")
+        legend_font = _font(round(panel["legend_size"] * scale), False)
+        swatch = _SWATCH * scale
+        for x, y, color, label in panel["legend"]:
+            x, y = x * scale, y * scale
+            draw.rectangle((x, y - swatch / 2, x + swatch, y + swatch / 2), fill=index[color])
+            draw.text((x + swatch + 8 * scale, y), label, fill=1, font=legend_font, anchor="lm")
+    buf = io.BytesIO()
+    # zlib level 3: a third faster than the default 6 for ~20 % more bytes on these flat colours
+    image.save(buf, format="PNG", compress_level=3)
+    return buf.getvalue()
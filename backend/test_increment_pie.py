@@ -0,0 +1,32 @@
+# /api/increment never links or renders a difference pie it cannot draw (run with pytest from backend/)
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import parameters
+
+client = TestClient(main.app)
+
+
+def increment(previous_gross, new_gross, plots):
+    body = {
+        "previous_gross": previous_gross, "new_gross": new_gross, "n_pagues": 14, "pagues_prorratejades": False,
+        "retribucio_en_especie_ann": 0, "grup_cotitzacio": next(iter(parameters.DEFAULT.ss_base_min_by_group)),
+        "contract_type": "indefinite", "other_deductions": 0, "age": 30, "plots": plots,
+    }
+    response = client.post("/api/increment", json=body)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_raise_links_a_chart_that_renders():
+    url = increment(30000, 40000, "url")["increment_pie"]
+    assert client.get(url).status_code == 200
+
+
+@pytest.mark.parametrize("previous_gross, new_gross", [(40000, 30000), (30000, 30000)])
+@pytest.mark.parametrize("plots", ["url", "png"])
+def test_pay_cut_has_no_pie(previous_gross, new_gross, plots):
+    result = increment(previous_gross, new_gross, plots)
+    assert result["increment_pie"] is None
+    assert result["increment_annual_net"] <= 0
@@ -0,0 +1,92 @@
+# Behaviour of the monthly payroll and its art. 87.5 regularization (run with pytest from backend/)
+from decimal import Decimal
+
+import parameters
+from calculator import perform_calculation
+from payroll_engine import EmployeePayroll, MonthlyPayroll, PayrollTerms, annual_quota
+from utils import FamilySituation
+
+GRUP = next(iter(parameters.DEFAULT.ss_base_min_by_group))
+CENT = Decimal("0.01")
+
+
+def terms(gross, **changes):
+    return PayrollTerms(gross=Decimal(gross), grup_cotitzacio=GRUP, contract_type="indefinite", **changes)
+
+
+def pay_year(employee, changes=None):
+    """Pay every month left; `changes` maps a month to the PayrollTerms fields that change from it."""
+    changes = changes or {}
+    while employee.next_month <= 12:
+        if employee.next_month in changes:
+            employee.change(**changes[employee.next_month])
+        employee.pay()
+    return employee.payslips
+
+
+def test_unchanged_year_matches_the_annual_calculation():
+    t = terms("40000")
+    calc = perform_calculation(t.gross, t.n_pagues, t.pagues_prorratejades, t.retribucio_en_especie_ann,
+                               t.grup_cotitzacio, t.contract_type, t.other_deductions, t.fam, t.region)
+    employee = EmployeePayroll(t)
+    payslips = pay_year(employee)
+
+    assert employee.regularizations == 1
+    assert {p.tipo_retencio for p in payslips} == {calc.tipo_retencio}
+    assert [p.regularized for p in payslips] == [True] + [False] * 11
+    assert sum(p.gross for p in payslips) == t.gross
+    # the extra pagues go out in June and December
+    assert [p.month for p in payslips if p.gross > Decimal("1.5") * payslips[0].gross] == [6, 12]
+    assert abs(employee.ss_paid - calc.total_ss_anual) < CENT
+    # the rate is truncated to two decimals, so the year withholds at most a few euros less
+    assert Decimal("0") <= calc.cuota_irpf_anual - employee.retenido < Decimal("5")
+
+
+def test_mid_year_raise_regularizes_the_remaining_months():
+    employee = EmployeePayroll(terms("30000"))
+    payslips = pay_year(employee, {7: {"gross": Decimal("36000")}})
+
+    before, after = payslips[:6], payslips[6:]
+    assert employee.regularizations == 2
+    assert len({p.tipo_retencio for p in before}) == 1 and len({p.tipo_retencio for p in after}) == 1
+    assert after[0].regularized and after[0].tipo_retencio > before[0].tipo_retencio
+    # paid: half a year of each salary
+    assert employee.percibido == Decimal("33000.00")
+    # what was withheld covers the quota on what was actually paid, give or take the rate truncation
+    quota = annual_quota(employee.percibido, employee.ss_paid, employee.terms, employee.params)
+    assert Decimal("0") <= quota - employee.retenido < Decimal("10")
+
+
+def test_child_added_in_july_lowers_the_rate_from_july():
+    employee = EmployeePayroll(terms("40000", fam=FamilySituation(age=35)))
+    payslips = pay_year(employee, {7: {"fam": FamilySituation(age=35, children_ages=(0,))}})
+
+    before, after = payslips[:6], payslips[6:]
+    assert employee.regularizations == 2
+    assert all(p.tipo_retencio == before[0].tipo_retencio for p in before)
+    assert after[0].regularized and all(p.tipo_retencio < before[0].tipo_retencio for p in after)
+    # the child's minimum counts for the whole year, so the second half makes up for the first
+    quota = annual_quota(employee.percibido, employee.ss_paid, employee.terms, employee.params)
+    assert Decimal("0") <= quota - employee.retenido < Decimal("10")
+
+
+def test_june_hire_is_paid_its_share_of_the_year():
+    run = MonthlyPayroll()
+    run.add("E1", terms("30000"))
+    for _ in range(5):
+        run.close_month()
+    run.add("E2", terms("40000", n_pagues=14))
+    while run.month <= 12:
+        run.close_month()
+
+    hire = run.employees["E2"]
+    assert [p.month for p in hire.payslips] == list(range(6, 13))
+    # seven monthly pagues plus the June and December extras: 9 of 14
+    assert hire.percibido == Decimal("25714.29")
+    assert hire.regularizations == 1
+    # the rate is worked out on what the hire will really earn this year, not on the annual salary
+    full_year = EmployeePayroll(terms("40000", n_pagues=14))
+    full_year.pay()
+    assert hire.payslips[0].tipo_retencio < full_year.tipo_retencio
+    quota = annual_quota(hire.percibido, hire.ss_paid, hire.terms, hire.params)
+    assert Decimal("0") <= quota - hire.retenido < Decimal("5")
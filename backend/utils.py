@@ -1,8 +1,11 @@
 # All utility functions and classes for IRPF and SS calculations
+from bisect import bisect_right
 from dataclasses import dataclass, field
+from functools import lru_cache
 from decimal import Decimal, ROUND_HALF_UP, getcontext
-from typing import List, Tuple, Optional, Dict
+from typing import Tuple, Optional, Dict
 from variables import *
+import variables
 
 # Increase precision
 getcontext().prec = 28
@@ -19,87 +22,221 @@ def truncar(x: Decimal) -> Decimal:
 def round_euro(x: Decimal) -> Decimal:
     return redondear1(x)
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class FamilySituation:
+    """
+    Immutable and hashable: sequences are stored as tuples (lists are accepted and converted),
+    and the minimum is computed once per distinct family (see `_minimo_personal_familiar`).
+    """
     age: int = 30
-    children_ages: List[int] = field(default_factory=list)
-    children_disabilities: List[int] = field(default_factory=list)
-    ascendents_ages: List[int] = field(default_factory=list)
+    children_ages: Tuple[int, ...] = ()
+    children_disabilities: Tuple[int, ...] = ()
+    ascendents_ages: Tuple[int, ...] = ()
     disability_percent_self: int = 0
     disability_self_help: bool = False
-    disability_relatives: List[Tuple[int, bool]] = field(default_factory=list)
-
-    def minimo_personal_familiar(self) -> Decimal:
-        # Mínimo del contribuyente
-        minimo = MINIMO_CONTRIBUYENTE
-        if self.age >= 75:
-            minimo += MINIMO_75
-        if self.age >= 65:
-            minimo += MINIMO_65
-
-        # Mínimo por descendientes < 25 años o con discapacidad
-        mindesg = Decimal("0.00")
-        mindes3 = Decimal("0.00")
-        for i, child_age in enumerate(self.children_ages):
-            if child_age < 25:
-                order = i + 1
-                if order <= len(CHILDREN_UNDER_25_ADJUSTMENT):
-                    mindesg += CHILDREN_UNDER_25_ADJUSTMENT[order - 1][1]
-                else:
-                    mindesg += CHILDREN_UNDER_25_ADJUSTMENT[-1][1]
-                if child_age < 3:
-                    mindes3 += CHILDREN_UNDER_3_EXTRA
-        mindesg = redondear1(mindesg)
-        mindes3 = redondear1(mindes3)
-        mindes = mindesg + mindes3
-
-        # Mínimo por ascendientes >= 65 años o con discapacidad
-        minas = Decimal("0.00")
-        for asc_age in self.ascendents_ages:
-            if asc_age >= 75:
-                minas += ASCENDENTS_ADJUSTMENT[1][1]
-            elif asc_age >= 65:
-                minas += ASCENDENTS_ADJUSTMENT[0][1]
-        minas = redondear1(minas)
-
-        # Mínimo por discapacidad del contribuyente
-        mindisc = Decimal("0.00")
-        if self.disability_percent_self >= 65:
-            mindisc += DISABILITY_SELF_ADJUSTMENTS[1][1]
-        elif self.disability_percent_self >= 33:
-            mindisc += DISABILITY_SELF_ADJUSTMENTS[0][1]
-        if self.disability_self_help:
-            mindisc += DISABILITY_SELF_HELP_EXTRA
-
-        # Mínimo por discapacidad de descendientes y ascendientes
-        disdes = Decimal("0.00")
-        for perc in self.children_disabilities:
-            if perc >= 65:
-                disdes += DISABILITY_RELATIVES_ADJUSTMENTS[1][1]
-            elif perc >= 33:
-                disdes += DISABILITY_RELATIVES_ADJUSTMENTS[0][1]
-        disas = Decimal("0.00")
-        for perc in self.disability_relatives:
-            if perc[0] >= 65:
-                disas += DISABILITY_RELATIVES_ADJUSTMENTS[1][1]
-            elif perc[0] >= 33:
-                disas += DISABILITY_RELATIVES_ADJUSTMENTS[0][1]
-            if perc[1]:
-                disas += DISABILITY_RELATIVES_HELP_EXTRA
-        mindis = mindisc + disdes + disas
-
-        # Suma total de mínimos
-        mincon = minimo
-        minperfa = mincon + mindes + minas + mindis
-        return redondear1(minperfa)
-def calcular_gastos_deducibles(retrib, cotizaciones, movilidad_geografica, discapacidad_trabajador_activo, discapacidad_trabajador_activo_grave, situper):
-    gastosgen = GASTOS_DEDUCIDOS["otros_gastos_generales"]
-    incregasmovil = GASTOS_DEDUCIDOS["movilidad_geografica"] if movilidad_geografica else Decimal("0.00")
+    disability_relatives: Tuple[Tuple[int, bool], ...] = ()
+    _minimo: Optional[Decimal] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "children_ages", tuple(self.children_ages))
+        object.__setattr__(self, "children_disabilities", tuple(self.children_disabilities))
+        object.__setattr__(self, "ascendents_ages", tuple(self.ascendents_ages))
+        object.__setattr__(self, "disability_relatives", tuple(tuple(r) for r in self.disability_relatives))
+
+    def minimo_personal_familiar(self, minimos: "PersonalMinimums" = None) -> Decimal:
+        # Only the default year's minimum is memoized on the instance; other years go through the lru_cache
+        if minimos is not None and minimos is not DEFAULT_MINIMUMS:
+            return _minimo_personal_familiar(self, minimos)
+        minimo = self._minimo
+        if minimo is None:
+            minimo = _minimo_personal_familiar(self, DEFAULT_MINIMUMS)
+            object.__setattr__(self, "_minimo", minimo)
+        return minimo
+
+
+@dataclass(frozen=True)
+class PersonalMinimums:
+    """The amounts of Cuadro 1 for one year (see variables.py for their meaning)."""
+    contribuyente: Decimal
+    mas_65: Decimal
+    mas_75: Decimal
+    children_under_25: Tuple[Tuple[int, Decimal], ...]
+    children_under_3_extra: Decimal
+    ascendents: Tuple[Tuple[int, Decimal], ...]
+    disability_self: Tuple[Tuple[int, Decimal], ...]
+    disability_self_help_extra: Decimal
+    disability_relatives: Tuple[Tuple[int, Decimal], ...]
+    disability_relatives_help_extra: Decimal
+
+    @classmethod
+    def from_module(cls, module):
+        return cls(
+            module.MINIMO_CONTRIBUYENTE, module.MINIMO_65, module.MINIMO_75,
+            tuple(module.CHILDREN_UNDER_25_ADJUSTMENT), module.CHILDREN_UNDER_3_EXTRA,
+            tuple(module.ASCENDENTS_ADJUSTMENT), tuple(module.DISABILITY_SELF_ADJUSTMENTS),
+            module.DISABILITY_SELF_HELP_EXTRA, tuple(module.DISABILITY_RELATIVES_ADJUSTMENTS),
+            module.DISABILITY_RELATIVES_HELP_EXTRA,
+        )
+
+
+DEFAULT_MINIMUMS = PersonalMinimums.from_module(variables)
+
+
+@lru_cache(maxsize=1024)
+def _minimo_personal_familiar(family: FamilySituation, m: PersonalMinimums) -> Decimal:
+    """Minimum per Cuadro 1 of the withholding algorithm; shared across requests for equal families."""
+    # Mínimo del contribuyente
+    minimo = m.contribuyente
+    if family.age >= 75:
+        minimo += m.mas_75
+    if family.age >= 65:
+        minimo += m.mas_65
+
+    # Mínimo por descendientes < 25 años o con discapacidad
+    mindesg = Decimal("0.00")
+    mindes3 = Decimal("0.00")
+    for i, child_age in enumerate(family.children_ages):
+        if child_age < 25:
+            order = i + 1
+            if order <= len(m.children_under_25):
+                mindesg += m.children_under_25[order - 1][1]
+            else:
+                mindesg += m.children_under_25[-1][1]
+            if child_age < 3:
+                mindes3 += m.children_under_3_extra
+    mindesg = redondear1(mindesg)
+    mindes3 = redondear1(mindes3)
+    mindes = mindesg + mindes3
+
+    # Mínimo por ascendientes >= 65 años o con discapacidad
+    minas = Decimal("0.00")
+    for asc_age in family.ascendents_ages:
+        if asc_age >= 75:
+            minas += m.ascendents[1][1]
+        elif asc_age >= 65:
+            minas += m.ascendents[0][1]
+    minas = redondear1(minas)
+
+    # Mínimo por discapacidad del contribuyente
+    mindisc = Decimal("0.00")
+    if family.disability_percent_self >= 65:
+        mindisc += m.disability_self[1][1]
+    elif family.disability_percent_self >= 33:
+        mindisc += m.disability_self[0][1]
+    if family.disability_self_help:
+        mindisc += m.disability_self_help_extra
+
+    # Mínimo por discapacidad de descendientes y ascendientes
+    disdes = Decimal("0.00")
+    for perc in family.children_disabilities:
+        if perc >= 65:
+            disdes += m.disability_relatives[1][1]
+        elif perc >= 33:
+            disdes += m.disability_relatives[0][1]
+    disas = Decimal("0.00")
+    for perc in family.disability_relatives:
+        if perc[0] >= 65:
+            disas += m.disability_relatives[1][1]
+        elif perc[0] >= 33:
+            disas += m.disability_relatives[0][1]
+        if perc[1]:
+            disas += m.disability_relatives_help_extra
+    mindis = mindisc + disdes + disas
+
+    # Suma total de mínimos
+    mincon = minimo
+    minperfa = mincon + mindes + minas + mindis
+    return redondear1(minperfa)
+
+
+@dataclass(slots=True)
+class CalculationResult:
+    """
+    Result of perform_calculation: every quantity stored once, in slots. Legacy names (see
+    `_CALCULATION_ALIASES`) are read-only properties, and `result["key"]` still works for old callers.
+    """
+    # ── SS breakdown ─────────────────────────────────────────────────────────
+    base_ss_mensual: Decimal
+    ss_contingencies_comunes_mensual: Decimal
+    ss_atur_mensual: Decimal
+    ss_formacio_mensual: Decimal
+    ss_mei_mensual: Decimal
+    total_ss_mensual: Decimal
+    total_ss_anual: Decimal
+    # ── IRPF chain ───────────────────────────────────────────────────────────
+    gastos_deducibles: Decimal
+    rendiment_net_treball: Decimal
+    reduccio_rendiments_treball: Decimal
+    base_imponible: Decimal
+    minim_personal_familiar: Decimal
+    cuota_irpf_anual: Decimal
+    tipo_retencio: Decimal
+    # ── Marginal ─────────────────────────────────────────────────────────────
+    marginal_irpf_rate: Decimal
+    marginal_irpf_percent: Decimal
+    # ── Per paga (rounded to cents) ──────────────────────────────────────────
+    gross_per_paga: Decimal
+    ss_per_paga: Decimal
+    irpf_per_paga: Decimal
+    net_per_paga: Decimal
+    net_monthly_equivalent: Decimal
+    # ── Inputs passed through for the charts ─────────────────────────────────
+    gross_including_benefits: Decimal
+    n_pagues: int
+    pagues_prorratejades: bool
+    retribucio_en_especie_ann: Decimal
+    grup_cotitzacio: str
+    contract_type: str
+    other_deductions: Decimal
+    fam: FamilySituation
+    year: int
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, _CALCULATION_ALIASES.get(key, key))
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key):
+        return key in _CALCULATION_KEYS
+
+    def get(self, key, default=None):
+        return self[key] if key in _CALCULATION_KEYS else default
+
+    def keys(self):
+        return iter(_CALCULATION_KEYS)
+
+    def as_dict(self):
+        """Plain dict with every field and legacy name, as perform_calculation used to return."""
+        return {key: self[key] for key in _CALCULATION_KEYS}
+
+
+# legacy name -> stored field
+_CALCULATION_ALIASES = {
+    "rendiment_brut_treball":           "gross_including_benefits",
+    "cotitzacions_mensuals":            "total_ss_mensual",
+    "cotitzacions_anuals":              "total_ss_anual",
+    "irpf_anual":                       "cuota_irpf_anual",
+    "ss_contingencies_comunes_monthly": "ss_contingencies_comunes_mensual",
+    "t_des_monthly":                    "ss_atur_mensual",
+    "ss_training_monthly":              "ss_formacio_mensual",
+    "ss_mei_monthly":                   "ss_mei_mensual",
+    "otros_gastos_generales":           "gastos_deducibles",
+    "reduction_by_work":                "reduccio_rendiments_treball",
+}
+for _alias, _name in _CALCULATION_ALIASES.items():
+    setattr(CalculationResult, _alias, property(lambda self, _name=_name: getattr(self, _name)))
+_CALCULATION_KEYS = dict.fromkeys(CalculationResult.__slots__ + tuple(_CALCULATION_ALIASES))
+
+
+def calcular_gastos_deducibles(retrib, cotizaciones, movilidad_geografica, discapacidad_trabajador_activo, discapacidad_trabajador_activo_grave, situper, gastos_deducidos=GASTOS_DEDUCIDOS):
+    gastosgen = gastos_deducidos["otros_gastos_generales"]
+    incregasmovil = gastos_deducidos["movilidad_geografica"] if movilidad_geografica else Decimal("0.00")
     if situper == "ACTIVO":
         if discapacidad_trabajador_activo_grave:
-            incregasdistra = GASTOS_DEDUCIDOS["discapacidad_trabajador_activo_grave"]
+            incregasdistra = gastos_deducidos["discapacidad_trabajador_activo_grave"]
         elif discapacidad_trabajador_activo:
-            incregasdistra = GASTOS_DEDUCIDOS["discapacidad_trabajador_activo"]
+            incregasdistra = gastos_deducidos["discapacidad_trabajador_activo"]
         else:
             incregasdistra = Decimal("0.00")
     else:
@@ -165,43 +302,66 @@ def calcular_minoracion_vivienda(retrib, presviv, minopago):
     else:
         minopago = Decimal("0.00")
     return minopago
-def calcular_regularizacion(params):
-    # Esta función debe implementar la lógica de regularización y causas según el documento oficial
-    # params: dict con todas las variables necesarias
-    # Ejemplo de estructura mínima, debe completarse según necesidades reales
+def calcular_regularizacion(params, limite_max=Decimal("47.00")):
+    # Regularización del tipo (art. 87.5 RIRPF): la cuota anual con los datos nuevos, menos lo ya
+    # retenido, se reparte entre las retribuciones que quedan hasta final de año.
+    # params: regularizacion (hay meses ya pagados este año), cuota (cuota de retención anual),
+    # retrib (retribuciones anuales: percibidas + pendientes), percibido, retenido
     regularizacion = params.get("regularizacion", False)
-    causas = params.get("causas", {})
-    ceumeli = params.get("ceumeli", False)
     retrib = params.get("retrib", Decimal("0.00"))
-    percibido = params.get("percibido", Decimal("0.00"))
     cuota = params.get("cuota", Decimal("0.00"))
-    # ... otros parámetros
-    # Implementar aquí la lógica de cálculo de regularización
-    # (ver documento para todos los casos y fórmulas)
-    # Devolver los valores calculados
+    percibido = params.get("percibido", Decimal("0.00")) if regularizacion else Decimal("0.00")
+    retenido = params.get("retenido", Decimal("0.00")) if regularizacion else Decimal("0.00")
+    # Cuota pendiente de retener
+    importereg = cuota - retenido
+    if importereg < 0:
+        importereg = Decimal("0.00")
+    # Nuevo tipo sobre las retribuciones pendientes
+    pendiente = retrib - percibido
+    tiporeg = truncar((importereg / pendiente) * Decimal("100")) if pendiente > 0 else Decimal("0.00")
+    if tiporeg > limite_max:
+        tiporeg = limite_max
+    # Retención de las retribuciones pendientes al nuevo tipo
+    importe = redondear1(pendiente * tiporeg / Decimal("100")) if pendiente > 0 else Decimal("0.00")
     return {
-        "importereg": Decimal("0.00"),
-        "tiporeg": Decimal("0.00"),
-        "importe": Decimal("0.00"),
+        "importereg": importereg,
+        "tiporeg": tiporeg,
+        "importe": importe,
     }
 
-@dataclass
+@dataclass(frozen=True)
 class IRPFScale:
-    brackets: List[Tuple[Decimal, Optional[Decimal], Decimal]] = field(default_factory=list)
+    """
+    Tax scale compiled on construction: `bounds` holds the sorted lower bound of every bracket and
+    `cumulative` the tax accrued up to each bound, so lookups are one bisect plus one multiply-add.
+    Instances are immutable; combined scales are shared through `_COMBINED_SCALES`.
+    """
+    brackets: Tuple[Tuple[Decimal, Optional[Decimal], Decimal], ...] = ()
+    bounds: Tuple[Decimal, ...] = field(init=False, repr=False, compare=False)
+    rates: Tuple[Decimal, ...] = field(init=False, repr=False, compare=False)
+    cumulative: Tuple[Decimal, ...] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        brackets = tuple(
+            (Decimal(low), Decimal(high) if high is not None else None, Decimal(rate))
+            for low, high, rate in self.brackets
+        )
+        cumulative = []
+        acc = Decimal("0")
+        for low, high, rate in brackets:
+            cumulative.append(acc)
+            if high is not None:
+                acc += (high - low) * rate
+        object.__setattr__(self, "brackets", brackets)
+        object.__setattr__(self, "bounds", tuple(low for low, _, _ in brackets))
+        object.__setattr__(self, "rates", tuple(rate for _, _, rate in brackets))
+        object.__setattr__(self, "cumulative", tuple(cumulative))
 
     def tax_on_base(self, base: Decimal) -> Decimal:
-        tax = Decimal("0")
-        for low, high, rate in self.brackets:
-            low = Decimal(low)
-            high = Decimal(high) if high is not None else None
-            if base <= low:
-                break
-            upper = base if (high is None or base < high) else high
-            taxable = upper - low
-            if taxable <= 0:
-                continue
-            tax += taxable * rate
-        return tax
+        if not self.bounds or base <= self.bounds[0]:
+            return Decimal("0")
+        i = bisect_right(self.bounds, base) - 1
+        return self.cumulative[i] + (base - self.bounds[i]) * self.rates[i]
 
     def rate_at(self, base: Decimal) -> Decimal:
         """
@@ -212,40 +372,45 @@ class IRPFScale:
         This means that if `base` equals a bracket upper bound, the next bracket's rate is returned.
         """
         b = Decimal(base)
-        if b <= Decimal("0"):
+        if b <= Decimal("0") or not self.bounds or b < self.bounds[0]:
             return Decimal("0.00")
-        for low, high, rate in self.brackets:
-            low = Decimal(low)
-            high = Decimal(high) if high is not None else None
-            # If high is None (last bracket) or base is strictly less than high, then this bracket
-            # contains the next infinitesimal above `base` provided base >= low.
-            if high is None or b < high:
-                if b >= low:
-                    return Decimal(rate)
-                else:
-                    return Decimal("0.00")
-        return Decimal("0.00")
+        return self.rates[bisect_right(self.bounds, b) - 1]
 
     @classmethod
     def combined_scale(cls, regional_scale, state_scale):
-        breakpoints = set()
-        for low, high, _ in regional_scale + state_scale:
-            breakpoints.add(low)
-            if high is not None:
-                breakpoints.add(high)
-        breakpoints = sorted(breakpoints)
+        key = (tuple(regional_scale), tuple(state_scale))
+        scale = _COMBINED_SCALES.get(key)
+        if scale is None:
+            scale = _COMBINED_SCALES[key] = cls._merge(regional_scale, state_scale)
+        return scale
+
+    @classmethod
+    def _merge(cls, regional_scale, state_scale):
+        regional = cls(regional_scale)
+        state = cls(state_scale)
+        breakpoints = sorted(set(regional.bounds) | set(state.bounds) | {
+            high for _, high, _ in regional.brackets + state.brackets if high is not None
+        })
         combined_brackets = []
-        for i in range(len(breakpoints) - 1):
-            low = Decimal(breakpoints[i])
-            high = Decimal(breakpoints[i+1])
-            r_rate = next((rate for l, h, rate in regional_scale if l <= low < (h if h is not None else Decimal("1e18"))), Decimal(0))
-            s_rate = next((rate for l, h, rate in state_scale if l <= low < (h if h is not None else Decimal("1e18"))), Decimal(0))
-            combined_brackets.append((low, high, r_rate + s_rate))
-        last_r_rate = next((rate for l, h, rate in regional_scale if l <= breakpoints[-1] < (h if h is not None else Decimal("1e18"))), Decimal(0))
-        last_s_rate = next((rate for l, h, rate in state_scale if l <= breakpoints[-1] < (h if h is not None else Decimal("1e18"))), Decimal(0))
-        combined_brackets.append((Decimal(breakpoints[-1]), None, last_r_rate + last_s_rate))
+        for i, low in enumerate(breakpoints):
+            high = breakpoints[i + 1] if i + 1 < len(breakpoints) else None
+            combined_brackets.append((low, high, cls._rate_in(regional, low) + cls._rate_in(state, low)))
         return cls(combined_brackets)
 
+    @staticmethod
+    def _rate_in(scale, value):
+        # Rate of the bracket containing `value` (low <= value < high), 0 outside the scale
+        i = bisect_right(scale.bounds, value) - 1
+        if i < 0:
+            return Decimal(0)
+        high = scale.brackets[i][1]
+        return scale.rates[i] if high is None or value < high else Decimal(0)
+
+
+# Registry of compiled combined scales, keyed by the (regional, state) bracket tuples
+_COMBINED_SCALES: Dict[tuple, IRPFScale] = {}
+
+
 def apply_base_limits(base: Decimal, base_min: Decimal, base_max: Decimal, is_daily: bool = False, days_in_month: int = 30) -> Decimal:
     if is_daily:
         base_diari = base / Decimal(days_in_month)
@@ -262,18 +427,18 @@ def calculate_base_imposable_irpf(annual_gross: Decimal, annual_employee_ss: Dec
     return base
 
 
-def compute_reduction_by_work(rendimiento_neto: Decimal) -> Decimal:
+def compute_reduction_by_work(rendimiento_neto: Decimal, reduction_work=REDUCTION_WORK) -> Decimal:
     """
     Compute the 'reducción por obtención de rendimientos del trabajo' per Cuadro 2.
     """
     rn = rendimiento_neto
-    if rn <= REDUCTION_WORK["upper1"]:
-        return REDUCTION_WORK["amount1"]
-    if rn <= REDUCTION_WORK["upper2"]:
-        val = REDUCTION_WORK["amount1"] - (REDUCTION_WORK["coef2"] * (rn - REDUCTION_WORK["upper1"]))
+    if rn <= reduction_work["upper1"]:
+        return reduction_work["amount1"]
+    if rn <= reduction_work["upper2"]:
+        val = reduction_work["amount1"] - (reduction_work["coef2"] * (rn - reduction_work["upper1"]))
         return val.quantize(Decimal("0.01"))
-    if rn <= REDUCTION_WORK["upper3"]:
-        val = REDUCTION_WORK["base3"] - (REDUCTION_WORK["coef3"] * (rn - REDUCTION_WORK["upper2"]))
+    if rn <= reduction_work["upper3"]:
+        val = reduction_work["base3"] - (reduction_work["coef3"] * (rn - reduction_work["upper2"]))
         return val.quantize(Decimal("0.01"))
     return Decimal("0.00")
 
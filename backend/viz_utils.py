@@ -1,20 +1,19 @@
+import threading
 import matplotlib.pyplot as plt
 import matplotlib as mpl
+from matplotlib.figure import Figure
+from matplotlib.ticker import FuncFormatter
 from decimal import Decimal
 import numpy as np
+from chart_data import increment_difference_args, net_pay_and_taxes_series, salary_blocks_series
 
-# ── Brand palette ────────────────────────────────────────────────────────────
-_RED      = "#e2231a"
-_RED_DARK = "#b81b13"
-_GREEN    = "#52b788"
-_ORANGE   = "#e67e22"
-_BLUE     = "#3498db"
-_PURPLE   = "#9b59b6"
-_TEAL     = "#1abc9c"
-_GRAY     = "#adb5bd"
-
-_PIE_TAXES_COLORS = [_RED, _ORANGE, _BLUE, _PURPLE, _TEAL]
-_PIE_MAIN_COLORS  = [_GREEN, _RED]
+# ── Brand palette (chart_style, shared with the SVG renderer) ────────────────
+from chart_style import (
+    BLUE as _BLUE, GRAY as _GRAY, GREEN as _GREEN, ORANGE as _ORANGE, RED as _RED,
+    PIE_MAIN_COLORS as _PIE_MAIN_COLORS, PIE_PCT_DISTANCE as _PIE_PCT_DISTANCE,
+    PIE_START_ANGLE as _PIE_START_ANGLE, PIE_TAXES_COLORS as _PIE_TAXES_COLORS, PIE_TITLES,
+    pct_label as _autopct_format, pie_values_drawable as _pie_values_drawable,
+)
 
 def _apply_style():
     mpl.rcParams.update({
@@ -34,36 +33,16 @@ def _apply_style():
         "ytick.color":       "#666666",
     })
 
-def plot_increment_difference_pie(prev_calc, new_calc, return_fig=False):
+def plot_increment_difference_pie(prev_calc, new_calc, return_fig=False, template=False):
     """
     Pie plot for the difference between two salary calculations, using plot_net_pay_and_taxes logic but for the increment only.
     """
-    from decimal import Decimal
-    diff = {}
-    for k in [
-        "gross_including_benefits", "net_per_paga", "cotitzacions_anuals", "irpf_anual",
-        "ss_contingencies_comunes_monthly", "t_des_monthly", "ss_training_monthly", "ss_mei_monthly"
-    ]:
-        diff[k] = new_calc[k] - prev_calc[k]
-    n_pagues = new_calc["n_pagues"]
-    # Compose annual values for SS
-    ss_contingencies_comunes_annual = diff["ss_contingencies_comunes_monthly"] * Decimal(n_pagues)
-    t_des_annual = diff["t_des_monthly"] * Decimal(n_pagues)
-    ss_training_annual = diff["ss_training_monthly"] * Decimal(n_pagues)
-    ss_mei_annual = diff["ss_mei_monthly"] * Decimal(n_pagues)
     fig = plot_net_pay_and_taxes(
-        diff["gross_including_benefits"],
-        diff["net_per_paga"],
-        n_pagues,
-        diff["cotitzacions_anuals"],
-        diff["irpf_anual"],
-        ss_contingencies_comunes_annual,
-        t_des_annual,
-        ss_training_annual,
-        ss_mei_annual,
+        *increment_difference_args(prev_calc, new_calc),
         return_fig=True,
-        title_main="Increment Net vs Impostos Addicionals",
-        title_breakdown="Desglossat Impostos Addicionals per l'Increment",
+        title_main=PIE_TITLES["increment_difference_pie"][0],
+        title_breakdown=PIE_TITLES["increment_difference_pie"][1],
+        template=template,
     )
     if return_fig:
         return fig
@@ -71,6 +50,79 @@ def plot_increment_difference_pie(prev_calc, new_calc, return_fig=False):
         import matplotlib.pyplot as plt
         plt.show()
 
+# ── Figure templates ─────────────────────────────────────────────────────────
+# With template=True (and return_fig=True) the layout, styling, formatters and tight_layout are
+# built once per thread on a pyplot-free Figure; later calls only swap line/fill/wedge data.
+# The returned figure is reused by the next call on the same thread, so save it before that.
+_templates = threading.local()
+
+def _template(key, build):
+    cache = getattr(_templates, "figures", None)
+    if cache is None:
+        cache = _templates.figures = {}
+    tpl = cache.get(key)
+    if tpl is None:
+        tpl = cache[key] = build()
+    return tpl
+
+def _draw_pie(ax, values, colors, title, labels, label_fontsize, pct_fontsize):
+    wedges, _, autotexts = ax.pie(
+        values,
+        autopct=_autopct_format,
+        startangle=_PIE_START_ANGLE,
+        colors=colors,
+        pctdistance=_PIE_PCT_DISTANCE,
+        wedgeprops={"linewidth": 1.5, "edgecolor": "white"},
+    )
+    for at in autotexts:
+        at.set_fontsize(pct_fontsize)
+        at.set_color("white")
+        at.set_fontweight("bold")
+    ax.set_title(
+        title, fontsize=14, fontweight="bold",
+        color="#1a1a1a", pad=14,
+    )
+    ax.legend(
+        labels, loc="upper center", bbox_to_anchor=(0.5, -0.05),
+        fontsize=label_fontsize, ncol=2, frameon=False,
+    )
+    return wedges, autotexts
+
+def _draw_net_pay_and_taxes(axes, series, title_main, title_breakdown):
+    # ── Chart 1: Net vs Total taxes ───────────────────────────────────────────
+    main = _draw_pie(axes[0], series["main"]["values"], _PIE_MAIN_COLORS, title_main,
+                     series["main"]["labels"], label_fontsize=11, pct_fontsize=13)
+    # ── Chart 2: Taxes breakdown ──────────────────────────────────────────────
+    breakdown = _draw_pie(axes[1], series["breakdown"]["values"], _PIE_TAXES_COLORS, title_breakdown,
+                          series["breakdown"]["labels"], label_fontsize=10, pct_fontsize=12)
+    return main, breakdown
+
+def _update_pie(wedges, autotexts, values):
+    # Same geometry as Axes.pie: normalised fractions, counterclockwise from startangle
+    fracs = np.asarray(values, dtype=float) / float(sum(values))
+    theta1 = _PIE_START_ANGLE / 360.0
+    for wedge, autotext, frac in zip(wedges, autotexts, fracs):
+        theta2 = theta1 + frac
+        wedge.set_theta1(360.0 * theta1)
+        wedge.set_theta2(360.0 * theta2)
+        thetam = np.pi * (theta1 + theta2)
+        autotext.set_position((_PIE_PCT_DISTANCE * np.cos(thetam), _PIE_PCT_DISTANCE * np.sin(thetam)))
+        autotext.set_text(_autopct_format(100.0 * frac))
+        theta1 = theta2
+
+class _NetPayAndTaxesTemplate:
+    def __init__(self, series, title_main, title_breakdown):
+        _apply_style()
+        self.fig = Figure(figsize=(6, 10), facecolor="white")
+        axes = self.fig.subplots(2, 1)
+        self.pies = _draw_net_pay_and_taxes(axes, series, title_main, title_breakdown)
+        self.fig.tight_layout(pad=3.0)
+
+    def update(self, series):
+        for (wedges, autotexts), part in zip(self.pies, ("main", "breakdown")):
+            _update_pie(wedges, autotexts, series[part]["values"])
+        return self.fig
+
 def plot_net_pay_and_taxes(
     gross_including_benefits: Decimal,
     net_per_paga: Decimal,
@@ -82,76 +134,23 @@ def plot_net_pay_and_taxes(
     ss_training_annual: Decimal,
     ss_mei_annual: Decimal,
     return_fig: bool = False,
-    title_main: str = "Sou Net vs Impostos Anuals",
-    title_breakdown: str = "Desglossat d'Impostos i Cotitzacions",
+    title_main: str = PIE_TITLES["net_pay_and_taxes"][0],
+    title_breakdown: str = PIE_TITLES["net_pay_and_taxes"][1],
+    template: bool = False,
 ):
-    _apply_style()
-    fig, axes = plt.subplots(2, 1, figsize=(6, 10), facecolor="white")
-    total_taxes_annual = cotitzacions_anuals + irpf_anual
-    net_annual = net_per_paga * Decimal(n_pagues)
-
-    def autopct_format(pct):
-        return (f"{pct:.1f}%") if pct > 3 else ""
-
-    # ── Chart 1: Net vs Total taxes ───────────────────────────────────────────
-    net_vs_taxes_labels = ["Sou Net Anual", "Impostos i Cotitzacions"]
-    net_vs_taxes_values = [float(net_annual), float(total_taxes_annual)]
-    wedges1, _, autotexts1 = axes[0].pie(
-        net_vs_taxes_values,
-        autopct=autopct_format,
-        startangle=90,
-        colors=_PIE_MAIN_COLORS,
-        pctdistance=0.72,
-        wedgeprops={"linewidth": 1.5, "edgecolor": "white"},
-    )
-    for at in autotexts1:
-        at.set_fontsize(13)
-        at.set_color("white")
-        at.set_fontweight("bold")
-    axes[0].set_title(
-        title_main, fontsize=14, fontweight="bold",
-        color="#1a1a1a", pad=14,
-    )
-    axes[0].legend(
-        net_vs_taxes_labels, loc="upper center", bbox_to_anchor=(0.5, -0.05),
-        fontsize=11, ncol=2, frameon=False,
+    series = net_pay_and_taxes_series(
+        gross_including_benefits, net_per_paga, n_pagues, cotitzacions_anuals, irpf_anual,
+        ss_contingencies_comunes_annual, t_des_annual, ss_training_annual, ss_mei_annual,
     )
+    # Negative or all-zero parts (e.g. a pay cut) take the regular path, which decides how to fail
+    if template and return_fig and all(_pie_values_drawable(series[p]["values"]) for p in ("main", "breakdown")):
+        tpl = _template(("net_pay_and_taxes", title_main, title_breakdown),
+                        lambda: _NetPayAndTaxesTemplate(series, title_main, title_breakdown))
+        return tpl.update(series)
 
-    # ── Chart 2: Taxes breakdown ──────────────────────────────────────────────
-    taxes_breakdown_labels = [
-        "IRPF",
-        "SS: Contingències Comunes",
-        "SS: Atur",
-        "SS: Formació Professional",
-        "SS: MEI",
-    ]
-    taxes_breakdown_values = [
-        float(irpf_anual),
-        float(ss_contingencies_comunes_annual),
-        float(t_des_annual),
-        float(ss_training_annual),
-        float(ss_mei_annual),
-    ]
-    wedges2, _, autotexts2 = axes[1].pie(
-        taxes_breakdown_values,
-        autopct=autopct_format,
-        startangle=90,
-        colors=_PIE_TAXES_COLORS,
-        pctdistance=0.72,
-        wedgeprops={"linewidth": 1.5, "edgecolor": "white"},
-    )
-    for at in autotexts2:
-        at.set_fontsize(12)
-        at.set_color("white")
-        at.set_fontweight("bold")
-    axes[1].set_title(
-        title_breakdown, fontsize=14, fontweight="bold",
-        color="#1a1a1a", pad=14,
-    )
-    axes[1].legend(
-        taxes_breakdown_labels, loc="upper center", bbox_to_anchor=(0.5, -0.05),
-        fontsize=10, ncol=2, frameon=False,
-    )
+    _apply_style()
+    fig, axes = plt.subplots(2, 1, figsize=(6, 10), facecolor="white")
+    _draw_net_pay_and_taxes(axes, series, title_main, title_breakdown)
 
     plt.tight_layout(pad=3.0)
     if return_fig:
@@ -159,128 +158,129 @@ def plot_net_pay_and_taxes(
     else:
         plt.show()
 
-def plot_salary_blocks(
-    gross: Decimal,
-    n_pagues: int,
-    pagues_prorratejades: bool,
-    retribucio_en_especie_ann: Decimal,
-    grup_cotitzacio: str,
-    contract_type: str,
-    fam,
-    region: str,
-    other_deductions: Decimal,
-    compute_net_pay,
-    return_fig: bool = False
-):
-    # New behavior: plot two lines
-    # - Marginal IRPF (%) vs gross
-    # - Total IRPF (euros, annual) vs gross
-    # We'll sample a grid of gross values and call compute_net_pay for each sample to obtain
-    # the base_imponible, marginal rate and total IRPF. Using the marginal returned by
-    # compute_net_pay (if available) gives an exact derivative-based marginal.
-    gross_float = float(gross)
-    if gross_float <= 0:
-        raise ValueError("Gross salary must be positive to plot")
-
-    num_points = 200
-    xs = np.linspace(0.01, gross_float, num_points)
-    gross_points = [Decimal(x) for x in xs]
-    marginal_percents = []
-    irpf_totals = []
-
-    for g in gross_points:
-        res = compute_net_pay(
-            g,
-            n_pagues,
-            pagues_prorratejades,
-            retribucio_en_especie_ann,
-            grup_cotitzacio,
-            contract_type,
-            other_deductions,
-            fam,
-            region
-        )
-        # prefer precomputed marginal percent from the calculation, otherwise derive it
-        if "marginal_irpf_percent" in res:
-            m = float(res["marginal_irpf_percent"])
-        elif "marginal_irpf_rate" in res:
-            m = float(res["marginal_irpf_rate"] * Decimal("100"))
-        else:
-            # fallback: approximate via small finite difference on IRPF (shouldn't happen often)
-            eps = Decimal("1.00")
-            r_plus = compute_net_pay(g + eps, n_pagues, pagues_prorratejades, retribucio_en_especie_ann, grup_cotitzacio, contract_type, other_deductions, fam, region)
-            irpf_diff = float((r_plus["irpf_anual"] - res["irpf_anual"]))
-            m = (irpf_diff / 1.0) / float(g) * 100.0 if g > 0 else 0.0
-        marginal_percents.append(m)
-        irpf_totals.append(float(res["irpf_anual"]))
-
-    # Build additional series: IRPF as percentage of gross, net annual
-    irpf_percents = []
-    net_annuals = []
-    for g, m, irpf in zip(gross_points, marginal_percents, irpf_totals):
-        gross_val = float(g)
-        irpf_val = float(irpf)
-        irpf_percents.append(100.0 * irpf_val / gross_val if gross_val > 0 else 0.0)
-        # compute net annual using compute_net_pay (some callers already provided net in previous loop,
-        # but we recompute to be safe and accurate)
-        res = compute_net_pay(Decimal(str(gross_val)), n_pagues, pagues_prorratejades, retribucio_en_especie_ann, grup_cotitzacio, contract_type, other_deductions, fam, region)
-        net_annuals.append(float(res["net_per_paga"] * Decimal(n_pagues)))
+_LW = 2.2
 
-    _apply_style()
-    fig, axes = plt.subplots(4, 1, figsize=(7, 18), sharex=True, facecolor="white")
+def _fill_salary_blocks(axes, series):
+    xvals = series["gross"]
     ax_marginal, ax_irpf_percent, ax_irpf_amount, ax_net_vs_gross = axes
+    return [
+        ax_marginal.fill_between(xvals, series["marginal_percent"], step="post", color=_RED, alpha=0.10),
+        ax_irpf_percent.fill_between(xvals, series["effective_percent"], color=_ORANGE, alpha=0.10),
+        ax_irpf_amount.fill_between(xvals, series["irpf_annual"], color=_BLUE, alpha=0.08),
+        ax_net_vs_gross.fill_between(xvals, series["net_annual"], xvals, color=_GRAY, alpha=0.07),
+    ]
 
-    xvals = [float(x) for x in gross_points]
-
+def _set_salary_xticks(axes, xvals):
     try:
         xticks = np.linspace(min(xvals), max(xvals), num=6)
     except Exception:
-        xticks = None
+        return
+    for ax in axes:
+        ax.set_xticks(xticks)
 
-    _lw = 2.2
+def _draw_salary_blocks(axes, series):
+    ax_marginal, ax_irpf_percent, ax_irpf_amount, ax_net_vs_gross = axes
+    xvals = series["gross"]
 
     # --- Marginal IRPF (%) ---
-    ax_marginal.step(xvals, marginal_percents, where="post", color=_RED, linewidth=_lw)
-    ax_marginal.fill_between(xvals, marginal_percents, step="post", color=_RED, alpha=0.10)
+    marginal, = ax_marginal.step(xvals, series["marginal_percent"], where="post", color=_RED, linewidth=_LW)
     ax_marginal.set_ylabel("Marginal IRPF (%)", fontsize=11)
     ax_marginal.set_title("Tipus Marginal IRPF (%)", fontsize=13, fontweight="bold", color="#1a1a1a", pad=10)
 
     # --- Total IRPF (%) ---
-    ax_irpf_percent.plot(xvals, irpf_percents, color=_ORANGE, linewidth=_lw)
-    ax_irpf_percent.fill_between(xvals, irpf_percents, color=_ORANGE, alpha=0.10)
+    effective, = ax_irpf_percent.plot(xvals, series["effective_percent"], color=_ORANGE, linewidth=_LW)
     ax_irpf_percent.set_ylabel("IRPF efectiu (%)", fontsize=11)
     ax_irpf_percent.set_title("IRPF Efectiu sobre el Brut (%)", fontsize=13, fontweight="bold", color="#1a1a1a", pad=10)
 
     # --- Total IRPF amount ---
-    ax_irpf_amount.plot(xvals, irpf_totals, color=_BLUE, linewidth=_lw)
-    ax_irpf_amount.fill_between(xvals, irpf_totals, color=_BLUE, alpha=0.08)
+    irpf, = ax_irpf_amount.plot(xvals, series["irpf_annual"], color=_BLUE, linewidth=_LW)
     ax_irpf_amount.set_ylabel("IRPF anual (€)", fontsize=11)
     ax_irpf_amount.set_title("IRPF Anual (€)", fontsize=13, fontweight="bold", color="#1a1a1a", pad=10)
 
     # --- Net vs Gross ---
-    ax_net_vs_gross.plot(xvals, net_annuals, color=_GREEN, linewidth=_lw, label="Sou net anual")
-    ax_net_vs_gross.plot(xvals, xvals, color=_GRAY, linestyle="--", linewidth=1.4, label="Sou brut anual")
-    ax_net_vs_gross.fill_between(xvals, net_annuals, xvals, color=_GRAY, alpha=0.07)
+    net, = ax_net_vs_gross.plot(xvals, series["net_annual"], color=_GREEN, linewidth=_LW, label="Sou net anual")
+    gross, = ax_net_vs_gross.plot(xvals, xvals, color=_GRAY, linestyle="--", linewidth=1.4, label="Sou brut anual")
     ax_net_vs_gross.set_ylabel("Euros (€)", fontsize=11)
     ax_net_vs_gross.set_title("Sou Net vs Sou Brut Anual", fontsize=13, fontweight="bold", color="#1a1a1a", pad=10)
     ax_net_vs_gross.legend(loc="upper left", fontsize=10, frameon=False)
 
-    euro_fmt = plt.FuncFormatter(lambda x, _: f"{int(x):,} €".replace(",", "."))
-    pct_fmt  = plt.FuncFormatter(lambda x, _: f"{x:.0f}%")
+    fills = _fill_salary_blocks(axes, series)
+
+    euro_fmt = FuncFormatter(lambda x, _: f"{int(x):,} €".replace(",", "."))
+    pct_fmt  = FuncFormatter(lambda x, _: f"{x:.0f}%")
 
     ax_marginal.yaxis.set_major_formatter(pct_fmt)
     ax_irpf_percent.yaxis.set_major_formatter(pct_fmt)
     ax_irpf_amount.yaxis.set_major_formatter(euro_fmt)
     ax_net_vs_gross.yaxis.set_major_formatter(euro_fmt)
 
-    if xticks is not None:
-        for ax in axes:
-            ax.set_xticks(xticks)
+    _set_salary_xticks(axes, xvals)
     for ax in axes:
         ax.set_xlabel("Sou brut anual (€)", fontsize=11)
-        ax.xaxis.set_major_formatter(plt.FuncFormatter(lambda x, _: f"{int(x):,}"))
+        ax.xaxis.set_major_formatter(FuncFormatter(lambda x, _: f"{int(x):,}"))
         ax.tick_params(axis="x", labelrotation=20, labelsize=9)
         ax.tick_params(axis="y", labelsize=9)
+    return [marginal, effective, irpf, net, gross], fills
+
+def _euro_label_width(series):
+    # tight_layout only needs redoing when the widest euro tick label changes length
+    return len(f"{int(max(max(series['gross']), max(series['net_annual']))):,}")
+
+class _SalaryBlocksTemplate:
+    def __init__(self, series):
+        _apply_style()
+        self.fig = Figure(figsize=(7, 18), facecolor="white")
+        self.axes = self.fig.subplots(4, 1, sharex=True)
+        self.lines, self.fills = _draw_salary_blocks(self.axes, series)
+        self.fig.tight_layout(pad=2.5)
+        self.label_width = _euro_label_width(series)
+
+    def update(self, series):
+        xvals = series["gross"]
+        for line, ys in zip(self.lines, ("marginal_percent", "effective_percent", "irpf_annual", "net_annual")):
+            line.set_data(xvals, series[ys])
+        self.lines[-1].set_data(xvals, xvals)
+        for fill in self.fills:
+            fill.remove()
+        self.fills = _fill_salary_blocks(self.axes, series)
+        for ax in self.axes:
+            # relim() skips collections; the fills reach down to y=0, so keep 0 in the data limits
+            ax.relim()
+            ax.update_datalim([(xvals[0], 0.0)])
+            ax.autoscale_view()
+        _set_salary_xticks(self.axes, xvals)
+        label_width = _euro_label_width(series)
+        if label_width != self.label_width:
+            self.fig.tight_layout(pad=2.5)
+            self.label_width = label_width
+        return self.fig
+
+def plot_salary_blocks(
+    gross: Decimal,
+    n_pagues: int,
+    pagues_prorratejades: bool,
+    retribucio_en_especie_ann: Decimal,
+    grup_cotitzacio: str,
+    contract_type: str,
+    fam,
+    region: str,
+    other_deductions: Decimal,
+    compute_net_pay,
+    return_fig: bool = False,
+    compute_net_pay_batch=None,
+    template: bool = False,
+):
+    series = salary_blocks_series(
+        gross, n_pagues, pagues_prorratejades, retribucio_en_especie_ann, grup_cotitzacio, contract_type,
+        fam, region, other_deductions, compute_net_pay, compute_net_pay_batch=compute_net_pay_batch,
+    )
+    if template and return_fig and len(series["gross"]) > 0:
+        tpl = _template(("salary_blocks",), lambda: _SalaryBlocksTemplate(series))
+        return tpl.update(series)
+
+    _apply_style()
+    fig, axes = plt.subplots(4, 1, figsize=(7, 18), sharex=True, facecolor="white")
+    _draw_salary_blocks(axes, series)
 
     plt.tight_layout(pad=2.5)
     if return_fig:
@@ -317,16 +317,16 @@ def plot_salary_percentages(
             fam,
             region
         )
-        net_annual = float(res["net_per_paga"] * Decimal(n_pagues))
+        net_annual = float(res.net_per_paga * Decimal(n_pagues))
         total = float(g)
         breakdown = {
             "gross": g,
             "net": net_annual / total * 100,
-            "irpf": float(res["irpf_anual"]) / total * 100,
-            "ss_comunes": float(res["ss_contingencies_comunes_monthly"] * Decimal(n_pagues)) / total * 100,
-            "ss_atur": float(res["t_des_monthly"] * Decimal(n_pagues)) / total * 100,
-            "ss_formacio": float(res["ss_training_monthly"] * Decimal(n_pagues)) / total * 100,
-            "ss_mei": float(res["ss_mei_monthly"] * Decimal(n_pagues)) / total * 100,
+            "irpf": float(res.cuota_irpf_anual) / total * 100,
+            "ss_comunes": float(res.ss_contingencies_comunes_mensual * Decimal(n_pagues)) / total * 100,
+            "ss_atur": float(res.ss_atur_mensual * Decimal(n_pagues)) / total * 100,
+            "ss_formacio": float(res.ss_formacio_mensual * Decimal(n_pagues)) / total * 100,
+            "ss_mei": float(res.ss_mei_mensual * Decimal(n_pagues)) / total * 100,
         }
         results.append(breakdown)
     fig, ax = plt.subplots(figsize=(8, 10))